@@ -0,0 +1,219 @@
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Reports are built from pandas data frames of 8 byte values, building one takes several copies of the data frame.
+# Measured on the unit test scenarios and generated datasets, the peak memory of a report is 4 to 7 times the size of
+# its CSV file or of its cells, the factor leaves a margin above that.
+bytes_per_cell = 8
+memory_factor = float(os.environ.get("REPORT_MEMORY_FACTOR") or 8)
+# Memory taken by any report, whatever the size of its data, like the configuration and the deck
+base_memory = 1024 * 1024
+scan_chunk_size = 1024 * 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Raised when a report needs more memory than is left in the memory budget of the process.
+
+    Attributes:
+        status (int): The HTTP status of the error, 413 when the report needs more than the whole budget and 503 when
+                      the budget stayed in use by other reports for too long.
+        retry_after (int): Seconds to wait before retrying, None when retrying can not succeed.
+    """
+
+    def __init__(self, message: str, status: int, retry_after: int = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def get_data_size(data) -> tuple:
+    """
+    Measures a CSV file without parsing it, by counting its bytes and lines and reading its header. The position of
+    the file is restored, so pandas reads it from where it was.
+
+    Args:
+        data: The CSV file, an uploaded file, or a binary or text stream.
+
+    Returns:
+        tuple: The size of the file in bytes or characters, its number of rows and its number of columns.
+    """
+    stream = getattr(data, 'stream', data)
+    position = stream.tell()
+    try:
+        header = stream.readline()
+        size = len(header)
+        rows = 0
+        last = header[-1:]
+        while True:
+            chunk = stream.read(scan_chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            rows += chunk.count(b'\n' if isinstance(chunk, bytes) else '\n')
+            last = chunk[-1:]
+        # The last row may not end with a new line
+        if last not in (b'\n', '\n', b'', ''):
+            rows += 1
+    finally:
+        stream.seek(position)
+
+    if isinstance(header, bytes):
+        header = header.decode('utf-8', errors='replace')
+    columns = len(next(csv.reader(io.StringIO(header.lstrip('\ufeff'))), []))
+    return size, rows, columns
+
+
+def estimate_report_memory(size: int, rows: int, columns: int) -> int:
+    """
+    Estimates the peak memory of building a report from the size of its data.
+
+    Args:
+        size (int): The size of the CSV file in bytes.
+        rows (int): The number of rows of the CSV file.
+        columns (int): The number of columns of the CSV file.
+
+    Returns:
+        int: The estimated peak memory in bytes.
+    """
+    return int(base_memory + memory_factor * max(size, rows * columns * bytes_per_cell))
+
+
+class MemoryBudget:
+    """
+    Admits reports while the sum of their estimated memory fits into a budget. Reports which do not fit wait until
+    enough reports finish, reports needing more than the whole budget are rejected right away.
+
+    Attributes:
+        budget_bytes (int): The memory budget of the reports of a process, 0 admits every report.
+        queue_timeout (float): Seconds a report waits for memory before it is rejected.
+        reserved_bytes (int): The estimated memory of the reports being built.
+        rejected (int): The number of reports rejected.
+    """
+
+    def __init__(self, budget_bytes: int, queue_timeout: float = 30):
+        self.budget_bytes = budget_bytes
+        self.queue_timeout = queue_timeout
+        self.reserved_bytes = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def admit(self, estimate: int):
+        """
+        Reserves the estimated memory of a report while it is built, waiting for other reports to finish if needed.
+
+        Args:
+            estimate (int): The estimated memory of the report in bytes.
+
+        Raises:
+            MemoryBudgetExceeded: If the report needs more than the budget, or the memory was not available in time.
+        """
+        if self.budget_bytes <= 0:
+            yield
+            return
+
+        if estimate > self.budget_bytes:
+            with self.condition:
+                self.rejected += 1
+            raise MemoryBudgetExceeded(
+                f"The data file needs an estimated {to_megabytes(estimate)} MB of memory to build the report, more than "
+                f"the {to_megabytes(self.budget_bytes)} MB a report may use. Reduce the rows or the columns of the "
+                f"data file, or split the report.", 413)
+
+        deadline = time.monotonic() + self.queue_timeout
+        with self.condition:
+            self.waiting += 1
+            try:
+                while self.reserved_bytes + estimate > self.budget_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise MemoryBudgetExceeded(
+                            f"The server is busy building other reports, {to_megabytes(estimate)} MB of memory was "
+                            f"not available within {self.queue_timeout:g} seconds. Please retry shortly.", 503,
+                            retry_after=max(1, round(self.queue_timeout)))
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.reserved_bytes += estimate
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.reserved_bytes -= estimate
+                self.condition.notify_all()
+
+
+class PeakMemory:
+    """
+    Measures the peak memory of building a report, by sampling the resident memory of the process in a background
+    thread while the report is built. The peak is the growth of the process above its memory at the start of the
+    build, it includes the memory of the reports built at the same time by other threads.
+
+    Attributes:
+        interval (float): Seconds between two samples.
+        start_bytes (int): The resident memory of the process at the start of the build, None where it can not be read.
+        peak_bytes (int): The peak resident memory of the process during the build.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_bytes = None
+        self.peak_bytes = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start_bytes = get_resident_memory()
+        if self.start_bytes is not None:
+            self.peak_bytes = self.start_bytes
+            self.thread = threading.Thread(target=self.sample, name='peak-memory', daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.update(get_resident_memory())
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.update(get_resident_memory())
+
+    def update(self, resident_bytes: int):
+        if resident_bytes is not None and resident_bytes > self.peak_bytes:
+            self.peak_bytes = resident_bytes
+
+    @property
+    def growth_bytes(self):
+        """
+        Returns:
+            int: The growth of the resident memory of the process during the build, None where it can not be read.
+        """
+        return None if self.start_bytes is None else self.peak_bytes - self.start_bytes
+
+
+def to_megabytes(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f}"
+
+
+def get_resident_memory():
+    """
+    Returns:
+        int: The resident memory of the process in bytes, None where it can not be read.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        logging.debug("The resident memory of the process can not be read", exc_info=True)
+        return None
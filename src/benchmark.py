@@ -0,0 +1,321 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller_utility as controller_util
+import src.profiling_utility as profiling_util
+import src.wbr as wbr
+from src.publish_utility import PublishWbr, ReportCache
+
+test_suite_folder = Path(os.path.dirname(__file__)) / 'unit_test_case'
+
+# Bumped when the stages or the layout of the baseline change, baselines of another version are not compared
+baseline_version = 1
+
+# The stages of building and publishing a report, in pipeline order
+pipeline_stages = ['csv_parse', 'dynamic_data_frame', 'trailing_windows', 'box_totals', 'function_metrics',
+                   'wbr_metrics', 'deck', 'serialize', 'publish']
+
+
+def get_data_file(scenario: Path):
+    """
+    Returns the data file of a scenario folder, `original.csv` or `original.parquet`, None if it has neither.
+    """
+    for data_file in (scenario / 'original.csv', scenario / 'original.parquet'):
+        if data_file.exists():
+            return data_file
+    return None
+
+
+def get_scenarios(name_filter: str = None, folder: Path = test_suite_folder) -> list:
+    """
+    Lists the scenario folders in a folder in numeric order, like the unit test suite or the scenarios written by
+    `src.dataset_generator`.
+
+    Args:
+        name_filter (str): Only scenarios whose folder name contains the filter are listed.
+        folder (Path): The folder of the scenario folders, or a scenario folder itself.
+
+    Returns:
+        list: The paths of the scenario folders.
+    """
+    folder = Path(folder)
+    candidates = [folder] if (folder / 'config.yaml').exists() else [path for path in folder.iterdir()
+                                                                     if path.is_dir()]
+    scenarios = [path for path in candidates if (path / 'config.yaml').exists() and get_data_file(path) is not None]
+    scenarios = [path for path in scenarios if name_filter is None or name_filter in path.name]
+    return sorted(scenarios, key=lambda path: (int(path.name.split('_')[-1]) if path.name[-1].isdigit() else 0,
+                                               path.name))
+
+
+def read_data_file(data_file: Path) -> pd.DataFrame:
+    if data_file.suffix == '.parquet':
+        return pd.read_parquet(data_file)
+    return pd.read_csv(data_file, thousands=',')
+
+
+def write_scaled_data(scenario: Path, scale: int, directory: str) -> tuple:
+    """
+    Writes the data of a scenario with every row repeated, so the pipeline aggregates `scale` times as many rows
+    into the same weeks and months.
+
+    Args:
+        scenario (Path): The scenario folder.
+        scale (int): The number of copies of each row.
+        directory (str): The directory the scaled data file is written to, in the format of the original one.
+
+    Returns:
+        tuple: The path of the data file and its number of rows.
+    """
+    data_file = get_data_file(scenario)
+    if scale == 1:
+        if data_file.suffix == '.parquet':
+            return data_file, len(read_data_file(data_file))
+        with open(data_file) as csv_file:
+            return data_file, sum(1 for _ in csv_file) - 1
+
+    scaled_df = pd.concat([read_data_file(data_file)] * scale, ignore_index=True)
+    scaled_file = Path(directory) / f'{scenario.name}_x{scale}{data_file.suffix}'
+    if data_file.suffix == '.parquet':
+        scaled_df.to_parquet(scaled_file, index=False)
+    else:
+        scaled_df.to_csv(scaled_file, index=False)
+    return scaled_file, len(scaled_df)
+
+
+def run_pipeline(scenario: Path, data_file: Path, publisher: PublishWbr):
+    """
+    Builds, serializes and publishes the report of a scenario once, in the stages recorded by the active recorder.
+
+    Args:
+        scenario (Path): The scenario folder with the configuration.
+        data_file (Path): The data of the report, a CSV or Parquet file.
+        publisher (PublishWbr): The publisher the serialized report is uploaded with.
+    """
+    # The configuration is reloaded every run because building a report modifies it
+    with open(scenario / 'config.yaml') as config_file:
+        cfg = yaml.load(config_file, controller_util.SafeLineLoader)
+
+    if data_file.suffix == '.parquet':
+        # The app reads CSV files only, Parquet data is parsed here in the stage the WBR parses CSV files in
+        with profiling_util.stage('csv_parse'):
+            daily_df = pd.read_parquet(data_file)
+            daily_df['Date'] = pd.to_datetime(daily_df['Date'])
+            daily_df = daily_df.sort_values(by='Date')
+        wbr1 = wbr.WBR(cfg, daily_df=daily_df)
+    else:
+        wbr1 = wbr.WBR(cfg, csv=data_file)
+    deck = controller_util.get_wbr_deck(wbr1)
+
+    with profiling_util.stage('serialize'):
+        data = controller_util.dumps_deck([controller_util.to_plain(deck)])
+    with profiling_util.stage('publish'):
+        publisher.upload(data, f'benchmark/{scenario.name}.json')
+
+
+def benchmark_scenario(scenario: Path, data_file: Path, publisher: PublishWbr, repeat: int) -> dict:
+    """
+    Times the stages of a scenario over a number of runs, and measures their memory in one more run. Tracing the
+    memory slows the stages down, so the times are only taken from the untraced runs.
+
+    Args:
+        scenario (Path): The scenario folder.
+        data_file (Path): The data of the report.
+        publisher (PublishWbr): The publisher the serialized report is uploaded with.
+        repeat (int): The number of timed runs, the median time of each stage is reported.
+
+    Returns:
+        dict: The stages by name with their median time in seconds, peak memory in bytes and net number of
+              allocated memory blocks, and the median total time.
+    """
+    runs = []
+    for _ in range(repeat):
+        with profiling_util.record_stages() as recorder:
+            run_pipeline(scenario, data_file, publisher)
+        runs.append(recorder)
+
+    with profiling_util.record_stages(trace_memory=True) as traced:
+        run_pipeline(scenario, data_file, publisher)
+
+    stages = {}
+    for name in pipeline_stages:
+        if name not in traced.stages:
+            continue
+        stages[name] = {
+            'seconds': statistics.median(run.stages[name]['seconds'] for run in runs),
+            'peakBytes': traced.stages[name]['peakBytes'],
+            'allocatedBlocks': traced.stages[name]['allocatedBlocks']
+        }
+    return {'stages': stages, 'totalSeconds': statistics.median(run.total_seconds() for run in runs)}
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(scales: list = None, repeat: int = 3, name_filter: str = None,
+                  folder: Path = test_suite_folder) -> dict:
+    """
+    Benchmarks the stages of building and publishing the report of every scenario, at every scale.
+
+    Reports are published to the `memory` storage without a download cache, so the publish stage measures the
+    compression and upload of the report without a network.
+
+    Args:
+        scales (list): The numbers of copies of the rows of each scenario, defaults to [1].
+        repeat (int): The number of timed runs of each scenario and scale.
+        name_filter (str): Only scenarios whose folder name contains the filter are benchmarked.
+        folder (Path): The folder of the scenarios, defaults to the unit test suite.
+
+    Returns:
+        dict: The baseline, with the environment it was taken in and a result per scenario and scale.
+    """
+    publisher = PublishWbr('memory', None)
+    publisher.cache = ReportCache(0)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='wbr-benchmark-') as directory:
+        for scenario in get_scenarios(name_filter, folder):
+            for scale in scales or [1]:
+                data_file, rows = write_scaled_data(scenario, scale, directory)
+                result = benchmark_scenario(scenario, data_file, publisher, repeat)
+                results.append({'scenario': scenario.name, 'scale': scale, 'rows': rows, **result})
+                publisher.backend.objects.clear()
+                logging.info(f"{scenario.name} x{scale}: {result['totalSeconds'] * 1000:.1f} ms")
+
+    return {
+        'version': baseline_version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commit': get_git_commit(),
+        'createdAt': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def compare_baselines(baseline: dict, current: dict, threshold: float = 1.25, minimum_seconds: float = 0.005,
+                      memory_threshold: float = None) -> list:
+    """
+    Compares the stage times of a benchmark with a baseline taken earlier, like on the main branch, and optionally
+    their peak memory.
+
+    Args:
+        baseline (dict): The earlier benchmark.
+        current (dict): The benchmark compared with the baseline.
+        threshold (float): The ratio of the current to the baseline time a stage is reported as slower from.
+        minimum_seconds (float): Stages faster than this in both benchmarks are not compared, their times are
+                                 mostly noise.
+        memory_threshold (float): The ratio of the current to the baseline peak memory a stage is reported from,
+                                  None does not compare the memory.
+
+    Returns:
+        list: The stages that got slower, with their scenario, scale, times and ratio, followed by the stages
+              using more memory, with their peak memory in place of their times.
+
+    Raises:
+        ValueError: If the baselines were taken with different versions of the benchmark.
+    """
+    if baseline.get('version') != current.get('version'):
+        raise ValueError(f"Baseline version {baseline.get('version')} can not be compared with version "
+                         f"{current.get('version')}")
+
+    baseline_results = {(result['scenario'], result['scale']): result for result in baseline['results']}
+    regressions = []
+    memory_regressions = []
+    for result in current['results']:
+        baseline_result = baseline_results.get((result['scenario'], result['scale']))
+        if baseline_result is None:
+            continue
+        for name, stage in result['stages'].items():
+            baseline_stage = baseline_result['stages'].get(name)
+            if baseline_stage is None:
+                continue
+            ratio = stage['seconds'] / max(baseline_stage['seconds'], 1e-9)
+            if max(stage['seconds'], baseline_stage['seconds']) >= minimum_seconds and ratio > threshold:
+                regressions.append({'scenario': result['scenario'], 'scale': result['scale'], 'stage': name,
+                                    'baselineSeconds': baseline_stage['seconds'], 'seconds': stage['seconds'],
+                                    'ratio': round(ratio, 2)})
+            if memory_threshold is None or 'peakBytes' not in baseline_stage:
+                continue
+            ratio = stage['peakBytes'] / max(baseline_stage['peakBytes'], 1)
+            if ratio > memory_threshold:
+                memory_regressions.append({'scenario': result['scenario'], 'scale': result['scale'], 'stage': name,
+                                           'baselinePeakBytes': baseline_stage['peakBytes'],
+                                           'peakBytes': stage['peakBytes'], 'ratio': round(ratio, 2)})
+    return regressions + memory_regressions
+
+
+def format_regression(regression: dict) -> str:
+    """
+    Returns:
+        str: The baseline and current time or peak memory of a regression found by `compare_baselines`.
+    """
+    if 'peakBytes' in regression:
+        return f"{regression['baselinePeakBytes'] / (1024 * 1024):.1f} MB -> " \
+               f"{regression['peakBytes'] / (1024 * 1024):.1f} MB ({regression['ratio']}x)"
+    return f"{regression['baselineSeconds'] * 1000:.1f} ms -> {regression['seconds'] * 1000:.1f} ms " \
+           f"({regression['ratio']}x)"
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks the stages of building the unit test scenarios.')
+    parser.add_argument('--scales', default='1', help='Comma separated copies of the rows of each scenario, '
+                                                      'like 1,10,100')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of each scenario and scale')
+    parser.add_argument('--scenario', help='Only benchmarks scenarios whose name contains this')
+    parser.add_argument('--folder', default=str(test_suite_folder),
+                        help='Folder of the scenarios, like one written by src.dataset_generator')
+    parser.add_argument('--output', help='Writes the baseline to this JSON file instead of the standard output')
+    parser.add_argument('--compare', help='Baseline JSON file to compare the stage times with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Ratio to the baseline time a stage fails the comparison from')
+    parser.add_argument('--memory-threshold', type=float,
+                        help='Ratio to the baseline peak memory a stage fails the comparison from, the memory is '
+                             'not compared without it')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    started = time.perf_counter()
+    result = run_benchmark([int(scale) for scale in args.scales.split(',')], args.repeat, args.scenario,
+                           Path(args.folder))
+    logging.info(f"Benchmark took {time.perf_counter() - started:.1f} s")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(result, output_file, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare_baselines(json.load(baseline_file), result, args.threshold,
+                                            memory_threshold=args.memory_threshold)
+        for regression in regressions:
+            logging.error(f"{regression['scenario']} x{regression['scale']} {regression['stage']}: "
+                          f"{format_regression(regression)}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
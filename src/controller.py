@@ -1,25 +1,38 @@
-﻿import io
+﻿import time
+
+# Start of the app, the start up time report measures the imports below from here
+startup_started = time.perf_counter()
+
+import datetime
+import functools
+import hashlib
+import hmac
+import importlib
+import io
 import json
 import logging
 import os
+import re
+import sys
 import tempfile
 import uuid
 from pathlib import Path
 
 import flask
 import pandas
-import requests
-from cryptography.fernet import Fernet
 from flask import Flask, request, send_file, render_template
 from flask_cors import CORS
 from werkzeug.utils import redirect
 
+import src.admission_utility as admission_util
 import src.controller_utility as controller_util
-import src.test as test
+import src.metrics_utility as metrics_util
+import src.profiling_utility as profiling_util
+import src.snapshot_utility as snapshot_util
 import src.validator as validator
-import src.system_design_agent as system_design_agent
 import src.wbr as wbr
-from src.publish_utility import PublishWbr
+from src.publish_utility import PublishWbr, decompress, starts_with, to_json_bytes, \
+    create_protected_report_metadata, check_password
 
 app = Flask(__name__,
             static_url_path='',
@@ -28,13 +41,280 @@ app = Flask(__name__,
 
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
-key = Fernet.generate_key()
+# The key signing the login tokens of protected reports. Set it when several processes serve the app, a token
+# signed by one process is only accepted by the others with the same key
+login_token_key = (os.environ.get("LOGIN_TOKEN_SECRET") or '').encode('utf-8') or os.urandom(32)
+# Login tokens of protected reports expire after this many seconds, the viewer logs in again
+login_token_seconds = int(os.environ.get("LOGIN_TOKEN_TTL_SECONDS") or 8 * 3600)
 
 which_env = os.environ.get("ENVIRONMENT") or 'qa'
+# Store a pre-rendered HTML snapshot next to each published report, served to viewers as it is
+publish_html_snapshot = (os.environ.get("PUBLISH_HTML_SNAPSHOT") or 'false').lower() == 'true'
+# Published reports never change, their snapshots can be cached by browsers and CDNs for a year. Report pages are
+# rendered by the templates of the app as well, they are revalidated daily so a new release reaches their viewers
+published_cache_control = 'public, max-age=31536000, immutable'
+rendered_cache_control = 'public, max-age=86400'
+# Protected reports and sample reports are revalidated on every view, and protected reports never stored by a CDN
+protected_cache_control = 'private, no-cache'
+sample_cache_control = 'public, no-cache'
+# Time the stages of every request and return them in a Server-Timing header, ?profile=1 times a request regardless
+server_timing = (os.environ.get("SERVER_TIMING") or 'true').lower() == 'true'
+# Count the requests, their latency and their stages in the metrics served by /metrics
+request_metrics = (os.environ.get("METRICS_ENABLED") or 'true').lower() == 'true'
+# Token of the admins, sent in the X-Admin-Token header to profile requests. Admin features are disabled without it
+admin_token = os.environ.get("ADMIN_TOKEN")
+profiler_sampling_interval = float(os.environ.get("PROFILER_SAMPLING_INTERVAL_MS") or 5) / 1000
+# Reports whose estimated memory does not fit into the budget wait for other reports to finish, then are rejected
+memory_budget = admission_util.MemoryBudget(int(float(os.environ.get("REPORT_MEMORY_BUDGET_MB") or 0) * 1024 * 1024),
+                                            float(os.environ.get("REPORT_MEMORY_QUEUE_TIMEOUT") or 30))
+# The resident memory of the process is sampled at this interval while a report is built, to measure its peak memory
+memory_sampling_interval = float(os.environ.get("REPORT_MEMORY_SAMPLING_INTERVAL_MS") or 10) / 1000
+# The slowest report builds, with the shape of their configuration and data, served by /admin/slow-reports
+slow_report_log = profiling_util.SlowReportLog(int(os.environ.get("SLOW_REPORT_LOG_SIZE") or 50))
+imports_finished = time.perf_counter()
 publisher = PublishWbr(os.getenv("OBJECT_STORAGE_OPTION"), os.environ.get("OBJECT_STORAGE_BUCKET"))
+deck_cache = controller_util.DeckCache()
+# Checksums and content encodings of stored reports and snapshots by path, to tag their responses with an ETag
+stored_versions = controller_util.DeckCache(4096)
+# Names of the published reports, the last 11 hex digits of a UUID generated by publish_and_get
+report_name_pattern = re.compile(r'[0-9a-f]{11}')
+sample_folder = Path(os.path.dirname(__file__)).parent / 'sample'
+demo_uploads_folder = Path(os.path.dirname(__file__)) / 'web/static/demo_uploads'
+# Rendered sample reports and the listing of the demo files, reloaded when their directory changes
+sample_cache = controller_util.DirectoryCache(sample_folder)
+demo_uploads_cache = controller_util.DirectoryCache(demo_uploads_folder)
+
+
+def lazy_import(module_name: str):
+    """
+    Imports a module on first use. Modules only some requests need, like the unit test suite, the system design
+    agent and the HTTP client, are imported by the first request needing them instead of at start up.
+
+    Args:
+        module_name (str): The name of the module.
+
+    Returns:
+        module: The imported module.
+    """
+    return sys.modules.get(module_name) or importlib.import_module(module_name)
+
+
+def get_startup_report():
+    """
+    Reports the time the app took to start, split into importing its modules and creating the publisher, along with
+    the storage backend and the number of loaded modules. Lazily imported modules are listed when they are loaded.
+
+    Returns:
+        dict: The start up report.
+    """
+    return {
+        'importsMs': round((imports_finished - startup_started) * 1000, 1),
+        'publisherMs': round((publisher_created - imports_finished) * 1000, 1),
+        'totalMs': round((publisher_created - startup_started) * 1000, 1),
+        'storageBackend': type(publisher.backend).__name__,
+        'loadedModules': len(sys.modules),
+        'lazyModules': {name: name in sys.modules for name in
+                        ['src.test', 'src.system_design_agent', 'requests', 'boto3',
+                         'google.cloud.storage', 'azure.storage.blob']}
+    }
+
+
+publisher_created = time.perf_counter()
+logging.info(f"WBR app started in {get_startup_report()['totalMs']} ms")
+
+
+def is_profile_requested():
+    return request.args.get('profile', '').lower() in ('1', 'true')
+
+
+def get_route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@app.before_request
+def start_request_timing():
+    """
+    Starts recording the stages of the request, like validating the input, building the deck and publishing it, and
+    counts the request in flight.
+    """
+    flask.g.request_started = time.perf_counter()
+    if request_metrics:
+        metrics_util.http_requests_in_flight.inc(route=get_route())
+    if server_timing or request_metrics or slow_report_log.size or is_profile_requested():
+        flask.g.stage_recorder = profiling_util.StageRecorder()
+        flask.g.stage_recorder_token = profiling_util.current_recorder.set(flask.g.stage_recorder)
+
+
+@app.after_request
+def add_request_timing(response):
+    """
+    Adds the times of the recorded stages to the response in a Server-Timing header. With ?profile=1 they are added
+    to the `profile` section of JSON object responses as well. The request and its stages are counted in the metrics
+    of the app, and reports built by the request are offered to the slow report log.
+    :param response: The response of the request
+    :return: The response with its timing
+    """
+    recorder = flask.g.pop('stage_recorder', None)
+    total_seconds = time.perf_counter() - flask.g.request_started
+    if request_metrics:
+        observe_request(response, recorder, total_seconds)
+    report_shape = flask.g.pop('report_shape', None)
+    if report_shape is not None:
+        log_slow_report(response, recorder, total_seconds, report_shape)
+    if recorder is None or not (server_timing or is_profile_requested()):
+        return response
+    response.headers['Server-Timing'] = profiling_util.get_server_timing(recorder, total_seconds)
+
+    if is_profile_requested() and response.mimetype == 'application/json' and not response.is_streamed:
+        try:
+            body = json.loads(response.get_data())
+        except ValueError:
+            return response
+        if isinstance(body, dict):
+            body['profile'] = profiling_util.get_profile(recorder, total_seconds)
+            response.set_data(json.dumps(body, cls=controller_util.Encoder))
+    return response
+
+
+@app.teardown_request
+def stop_request_timing(error=None):
+    if request_metrics and 'request_started' in flask.g:
+        metrics_util.http_requests_in_flight.dec(route=get_route())
+    token = flask.g.pop('stage_recorder_token', None)
+    if token is not None:
+        profiling_util.current_recorder.reset(token)
+
+
+def observe_request(response, recorder, total_seconds: float):
+    """
+    Counts a request in the metrics of its route, along with the time of each of its stages.
+    :param response: The response of the request
+    :param recorder: The recorder of the stages of the request, None if they were not recorded
+    :param total_seconds: The time taken to respond
+    """
+    route = get_route()
+    metrics_util.http_requests.inc(route=route, method=request.method, status=response.status_code)
+    metrics_util.http_request_duration.observe(total_seconds, route=route, method=request.method)
+    if recorder is not None:
+        for name, stage in recorder.stages.items():
+            metrics_util.stage_duration.observe(stage['seconds'], stage=name)
+
+
+def log_slow_report(response, recorder, total_seconds: float, report_shape: dict):
+    """
+    Offers a report build to the log of the slowest ones, with the stage which took most of its time.
+    :param response: The response of the request
+    :param recorder: The recorder of the stages of the request, None if they were not recorded
+    :param total_seconds: The time taken to respond
+    :param report_shape: The fingerprint of the configuration and the shape of the data of the report
+    """
+    stages = {} if recorder is None else {name: round(stage['seconds'] * 1000, 2)
+                                          for name, stage in recorder.stages.items()}
+    dominant_stage = None if recorder is None else profiling_util.get_dominant_stage(recorder)
+    slow_report_log.add({
+        'recordedAt': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'route': get_route(),
+        'status': response.status_code,
+        'totalMs': round(total_seconds * 1000, 2),
+        'stages': stages,
+        'dominantStage': dominant_stage,
+        'dominantShare': round(stages[dominant_stage] / (total_seconds * 1000), 3) if dominant_stage else None,
+        **report_shape
+    })
+
+
+def collect_app_metrics():
+    """
+    Sets the metrics of the caches and the background uploads from their counters, when the metrics are scraped.
+    """
+    report_cache = publisher.cache.stats()
+    metrics_util.set_cache_metrics('report', report_cache['hits'] + report_cache['diskHits'], report_cache['misses'],
+                                   report_cache['reports'])
+    metrics_util.report_cache_bytes.set(report_cache['bytes'])
+    metrics_util.report_cache_evictions.set(report_cache['evictions'])
+    for name, cache in (('deck', deck_cache), ('stored_versions', stored_versions)):
+        metrics_util.set_cache_metrics(name, cache.hits, cache.misses, len(cache.decks))
+    metrics_util.background_uploads.set(publisher.background_uploads)
+    metrics_util.failed_uploads.set(publisher.failed_uploads)
+    metrics_util.memory_reserved.set(memory_budget.reserved_bytes)
+    metrics_util.memory_budget_bytes.set(memory_budget.budget_bytes)
+    metrics_util.memory_waiting.set(memory_budget.waiting)
+    metrics_util.memory_rejected.set(memory_budget.rejected)
+    resident_memory = admission_util.get_resident_memory()
+    if resident_memory is not None:
+        metrics_util.resident_memory.set(resident_memory)
+
+
+metrics_util.registry.add_collector(collect_app_metrics)
+
+
+def is_admin():
+    """
+    Checks the X-Admin-Token header of the request against the ADMIN_TOKEN setting.
+    :return: True if the request is sent by an admin, always False when no admin token is set
+    """
+    if not admin_token:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), admin_token.encode('utf-8'))
+
+
+def admin_required():
+    return app.response_class(
+        response=json.dumps({"error": "An admin token is required"}),
+        status=403,
+        mimetype='application/json'
+    )
+
+
+def profiled(view):
+    """
+    Runs a report request under a profiler when an admin asks for it with ?profiler=deterministic or
+    ?profiler=sampling. The profile, with the stacks of the request in the collapsed format of flame graph viewers, is
+    stored next to the published reports and served by /admin/profiles/<id>. The times of the functions of the WBR
+    modules are added to the `profiler` section of JSON object responses.
+    :param view: The view function building a report
+    :return: The view function, profiled on demand
+    """
+    @functools.wraps(view)
+    def profiled_view(*args, **kwargs):
+        mode = request.args.get('profiler')
+        if not mode:
+            return view(*args, **kwargs)
+        if not is_admin():
+            return admin_required()
+        try:
+            profiler = profiling_util.StackProfiler(mode, profiler_sampling_interval)
+        except ValueError as e:
+            return app.response_class(response=json.dumps({"error": e.__str__()}), status=400,
+                                      mimetype='application/json')
+
+        response = profiler.run(lambda: app.make_response(view(*args, **kwargs)))
+        profile = profiler.get_profile()
+        profile_id = str(uuid.uuid4()).replace('-', '')[:16]
+        profile.update({'id': profile_id, 'path': request.full_path, 'status': response.status_code})
+        try:
+            publisher.upload(profile, which_env + "/profiles/" + profile_id)
+        except Exception as e:
+            logging.warning(f"Failed to store the profile {profile_id}: {e}", exc_info=True)
+        profile_url = flask.url_for('get_profile', profile_id=profile_id)
+        response.headers['X-Profile-Url'] = profile_url
+
+        if response.mimetype == 'application/json' and not response.is_streamed:
+            try:
+                body = json.loads(response.get_data())
+            except ValueError:
+                return response
+            if isinstance(body, dict):
+                body['profiler'] = {'url': profile_url, 'mode': mode, 'seconds': profile['seconds'],
+                                    'functions': profile['functions']}
+                response.set_data(json.dumps(body, cls=controller_util.Encoder))
+        return response
+
+    return profiled_view
 
 
 @app.route('/get-wbr-metrics', methods=['POST'])
+@profiled
 def get_wbr_metrics():
     """
     A flask endpoint, build WBR for given data csv and config yaml file.
@@ -54,6 +334,8 @@ def get_wbr_metrics():
 
     try:
         deck = process_input(csv_data_file, cfg)
+    except admission_util.MemoryBudgetExceeded as e:
+        return memory_budget_exceeded(e, "description")
     except Exception as e:
         logging.error(e, exc_info=True)
         return app.response_class(
@@ -62,21 +344,94 @@ def get_wbr_metrics():
         )
 
     # Return the WBR deck as a JSON response
+    with profiling_util.stage('serialize'):
+        deck_json = controller_util.dumps_deck(deck)
     return app.response_class(
-        response=json.dumps(deck, indent=4, cls=controller_util.Encoder),
+        response=deck_json,
+        status=200,
+        mimetype='application/json'
+    )
+
+
+def deck_page_response(decks: list):
+    """
+    Builds the response of a page request, the deck and the page are read from the `deck` and `page` query parameters.
+    :param decks: The list of decks to page through
+    :return: A json response with the blocks of the requested page
+    """
+    try:
+        page = controller_util.get_deck_page(decks, int(request.args.get('deck', 0)), int(request.args.get('page', 0)))
+    except (IndexError, ValueError) as e:
+        return app.response_class(
+            response=json.dumps({"description": e.__str__()}),
+            status=404,
+            mimetype='application/json'
+        )
+    return app.response_class(
+        response=controller_util.dumps_deck(page),
         status=200,
         mimetype='application/json'
     )
 
 
 def process_input(data, cfg, events_data=None):
+    """
+    Builds the deck of a report, once the estimated memory of the report fits into the memory budget. The peak memory
+    of the build is measured along with it, and kept with the shape of the report in the slow report log.
+    :param data: The CSV data file
+    :param cfg: The configuration of the report
+    :param events_data: The events CSV file
+    :return: The deck
+    :raises admission_util.MemoryBudgetExceeded: If the memory of the report is not available
+    """
+    # The data file is measured without parsing it, parsing a file too large for the process would exhaust its memory
+    estimate = admission_util.estimate_report_memory(*admission_util.get_data_size(data))
+    metrics_util.report_memory_estimate.observe(estimate)
+    with memory_budget.admit(estimate):
+        with admission_util.PeakMemory(memory_sampling_interval) as peak_memory:
+            deck = build_deck(data, cfg, events_data)
+    if peak_memory.growth_bytes is not None:
+        metrics_util.report_memory_peak.observe(peak_memory.growth_bytes)
+        if flask.has_request_context() and 'report_shape' in flask.g:
+            flask.g.report_shape['memory'] = {'estimatedBytes': estimate, 'peakBytes': peak_memory.growth_bytes}
+    return deck
+
+
+def memory_budget_exceeded(error: admission_util.MemoryBudgetExceeded, message_key: str):
+    """
+    Responds to a report rejected for lack of memory, with a Retry-After header when the report may be retried.
+    :param error: The rejection
+    :param message_key: The key of the error message in the JSON errors of the endpoint
+    :return: A 413 or 503 response
+    """
+    logging.warning(f"Report rejected: {error}")
+    return app.response_class(
+        response=json.dumps({message_key: error.__str__()}),
+        status=error.status,
+        mimetype='application/json',
+        headers={'Retry-After': str(error.retry_after)} if error.retry_after else None
+    )
+
+
+def build_deck(data, cfg, events_data=None):
     try:
-        wbr_validator = validator.WBRValidator(data, cfg)
-        wbr_validator.validate_yaml()
+        with profiling_util.stage('validate'):
+            wbr_validator = validator.WBRValidator(data, cfg)
+            wbr_validator.validate_yaml()
+        metrics_util.dataset_rows.observe(len(wbr_validator.daily_df))
+        metrics_util.dataset_columns_processed.inc(len(wbr_validator.daily_df.columns))
+        metrics_util.dataset_memory.observe(wbr_validator.daily_df.memory_usage().sum())
     except Exception as e:
         logging.error("Yaml validation failed", e, exc_info=True)
         raise Exception(f"Invalid configuration provided: {e.__str__()}")
 
+    if slow_report_log.size and flask.has_request_context():
+        # Taken before the WBR modifies the configuration, the slow report log keeps it if the report is slow
+        flask.g.report_shape = {
+            'dataset': {'rows': len(wbr_validator.daily_df), 'columns': len(wbr_validator.daily_df.columns)},
+            'config': controller_util.get_config_fingerprint(cfg)
+        }
+
     try:
         # Create a WBR object using the CSV data and configuration
         wbr1 = wbr.WBR(cfg, daily_df=wbr_validator.daily_df)
@@ -125,11 +480,17 @@ def publish_report(url=None, deck=None):
     """
     Fetch JSON file from the HTTP request, save the file to S3 bucket and publish the WBR to a public URL.
 
+    Args:
+        url: Base url of the published report, defaults to the url of the request.
+        deck: The serialized decks, defaults to the JSON body of the request.
+
     Returns:
         A Flask response object with the URL to access the uploaded data.
     """
-    # Parse the JSON data from the request
-    data = json.loads(deck or request.data)
+    # Decks serialized by /report are uploaded as they are, a request body is checked to be JSON first
+    if deck is None:
+        json.loads(request.data)
+    data = deck or request.data.decode('utf-8')
 
     # Modify the base URL to use HTTPS instead of HTTP
     base_url = url or request.base_url.replace('/publish-wbr-report', '')
@@ -148,30 +509,42 @@ def publish_protected_wbr(url=None, deck=None):
     # Get the password from the request arguments
     password = request.args['password']
 
-    # Load the JSON data from the request body
-    data = json.loads(deck or request.data)
-
-    # Add the password to the JSON data
-    protected_data = {"data": data, "password": password}
+    # Load the JSON data from the request body, decks serialized by /report are used as they are
+    if deck is None:
+        json.loads(request.data)
+    data = deck or request.data.decode('utf-8')
 
     # Get the base URL and replace 'http' with 'https'
     base_url = url or request.base_url.replace('/publish-protected-report', '')
     if "localhost" not in base_url and "127.0.0.1" not in base_url:
         base_url = base_url.replace("http", "https")
-    return publish_and_get(base_url, '/build-wbr/publish/protected?file=', protected_data)
+    return publish_and_get(base_url, '/build-wbr/publish/protected?file=', data, password)
 
 
-def publish_and_get(base_url: str, trailing_url: str, data: list | dict):
-    # Generate a unique filename for the JSON data
+def publish_and_get(base_url: str, trailing_url: str, data: list | dict | str, password: str = None):
+    # Generate a unique filename for the JSON data, report_name_pattern must match it
     filename = str(uuid.uuid4())[25:]
     # Upload the report to cloud storage
     try:
-        publisher.upload(data, which_env + "/" + filename)
+        if password is None:
+            with profiling_util.stage('publish'):
+                publisher.upload(data, which_env + "/" + filename)
+            if publish_html_snapshot:
+                with profiling_util.stage('snapshot'):
+                    publish_snapshot(data, filename)
+        else:
+            # Protected reports are stored apart from the others, with their password in a small metadata record
+            with profiling_util.stage('publish'):
+                byte_data = to_json_bytes(data)
+                publisher.upload(byte_data, which_env + "/protected/" + filename)
+                publisher.upload(create_protected_report_metadata(byte_data, password),
+                                 which_env + "/protected/" + filename + ".meta.json")
         # Create a response with the URL to access the uploaded data
         return app.response_class(
             response=json.dumps({'path': f"{base_url}{trailing_url}{filename}"}, indent=4,
                                 cls=controller_util.Encoder),
-            status=200
+            status=200,
+            mimetype='application/json'
         )
     except Exception as e:
         logging.error("Error occurred while publishing the report", e, exc_info=True)
@@ -180,23 +553,381 @@ def publish_and_get(base_url: str, trailing_url: str, data: list | dict):
         )
 
 
+def publish_snapshot(data: list | dict | str, filename: str):
+    """
+    Renders the static HTML snapshot of a published report and stores it next to the report. Publishing does not fail
+    when the snapshot can not be rendered, the report page is rendered for its viewers instead.
+    :param data: The list of decks of the report, serialized or not
+    :param filename: Name of the published report
+    """
+    try:
+        decks = json.loads(data) if isinstance(data, (str, bytes)) else data
+        if not isinstance(decks, list):
+            return
+        html = render_snapshot(decks, flask.url_for('get_published_report_json', file=filename),
+                               flask.url_for('build_wbr', file=filename, snapshot='false'))
+        publisher.upload(html, which_env + "/" + filename + ".html", 'text/html; charset=utf-8')
+    except Exception as e:
+        logging.warning(f"Failed to store the HTML snapshot of {filename}: {e}", exc_info=True)
+
+
+def render_snapshot(decks: list, json_url: str = None, report_url: str = None):
+    """
+    Renders the static HTML snapshot of a report, charts are drawn as inline SVG and tables as HTML so the page needs
+    no scripts.
+    :param decks: The list of decks of the report
+    :param json_url: Link to the JSON of the report
+    :param report_url: Link to the interactive report
+    :return: The HTML of the snapshot
+    """
+    return flask.render_template('wbr_snapshot.html', decks=snapshot_util.get_snapshot_decks(decks),
+                                 json_url=json_url, report_url=report_url)
+
+
+def published_snapshot_response(filename: str):
+    """
+    Serves the HTML snapshot of a published report as it is stored, compressed for clients accepting its encoding.
+    :param filename: Name of the published report
+    :return: The response, None if the report has no snapshot
+    """
+    path = which_env + "/" + filename + ".html"
+    try:
+        checksum, content_encoding = get_stored_version(path)
+    except Exception as e:
+        logging.info(f"{filename} has no HTML snapshot, rendering the report: {e}")
+        return None
+
+    # The compressed and decompressed snapshots are different representations, with different ETags
+    encoded = content_encoding is not None and request.accept_encodings[content_encoding] > 0
+
+    def send_snapshot():
+        body, _ = publisher.download_encoded(path)
+        if encoded:
+            return app.response_class(response=body, status=200, mimetype='text/html',
+                                      headers={'Content-Encoding': content_encoding})
+        return app.response_class(response=decompress(body, content_encoding), status=200, mimetype='text/html')
+
+    return cached_response(f"{checksum}-{content_encoding}" if encoded else checksum, published_cache_control,
+                           send_snapshot, vary='Accept-Encoding')
+
+
+def get_stored_version(path: str):
+    """
+    Returns the checksum and content encoding of a stored report or snapshot. Stored reports never change, the
+    checksum is computed from the stored bytes the first time the report is viewed.
+    :param path: The path of the report in the object storage
+    :return: The SHA-256 checksum of the stored bytes, shortened, and their content encoding
+    """
+    version = stored_versions.get(path)
+    if version is None:
+        body, content_encoding = publisher.download_encoded(path)
+        version = (hashlib.sha256(body).hexdigest()[:32], content_encoding)
+        stored_versions.put(path, version)
+    return version
+
+
+@functools.lru_cache(maxsize=None)
+def get_template_version(template_name: str):
+    """
+    Returns a short checksum of a template, rendered pages are tagged with it so a release changing the template
+    changes their ETag.
+    :param template_name: Name of the template
+    :return: The checksum of the template source
+    """
+    source = app.jinja_env.loader.get_source(app.jinja_env, template_name)[0]
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:8]
+
+
+def cached_response(etag: str, cache_control: str, send, vary: str = None):
+    """
+    Answers a conditional request with 304 Not Modified when the client holds the current version of a response, or
+    sends the response tagged with its strong ETag. Only successful responses are tagged and made cacheable.
+    :param etag: The ETag of the response
+    :param cache_control: The Cache-Control header of the response
+    :param send: Function creating the response, only called when the response has to be sent
+    :param vary: The request header the response varies by
+    :return: The response
+    """
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(send())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if vary:
+        response.vary.add(vary)
+    return response
+
+
+def get_report_name():
+    """
+    Returns the name of the published report in the `file` query parameter. Only names generated when publishing are
+    accepted, a path like protected/<name> or <name>.meta.json would reach the stored protected reports and their
+    password records without the password.
+    :return: The name of the report, None if it is not the name of a published report
+    """
+    filename = request.args.get('file', '')
+    return filename if report_name_pattern.fullmatch(filename) else None
+
+
+def report_not_found():
+    return app.response_class(
+        response=json.dumps({"message": "Report not found"}),
+        status=404,
+        mimetype='application/json'
+    )
+
+
+def unauthorised():
+    return app.response_class(
+        response=json.dumps({"message": "Unauthorised"}),
+        status=403,
+        mimetype='application/json'
+    )
+
+
+def download_protected_report(filename: str):
+    """
+    Downloads the decks of a protected report. Reports protected before their metadata was kept apart hold their
+    password next to the decks, in the same place as the other reports.
+    :param filename: Name of the published report
+    :return: The list of decks of the report
+    """
+    try:
+        return download_published_report("protected/" + filename)
+    except Exception as e:
+        logging.info(f"{filename} is not stored as a protected report, reading it the legacy way: {e}")
+        return download_published_report(filename)['data']
+
+
+def is_authorised(filename: str, password: str):
+    """
+    Checks the password of a protected report, only the metadata record of the report is downloaded.
+    :param filename: Name of the published report
+    :param password: The password to check
+    :return: True if the password is the password of the report
+    """
+    try:
+        metadata = publisher.download(which_env + "/protected/" + filename + ".meta.json")
+    except Exception as e:
+        logging.info(f"{filename} has no metadata record, reading it the legacy way: {e}")
+        return password == publisher.download(which_env + "/" + filename)['password']
+    return check_password(metadata, password)
+
+
+def create_login_token(filename: str, expires: int = None) -> str:
+    """
+    Issues the login token of a protected report, its expiry and an HMAC of the report name and the expiry signed
+    with login_token_key. The token proves the viewer entered the password without holding the password.
+    :param filename: Name of the protected report
+    :param expires: The UNIX time the token expires at, defaults to login_token_seconds from now
+    :return: The token, passed in the password query parameter of the protected report
+    """
+    expires = expires or int(time.time()) + login_token_seconds
+    signature = hmac.new(login_token_key, f"{filename}:{expires}".encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def is_login_token_valid(filename: str) -> bool:
+    """
+    Checks the login token in the password query parameter of a request for a protected report. Every route serving
+    a protected report checks it here.
+    :param filename: Name of the protected report
+    :return: True if the token was issued by /login for this report and has not expired
+    """
+    expires, _, signature = request.args.get('password', '').partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(create_login_token(filename, int(expires)), f"{expires}.{signature}")
+
+
+def download_published_report(filename: str):
+    """
+    Downloads a published report, the report is kept in the deck cache so that its index and pages are served
+    without downloading it again.
+    :param filename: Name of the published report
+    :return: The published report, a list of decks or a dict holding the decks and the password of a protected report
+    """
+    report = deck_cache.get(filename)
+    if report is None:
+        logging.info(f"Received request to download {filename}")
+        report = publisher.download(which_env + "/" + filename)
+        deck_cache.put(filename, report)
+    return report
+
+
+def render_lazy_report(decks, blocks_url: str):
+    """
+    Renders the report page with the index of the decks only, the page fetches the blocks from the blocks url as they
+    scroll into view.
+    :param decks: The list of decks of the report
+    :param blocks_url: Url serving the pages of the report
+    :return: Rendered WBR html file
+    """
+    if not isinstance(decks, list):
+        # Let the page report the malformed report
+        return flask.render_template('wbr_share.html', data=decks)
+    return flask.render_template('wbr_share.html', index=controller_util.get_deck_index(decks), blocks_url=blocks_url)
+
+
+def render_report(decks, decks_json: str = None):
+    """
+    Renders the report page with the complete decks embedded, the blocks are still drawn as they scroll into view.
+    :param decks: The list of decks of the report
+    :param decks_json: The decks already serialized by controller_util.dumps_deck, embedded as they are
+    :return: Rendered WBR html file
+    """
+    if not isinstance(decks, list):
+        return flask.render_template('wbr_share.html', data=decks)
+    return flask.render_template('wbr_share.html', index=controller_util.get_deck_index(decks), data=decks,
+                                 data_json=decks_json)
+
+
 @app.route('/build-wbr/publish', methods=['GET'])
 def build_wbr():
     """
     Builds unprotected WBR onto the web browser using the already saved WBR report
     :return: Rendered template of already generated report
     """
-    filename = request.args['file']
-    logging.info(f"Received request to download {filename}")
+    filename = get_report_name()
+    if filename is None:
+        return report_not_found()
+    # Viewers can still open the interactive report with snapshot=false
+    if request.args.get('snapshot', 'true' if publish_html_snapshot else 'false') == 'true':
+        snapshot = published_snapshot_response(filename)
+        if snapshot is not None:
+            return snapshot
+    try:
+        checksum, _ = get_stored_version(which_env + "/" + filename)
+        return cached_response(
+            f"{checksum}-{get_template_version('wbr_share.html')}-{controller_util.deck_page_size}",
+            rendered_cache_control,
+            lambda: render_lazy_report(download_published_report(filename),
+                                       flask.url_for('get_published_deck_page', file=filename)))
+    except Exception as e:
+        logging.error(e, exc_info=True)
+        return app.response_class(
+            response=json.dumps({"message": "Failed to download your report!"}),
+            status=500
+        )
+
+
+@app.route('/build-wbr/publish/index', methods=['GET'])
+def get_published_deck_index():
+    """
+    Returns the index of a published report, protected reports require the password token like
+    /build-wbr/publish/protected does.
+    :return: A json response with the summary of every deck and block
+    """
+    decks = get_published_decks()
+    if not isinstance(decks, list):
+        return decks
+    return app.response_class(
+        response=json.dumps(controller_util.get_deck_index(decks)),
+        status=200,
+        mimetype='application/json'
+    )
+
+
+@app.route('/build-wbr/publish/blocks', methods=['GET'])
+def get_published_deck_page():
+    """
+    Returns a page of blocks of a published report, protected reports require the password token like
+    /build-wbr/publish/protected does.
+    :return: A json response with the blocks of the requested page
+    """
+    decks = get_published_decks()
+    if not isinstance(decks, list):
+        return decks
+    return deck_page_response(decks)
+
+
+@app.route('/build-wbr/publish/json', methods=['GET'])
+def get_published_report_json():
+    """
+    Returns the JSON of a published report. Reports are stored compressed, the stored bytes are returned as they are
+    to clients accepting their content encoding and decompressed for the others. Protected reports require the
+    password token like /build-wbr/publish/protected does.
+    :return: A json response with the list of decks of the report
+    """
+    filename = get_report_name()
+    if filename is None:
+        return report_not_found()
+    authorised = is_login_token_valid(filename)
+    if 'password' in request.args and not authorised:
+        return unauthorised()
+    try:
+        if authorised:
+            try:
+                body, content_encoding = publisher.download_encoded(which_env + "/protected/" + filename)
+            except Exception as e:
+                logging.info(f"{filename} is not stored as a protected report, reading it the legacy way: {e}")
+                body, content_encoding = publisher.download_encoded(which_env + "/" + filename)
+        else:
+            body, content_encoding = publisher.download_encoded(which_env + "/" + filename)
+    except Exception as e:
+        logging.error(e, exc_info=True)
+        return app.response_class(
+            response=json.dumps({"message": "Failed to download your report!"}),
+            status=500
+        )
+
+    # Reports are a list of decks, legacy protected reports an object holding the decks and the password
+    if starts_with(body, content_encoding, b'['):
+        if content_encoding and request.accept_encodings[content_encoding] > 0:
+            return app.response_class(
+                response=body,
+                status=200,
+                mimetype='application/json',
+                headers={'Content-Encoding': content_encoding, 'Vary': 'Accept-Encoding'}
+            )
+        return app.response_class(
+            response=decompress(body, content_encoding),
+            status=200,
+            mimetype='application/json'
+        )
+
+    if not authorised:
+        return unauthorised()
+    protected_data = json.loads(decompress(body, content_encoding))
+    return app.response_class(
+        response=controller_util.dumps_deck(protected_data['data']),
+        status=200,
+        mimetype='application/json'
+    )
+
+
+def get_published_decks():
+    """
+    Downloads the published report named in the `file` query parameter.
+    :return: The list of decks of the report, or an error response if it can not be served
+    """
+    filename = get_report_name()
+    if filename is None:
+        return report_not_found()
+    authorised = is_login_token_valid(filename)
+    if 'password' in request.args and not authorised:
+        return unauthorised()
     try:
-        data = publisher.download(which_env + "/" + filename)
+        report = download_protected_report(filename) if authorised else download_published_report(filename)
     except Exception as e:
         logging.error(e, exc_info=True)
         return app.response_class(
             response=json.dumps({"message": "Failed to download your report!"}),
             status=500
         )
-    return flask.render_template('wbr_share.html', data=data)
+
+    if isinstance(report, dict) and 'password' in report:
+        return unauthorised()
+
+    if not isinstance(report, list):
+        return app.response_class(
+            response=json.dumps({"message": "JSON data is not well formatted!"}),
+            status=500
+        )
+    return report
 
 
 @app.route('/login', methods=["GET", "POST"])
@@ -206,33 +937,28 @@ def login():
     build-wbr/publish/protected endpoint where protected WBR report will be rendered
     """
     # Get the file name from the request arguments
-    file_name = request.args['file']
+    file_name = get_report_name()
+    if file_name is None:
+        return report_not_found()
 
     if 'password' in request.args:
         # If password is provided in the request arguments
         auth_password = request.args['password']
         try:
-            # Retrieve the JSON file from S3 bucket
-            protected_data = publisher.download(which_env + "/" + file_name)
+            # Check the password against the metadata record of the report
+            authorised = is_authorised(file_name, auth_password)
         except Exception as e:
             # Log any exceptions that occur during file retrieval
             logging.error(e, exc_info=True)
             return e.__str__()
 
-        if auth_password == protected_data['password']:
-            # If the provided password matches the password in the JSON file
-            file_name = request.args['file']
-            f = Fernet(key)
-            # Encrypt the password and generate a token
-            token = f.encrypt(bytes(auth_password, 'utf-8'))[:15]
+        if authorised:
+            # If the provided password matches the password of the report, sign a token for the report
             return redirect("/build-wbr/publish/protected?file=" + file_name +
-                            "&password=" + str(token))
+                            "&password=" + create_login_token(file_name))
         else:
-            # If the provided password does not match the password in the JSON file
-            return app.response_class(
-                response=json.dumps({"message": "Unauthorised"}),
-                status=403
-            )
+            # If the provided password does not match the password of the report
+            return unauthorised()
     else:
         # If password is not provided in the request arguments
         return render_template("login.html", fileName=file_name)
@@ -245,12 +971,39 @@ def build_wbr_protected():
     :return: Rendered WBR html file
     """
     if 'file' in request.args:
-        auth_file_name = request.args['file']
-        if 'password' not in request.args:
+        auth_file_name = get_report_name()
+        if auth_file_name is None:
+            return report_not_found()
+        if not is_login_token_valid(auth_file_name):
             return redirect('/login?file=' + auth_file_name)
         else:
-            protected_data = publisher.download(which_env + "/" + auth_file_name)
-            return flask.render_template('wbr_share.html', data=protected_data["data"])
+            password = request.args['password']
+            try:
+                checksum, _ = get_stored_version(which_env + "/protected/" + auth_file_name)
+            except Exception as e:
+                logging.info(f"{auth_file_name} is not stored as a protected report, reading it the legacy way: {e}")
+                checksum, _ = get_stored_version(which_env + "/" + auth_file_name)
+            # The page embeds the login token in the url of its blocks
+            token_checksum = hashlib.sha256(password.encode('utf-8')).hexdigest()[:8]
+            return cached_response(
+                f"{checksum}-{token_checksum}-{get_template_version('wbr_share.html')}-"
+                f"{controller_util.deck_page_size}",
+                protected_cache_control,
+                lambda: render_lazy_report(download_protected_report(auth_file_name),
+                                           flask.url_for('get_published_deck_page', file=auth_file_name,
+                                                         password=password)))
+
+
+def get_sample_file(filename: str):
+    """
+    Resolves the name of a sample report to its file, names leading out of the sample folder like ../ are refused.
+    :param filename: The name of the sample report in the request
+    :return: The path of the sample report, None if it is not a file of the sample folder
+    """
+    file = (sample_folder / filename).resolve()
+    if file.parent != sample_folder.resolve() or not file.is_file():
+        return None
+    return file
 
 
 @app.route('/build-wbr/sample', methods=['GET'])
@@ -259,12 +1012,26 @@ def build_sample_wbr():
     Builds sample WBR files.
     :return: Rendered sample WBR report html file
     """
-    filename = request.args['file']
-    base_path = str(Path(os.path.dirname(__file__)).parent)
-    file = base_path + '/sample/' + filename
-    current_file = open(file)
-    data = json.load(current_file)
-    return flask.render_template('wbr_share.html', data=data)
+    file = get_sample_file(request.args.get('file', ''))
+    if file is None:
+        return report_not_found()
+    filename = file.name
+    # Sample reports change with a release only, they are tagged with the modification time and size of their file
+    file_stat = os.stat(file)
+    etag = f"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}-{get_template_version('wbr_share.html')}-" \
+           f"{controller_util.deck_page_size}"
+
+    def render_sample():
+        with open(file) as current_file:
+            data = json.load(current_file)
+        return render_report(data).encode('utf-8')
+
+    def send_sample():
+        # The rendered page is kept until the sample or its directory changes
+        page = sample_cache.get((filename, file_stat.st_mtime_ns, file_stat.st_size), render_sample)
+        return app.response_class(response=page, status=200, mimetype='text/html')
+
+    return cached_response(etag, sample_cache_control, send_sample)
 
 
 @app.route("/get_file_name", methods=['GET'])
@@ -273,11 +1040,13 @@ def get_file_name():
     Retrieve the sample reference files.
     :return: reference files
     """
-    data_folder = Path(os.path.dirname(__file__)) / 'web/static/demo_uploads'
-    files = os.listdir(data_folder)
-    files.sort()
+    def list_files():
+        files = os.listdir(demo_uploads_folder)
+        files.sort()
+        return json.dumps(files, indent=4, cls=controller_util.Encoder).encode('utf-8')
+
     return app.response_class(
-        response=json.dumps(files, indent=4, cls=controller_util.Encoder),
+        response=demo_uploads_cache.get('files', list_files),
         status=200,
         mimetype='application/json'
     )
@@ -310,7 +1079,7 @@ def system_design_questions():
     payload = request.get_json(silent=True) or {}
     app_idea = payload.get('app_idea', request.args.get('app_idea', ''))
     return app.response_class(
-        response=json.dumps({"questions": system_design_agent.get_questions(app_idea)}, indent=4),
+        response=json.dumps({"questions": lazy_import('src.system_design_agent').get_questions(app_idea)}, indent=4),
         status=200,
         mimetype='application/json'
     )
@@ -331,7 +1100,7 @@ def system_design_options():
         )
 
     try:
-        recommendation = system_design_agent.build_design_options(app_idea, answers)
+        recommendation = lazy_import('src.system_design_agent').build_design_options(app_idea, answers)
     except ValueError as error:
         return app.response_class(
             response=json.dumps({"error": str(error)}, indent=4),
@@ -369,7 +1138,7 @@ def deploy_system_design():
             mimetype='application/json'
         )
 
-    commands = system_design_agent.build_doctl_commands(repo_full_name, region)
+    commands = lazy_import('src.system_design_agent').build_doctl_commands(repo_full_name, region)
     return app.response_class(
         response=json.dumps({
             "status": "accepted",
@@ -381,13 +1150,78 @@ def deploy_system_design():
     )
 
 
+@app.route('/startup-report', methods=["GET"])
+def startup_report():
+    """
+    Start up time report endpoint
+    :return: The time the app took to start and the lazily imported modules loaded since
+    """
+    return app.response_class(
+        response=json.dumps(get_startup_report(), indent=4),
+        status=200,
+        mimetype='application/json'
+    )
+
+
+@app.route('/admin/profiles/<profile_id>', methods=["GET"])
+def get_profile(profile_id):
+    """
+    Returns a profile of a report request, ?format=collapsed returns its stacks only, to open in a flame graph viewer
+    :param profile_id: The id of the profile, returned in the X-Profile-Url header of the profiled request
+    :return: The profile
+    """
+    if not is_admin():
+        return admin_required()
+    try:
+        profile = publisher.download(which_env + "/profiles/" + profile_id)
+    except Exception as e:
+        logging.info(f"Profile {profile_id} not found: {e}")
+        return app.response_class(response=json.dumps({"error": "Profile not found"}), status=404,
+                                  mimetype='application/json')
+    if request.args.get('format') == 'collapsed':
+        return app.response_class(response=profile['collapsedStacks'], status=200, mimetype='text/plain')
+    return app.response_class(response=json.dumps(profile), status=200, mimetype='application/json')
+
+
+@app.route('/admin/slow-reports', methods=["GET"])
+def get_slow_reports():
+    """
+    Returns the slowest report builds since the start of the process, from the slowest, with the fingerprint of their
+    configuration, the shape of their data and the time of each of their stages
+    :return: The slow report log
+    """
+    if not is_admin():
+        return admin_required()
+    return app.response_class(
+        response=json.dumps({'size': slow_report_log.size, 'recorded': slow_report_log.recorded,
+                             'reports': slow_report_log.entries()}),
+        status=200,
+        mimetype='application/json'
+    )
+
+
+@app.route('/metrics', methods=["GET"])
+def metrics():
+    """
+    Metrics endpoint, scraped by Prometheus
+    :return: The metrics of the app in the Prometheus text exposition format
+    """
+    return app.response_class(
+        response=metrics_util.registry.render(),
+        status=200,
+        mimetype='text/plain; version=0.0.4'
+    )
+
+
 @app.route('/wbr-unit-test', methods=["GET"])
 def run_unit_test():
     """
-    Unit test endpoint
+    Unit test endpoint, ?performance=true also compares the build time and peak memory of each scenario with the
+    performance baseline, ?scenario=<name> only tests the scenarios whose name contains it
     :return: Test results
     """
-    test_result = test.test_wbr()
+    performance = request.args.get('performance', '').lower() in ('1', 'true')
+    test_result = lazy_import('src.test').test_wbr(performance, name_filter=request.args.get('scenario') or None)
     return app.response_class(
         response=json.dumps(test_result, indent=4, cls=controller_util.Encoder),
         status=200,
@@ -396,6 +1230,7 @@ def run_unit_test():
 
 
 @app.route('/report', methods=["POST"])
+@profiled
 def build_report():
     output_type = request.args["outputType"] if 'outputType' in request.args else None
 
@@ -421,8 +1256,9 @@ def build_report():
 
     # Load config
     try:
-        cfg = controller_util.load_yaml_from_url(request.args["configUrl"]) \
-            if 'configUrl' in request.args else controller_util.load_yaml_from_stream(request.files['configFile'])
+        with profiling_util.stage('load_config'):
+            cfg = controller_util.load_yaml_from_url(request.args["configUrl"]) \
+                if 'configUrl' in request.args else controller_util.load_yaml_from_stream(request.files['configFile'])
     except Exception as e:
         logging.error(e, exc_info=True)
         return app.response_class(
@@ -432,8 +1268,9 @@ def build_report():
 
     # Load data
     try:
-        data = request.files['dataFile'] if 'dataFile' in request.files \
-            else io.StringIO(requests.get(request.args["dataUrl"]).content.decode('utf-8'))
+        with profiling_util.stage('load_data'):
+            data = request.files['dataFile'] if 'dataFile' in request.files \
+                else io.StringIO(lazy_import('requests').get(request.args["dataUrl"]).content.decode('utf-8'))
     except Exception as e:
         logging.error(e, exc_info=True)
         return app.response_class(
@@ -444,7 +1281,7 @@ def build_report():
     # Load events data
     try:
         events_data = request.files['eventsFile'] if 'eventsFile' in request.files else (
-            io.StringIO(requests.get(request.args["eventsFileUrl"]).content.decode('utf-8'))
+            io.StringIO(lazy_import('requests').get(request.args["eventsFileUrl"]).content.decode('utf-8'))
             if "eventsFileUrl" in request.args else None
         )
     except Exception as e:
@@ -470,6 +1307,8 @@ def build_report():
 
     try:
         deck = process_input(data, cfg, events_data)
+    except admission_util.MemoryBudgetExceeded as e:
+        return memory_budget_exceeded(e, "error")
     except Exception as e:
         logging.error(e, exc_info=True)
         return app.response_class(
@@ -477,25 +1316,25 @@ def build_report():
             status=500
         )
 
+    # Serialize the deck once, the same JSON is returned, rendered or published
+    with profiling_util.stage('serialize'):
+        decks = [controller_util.to_plain(deck)]
+        decks_json = controller_util.dumps_deck(decks, indent=4 if 'pretty' in request.args else None)
+
     if output_type == "JSON":
         # Return the WBR deck as a JSON response
         return app.response_class(
-            response=json.dumps([deck], indent=4, cls=controller_util.Encoder),
+            response=decks_json,
             status=200,
             mimetype='application/json'
         )
     elif output_type == "HTML":
         # Return the WBR deck as a JSON response
-        return flask.render_template(
-            'wbr_share.html',
-            data=json.loads(json.dumps([deck], indent=4, cls=controller_util.Encoder))
-        )
+        return render_report(decks, decks_json)
     else:
-        return publish_protected_wbr(request.base_url.replace('/report', ''),
-                                     json.dumps([deck], indent=4, cls=controller_util.Encoder)) \
+        return publish_protected_wbr(request.base_url.replace('/report', ''), decks_json) \
             if "password" in request.args \
-            else publish_report(request.base_url.replace('/report', ''),
-                                json.dumps([deck], indent=4, cls=controller_util.Encoder))
+            else publish_report(request.base_url.replace('/report', ''), decks_json)
 
 
 def start(environ=None, start_response=None):
@@ -1,7 +1,14 @@
 import datetime
+import hashlib
+import json
 import logging
+import math
+import os
 import tempfile
+import threading
 import traceback
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONEncoder
 from typing import List
 
@@ -9,14 +16,29 @@ import dateutil
 import dateutil.relativedelta
 import numpy
 import numpy as np
-import pandas as pd
-import requests
 import yaml
 from yaml import SafeLoader
 from yaml._yaml import ScannerError
 
+import src.profiling_utility as profiling_util
 from src.wbr import WBR
-from src.wbr_utility import if_else, put_into_map, if_else_supplier, append_to_list, is_last_day_of_month
+from src.wbr_utility import if_else, put_into_map, if_else_supplier, append_to_list, is_last_day_of_month, \
+    get_first_period_end, get_period_id
+
+
+# Number of worker threads used to build the blocks of a deck, 1 builds them sequentially. Threads only overlap the
+# work releasing the GIL, like some numpy operations, most of building a block holds it
+deck_builder_workers = int(os.environ.get("WBR_DECK_BUILDER_WORKERS") or 1)
+
+# Number of blocks served per page by the lazy deck endpoints
+deck_page_size = int(os.environ.get("WBR_DECK_PAGE_SIZE") or 10)
+
+# Number of built or downloaded decks kept in memory for the lazy deck endpoints
+deck_cache_size = int(os.environ.get("WBR_DECK_CACHE_SIZE") or 32)
+
+# Plot styles which are numbered in the rendered report, tables are numbered separately as well
+numbered_plot_styles = ['6_12_chart', '6_week_table', '12_MonthsTable']
+table_plot_styles = ['6_week_table', '12_MonthsTable']
 
 
 class SixTwelveChart:
@@ -86,6 +108,45 @@ class Encoder(JSONEncoder):
         return o.__dict__
 
 
+def to_plain(o):
+    """
+    Converts a deck, or any of its blocks, to the plain dicts, lists and scalars it is serialized as. Converting a
+    deck once lets the same structure be serialized, indexed for paging and rendered without encoding it twice.
+
+    Args:
+        o: A deck, a block, or any value found in them.
+
+    Returns:
+        The value made of dicts, lists, strings, numbers and None only.
+    """
+    if o is None or isinstance(o, (str, int, float)):
+        return o
+    if isinstance(o, dict):
+        return {key: to_plain(value) for key, value in o.items()}
+    if isinstance(o, (list, tuple)):
+        return [to_plain(value) for value in o]
+    if isinstance(o, np.generic):
+        return o.item()
+    return to_plain(o.__dict__)
+
+
+def dumps_deck(o, indent: int = None) -> str:
+    """
+    Serializes decks to JSON, compact unless an indent is given. Characters with a meaning in HTML are escaped, like
+    the tojson template filter does, so the same text can be returned by the API, embedded into the report page and
+    published.
+
+    Args:
+        o: Decks, either Deck objects or converted by to_plain.
+        indent (int): Optional indent for human readable output.
+
+    Returns:
+        str: The JSON text.
+    """
+    text = json.dumps(o, indent=indent, cls=Encoder)
+    return text.replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026').replace("'", '\\u0027')
+
+
 class SafeLineLoader(SafeLoader):
     def construct_mapping(self, node, deep=False):
         mapping = super(SafeLineLoader, self).construct_mapping(node, deep=deep)
@@ -182,11 +243,15 @@ def _6_12_chart(decks, plot, wbr1: WBR, block_number):
 
     # Get the fiscal start date based on the current week and fiscal month configuration.
     fiscal_start = get_month_start(wbr1.cy_week_ending.month, wbr1.cy_week_ending.year,
-                                   datetime.datetime.strptime(wbr1.fiscal_month, '%b').month)
+                                   datetime.datetime.strptime(wbr1.fiscal_month, '%b').month) \
+        if wbr1.period_table is None else get_first_period_end(wbr1.period_table, wbr1.cy_week_ending).date()
 
     # Determine the starting month for the x-axis display.
     is_trailing_twelve_months, month_start = _get_x_axis_start_month(block_number, decks, end_date, plotting_dict, wbr1)
 
+    # Determine once for the block where the displayed months start in the metrics data.
+    month_offset = get_month_offset(wbr1, fiscal_start, is_trailing_twelve_months)
+
     # Set the x-axis label based on the determined start month.
     six_twelve_chart.xAxis = get_x_axis_label(wbr1, month_start)
 
@@ -200,9 +265,8 @@ def _6_12_chart(decks, plot, wbr1: WBR, block_number):
     # Iterate over each metric in the metrics dictionary to populate the chart.
     is_single_axis = process_metric(
         block_number,
-        fiscal_start,
+        month_offset,
         is_single_axis,
-        is_trailing_twelve_months,
         metrices,
         six_twelve_chart,
         wbr1
@@ -217,9 +281,8 @@ def _6_12_chart(decks, plot, wbr1: WBR, block_number):
 
 def process_metric(
         block_number,
-        fiscal_start,
+        month_offset,
         is_single_axis,
-        is_trailing_twelve_months,
         metrics,
         six_twelve_chart,
         wbr1
@@ -230,9 +293,8 @@ def process_metric(
 
     Args:
         block_number (str): The block number, useful for logging and error handling.
-        fiscal_start (datetime): The start of the fiscal period.
+        month_offset (int): Position of the first displayed month within the monthly metrics data.
         is_single_axis (bool): Flag indicating whether the chart should use a single axis.
-        is_trailing_twelve_months (bool): Flag indicating if the data represents trailing twelve months.
         metrics (dict): Dictionary of metrics and their configuration from the plotting YAML.
         six_twelve_chart (SixTwelveChart): Chart object to which the processed data is added.
         wbr1 (WBR): Data object containing the report metrics and configurations.
@@ -254,7 +316,7 @@ def process_metric(
 
             # Process the current and prior year data for the metric.
             metric_object, is_single_axis = _process_metric_data(
-                metric, metric_configs, wbr1, fiscal_start, is_trailing_twelve_months, is_single_axis
+                metric, metric_configs, wbr1, month_offset, is_single_axis
             )
 
             # Build the dictionary for the metric's line style, legend, and other configurations.
@@ -278,7 +340,7 @@ def process_metric(
     return is_single_axis
 
 
-def _process_metric_data(metric, metric_configs, wbr1, fiscal_start, is_trailing_twelve_months, is_single_axis):
+def _process_metric_data(metric, metric_configs, wbr1, month_offset, is_single_axis):
     """
     Retrieves and processes both current and prior year data for a metric.
 
@@ -286,8 +348,7 @@ def _process_metric_data(metric, metric_configs, wbr1, fiscal_start, is_trailing
         metric (str): The metric to be processed.
         metric_configs (dict): Configuration for the metric from the plotting YAML.
         wbr1 (WBR): Data object containing the report metrics.
-        fiscal_start (datetime): The start of the fiscal period.
-        is_trailing_twelve_months (bool): Flag indicating if the data represents trailing twelve months.
+        month_offset (int): Position of the first displayed month within the monthly metrics data.
         is_single_axis (bool): Flag indicating whether the chart should use a single axis.
 
     Returns:
@@ -304,7 +365,7 @@ def _process_metric_data(metric, metric_configs, wbr1, fiscal_start, is_trailing
     metric_object = MetricObject()
 
     # Process current year data.
-    metric_data_series = get_metric_series_data(wbr1, metric, fiscal_start, is_trailing_twelve_months)
+    metric_data_series = get_metric_series_data(wbr1, metric, month_offset)
     metric_object.current, is_single_axis = get_primary_and_secondary_axis_value_list(
         metric_data_series, is_single_axis
     )
@@ -312,9 +373,7 @@ def _process_metric_data(metric, metric_configs, wbr1, fiscal_start, is_trailing
     # Process prior year data if configured.
     if "PY__" + metric in wbr1.metrics and ('graph_prior_year_flag' not in metric_configs or
                                             metric_configs['graph_prior_year_flag']):
-        metric_data_series = get_metric_series_data(
-            wbr1, 'PY__' + metric, fiscal_start, is_trailing_twelve_months
-        )
+        metric_data_series = get_metric_series_data(wbr1, 'PY__' + metric, month_offset)
         metric_object.previous, is_single_axis = get_primary_and_secondary_axis_value_list(
             metric_data_series, is_single_axis
         )
@@ -396,7 +455,7 @@ def _get_x_axis_start_month(block_number, decks, end_date, plotting_dict, wbr1):
         )
     else:
         # Default to a 12-month trailing view.
-        month_start = (end_date - dateutil.relativedelta.relativedelta(months=11)).strftime("%b")
+        month_start = get_trailing_twelve_months_start(wbr1, end_date)
         is_trailing_twelve_months = True
 
     return is_trailing_twelve_months, month_start
@@ -448,7 +507,7 @@ def get_x_axis_display_start_month(block_number, end_date: datetime, month_start
     elif month_start == 'trailing_twelve_months':
         # Return the month that is 11 months prior to the `end_date`, representing the start of the trailing twelve
         # months.
-        return (end_date - dateutil.relativedelta.relativedelta(months=11)).strftime("%b"), True
+        return get_trailing_twelve_months_start(wbr1, end_date), True
 
     else:
         # Raise an error if the `month_start` value is not 'fiscal_year' or 'trailing_twelve_months'.
@@ -456,6 +515,23 @@ def get_x_axis_display_start_month(block_number, end_date: datetime, month_start
                         f"for block {block_number} at line: {line}")
 
 
+def get_trailing_twelve_months_start(wbr1, end_date):
+    """
+    Returns the label of the first month of the trailing twelve months ending with `end_date`. On a retail
+    calendar the periods do not line up with calendar months, so the label of the first trailing period is used.
+
+    Args:
+        wbr1 (WBR): The WBR object containing the graph axis labels and the period table.
+        end_date (datetime): The last day of the last full month.
+
+    Returns:
+        str: The abbreviated name of the first month (or period) of the trailing twelve months.
+    """
+    if wbr1.period_table is not None:
+        return wbr1.graph_axis_label[7]
+    return (end_date - dateutil.relativedelta.relativedelta(months=11)).strftime("%b")
+
+
 def get_month_start(week_ending_month, week_ending_year, fiscal_month):
     """
     Determines the start month for the fiscal year by adjusting the given week-ending month to align with the fiscal
@@ -501,51 +577,48 @@ def last_day_of_month(any_day):
     return next_month - datetime.timedelta(days=next_month.day)
 
 
-def get_metric_series_data(wbr1, metric, fiscal_start, is_trailing_twelve_months):
+def get_month_offset(wbr1, fiscal_start, is_trailing_twelve_months):
     """
-    Retrieves and constructs a time series for the specified metric, aligning it with the fiscal start
-    or a trailing twelve-month period.
+    Determines the position of the first displayed month within the monthly part of the WBR metrics, i.e. the
+    rows following the six weeks and the separator row. The trailing twelve months start at the first monthly row,
+    a fiscal year display starts at the row of the first fiscal month.
 
     Args:
         wbr1 (WBR): The WBR object containing metrics data and other configurations.
-        metric (str): The name of the metric to retrieve the time series data for.
-        fiscal_start (datetime): The start date of the fiscal period.
-        is_trailing_twelve_months (bool): If True, the series will cover the trailing twelve months.
+        fiscal_start (datetime): The last day of the first month (or retail period) of the fiscal year.
+        is_trailing_twelve_months (bool): If True, the displayed months are the trailing twelve months.
 
     Returns:
-        pd.Series: A pandas Series representing the time series of the specified metric,
-        with up to 12 months of data.
+        int: The offset of the first displayed month, the number of monthly rows if the fiscal start is not found.
     """
+    if is_trailing_twelve_months:
+        return 0
 
-    # Start by taking the first 6 data points of the metric.
-    metric_series = wbr1.metrics[metric].copy()[0:6]
-
-    # Concatenate a NaN value for padding, then reset index for proper series alignment.
-    metric_series = pd.concat([metric_series, pd.Series(np.nan)]).reset_index(drop=True)
-
-    # Copy the metric data for the months beyond the first 6 data points.
-    months_data = list(wbr1.metrics[metric].copy()[7:])
+    # The monthly rows are the twelve months (or retail periods) ending with the last full one of the week ending
+    if wbr1.period_table is None:
+        first_month = wbr1.cy_trailing_twelve_months['Date'].iloc[0]
+        month_offset = (fiscal_start.year - first_month.year) * 12 + fiscal_start.month - first_month.month
+    else:
+        month_offset = get_period_id(wbr1.period_table, fiscal_start) - (wbr1.get_last_full_period_id() - 11)
+    return month_offset if 0 <= month_offset < len(wbr1.cy_trailing_twelve_months) else len(wbr1.metrics) - 7
 
-    # Copy the corresponding dates from the 'Date' column in the WBR metrics.
-    axis_data = list(wbr1.metrics['Date'].copy()[7:])
 
-    # Initialize conditions to track the month matching and total number of months processed.
-    month_cond = False
-    total_months = 1
-
-    # Iterate through the months data to collect up to 12 months of aligned metric data.
-    for i in range(len(months_data)):
-        # Check if the current date aligns with the fiscal start date or the trailing twelve months condition is met.
-        if ((str(axis_data[i]).replace(' 00:00:00', '').lower() == str(
-                fiscal_start) or is_trailing_twelve_months or month_cond) and total_months <= 12):
-            # Set month condition to True after the first match, and increment total_months.
-            month_cond = True
-            total_months += 1
+def get_metric_series_data(wbr1, metric, month_offset):
+    """
+    Retrieves the series of the specified metric for a 6-12 chart, the six weeks followed by a NaN separator and
+    up to twelve months starting at the given month offset.
 
-            # Append the corresponding month's data to the metric series.
-            metric_series = pd.concat([metric_series, pd.Series(months_data[i])]).reset_index(drop=True)
+    Args:
+        wbr1 (WBR): The WBR object containing metrics data and other configurations.
+        metric (str): The name of the metric to retrieve the time series data for.
+        month_offset (int): Position of the first displayed month within the monthly metrics data,
+                            see `get_month_offset`.
 
-    return metric_series
+    Returns:
+        numpy.ndarray: The series of the specified metric, with up to 12 months of data.
+    """
+    metric_values = wbr1.metrics[metric].to_numpy()
+    return np.concatenate([metric_values[0:6], [np.nan], metric_values[7 + month_offset:19 + month_offset]])
 
 
 def get_x_axis_label(wbr1, month_start):
@@ -917,24 +990,31 @@ def append_embedded_content_to_deck(decks, plot):
     decks.blocks.append(embedded_content)
 
 
-def get_wbr_deck(wbr1: WBR) -> Deck:
+def get_wbr_deck(wbr1: WBR, workers: int = None) -> Deck:
     """
     Constructs a Deck object based on the configuration provided in the wbr1 object.
 
     Args:
         wbr1 (WBR): An instance of the WBR class containing configuration data for the deck.
+        workers (int): Number of worker threads building the blocks, defaults to the WBR_DECK_BUILDER_WORKERS
+                       environment variable. With a single worker the blocks are built sequentially.
 
     Returns:
         Deck: A Deck object populated with plots, titles, and other settings defined in the wbr1 configuration.
     """
     plots = wbr1.cfg['deck']
     deck = Deck()
+    workers = workers or deck_builder_workers
 
     if 'x_axis_monthly_display' in wbr1.cfg['setup']:
         deck.xAxisMonthlyDisplay = wbr1.cfg['setup']['x_axis_monthly_display']
 
-    for i in range(len(plots)):
-        build_a_block(deck, i, plots, wbr1)
+    with profiling_util.stage('deck'):
+        if workers > 1 and len(plots) > 1:
+            build_blocks_in_parallel(deck, plots, wbr1, workers)
+        else:
+            for i in range(len(plots)):
+                build_a_block(deck, i, plots, wbr1)
 
     deck.title = wbr1.cfg['setup']['title']
 
@@ -947,6 +1027,35 @@ def get_wbr_deck(wbr1: WBR) -> Deck:
     return deck
 
 
+def build_blocks_in_parallel(deck: Deck, plots: list, wbr1: WBR, workers: int):
+    """
+    Builds the blocks of the deck on a pool of worker threads. Every block only reads from the WBR object, so each
+    one is built into a deck of its own and the results are appended to the given deck in configuration order.
+    Building a block is mostly pandas indexing and Python code holding the GIL, so the threads only overlap the parts
+    releasing it, they do not spread the blocks over the cores of the host.
+    If blocks fail, the error of the first failing block in configuration order is raised, like it would be when
+    building the blocks sequentially.
+
+    Args:
+        deck (Deck): The Deck object to which the blocks will be added.
+        plots (list): A list of plot configurations, each containing a block configuration.
+        wbr1 (WBR): An instance of the WBR class containing additional configuration data.
+        workers (int): The number of worker threads.
+    """
+    def build_block_deck(i):
+        block_deck = Deck()
+        block_deck.xAxisMonthlyDisplay = deck.xAxisMonthlyDisplay
+        build_a_block(block_deck, i, plots, wbr1)
+        return block_deck.blocks
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(plots)), thread_name_prefix='deck-builder')
+    try:
+        for blocks in executor.map(build_block_deck, range(len(plots))):
+            deck.blocks.extend(blocks)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def build_a_block(deck: Deck, i: int, plots: list, wbr1: WBR):
     """
     Builds a block in the given deck based on the configuration specified in the plots.
@@ -983,6 +1092,148 @@ def build_a_block(deck: Deck, i: int, plots: list, wbr1: WBR):
         )
 
 
+class DeckCache:
+    """
+    A thread safe, least recently used cache of decks in their JSON form, keyed by the id of a deck built for the
+    frontend or by the name of a published report. The lazy deck endpoints serve the index and the pages of a report
+    from here, so a report is only built or downloaded once no matter how many pages are requested.
+    """
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size or deck_cache_size
+        self.decks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            if key not in self.decks:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.decks.move_to_end(key)
+            return self.decks[key]
+
+    def put(self, key: str, decks):
+        with self.lock:
+            self.decks[key] = decks
+            self.decks.move_to_end(key)
+            while len(self.decks) > self.max_size:
+                self.decks.popitem(last=False)
+
+
+class DirectoryCache:
+    """
+    A thread safe cache of values read from the files of a directory, like the sample reports and the listing of the
+    demo files. The cache is emptied when the modification time of the directory changes, which happens when a file
+    is added, removed or renamed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.modified = None
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, load):
+        """
+        Returns the cached value of a key, loading it when the key is not cached or the directory changed.
+
+        Args:
+            key: The key of the value, include the modification time of a file to reload the file when it changes.
+            load (function): Loads the value, called without holding the lock.
+
+        Returns:
+            The value.
+        """
+        modified = os.stat(self.directory).st_mtime_ns
+        with self.lock:
+            if modified != self.modified:
+                self.values = {}
+                self.modified = modified
+            if key in self.values:
+                return self.values[key]
+
+        value = load()
+        with self.lock:
+            # A value loaded while the directory changed is not kept
+            if modified == self.modified:
+                self.values[key] = value
+        return value
+
+
+def get_deck_index(decks: list, page_size: int = None) -> dict:
+    """
+    Summarises a list of decks for the lazy deck endpoints. The summary has everything needed to lay out the report
+    before any block is loaded: the deck titles, the number of pages and, for every block, its plot style, title and
+    the block and table number it is rendered with.
+
+    Args:
+        decks (list): A list of decks in their JSON form.
+        page_size (int): Number of blocks per page, defaults to the WBR_DECK_PAGE_SIZE environment variable.
+
+    Returns:
+        dict: The page size and a summary of every deck.
+    """
+    page_size = page_size or deck_page_size
+    deck_summaries = []
+    for deck in decks:
+        block_number = deck['blockStartingNumber']
+        table_number = 0
+        block_summaries = []
+        for block in deck['blocks']:
+            block_summary = {'plotStyle': block['plotStyle'], 'title': block.get('title')}
+            # Blocks and tables are numbered in the same way the report used to number them while rendering
+            if block['plotStyle'] in numbered_plot_styles:
+                if block['plotStyle'] in table_plot_styles:
+                    table_number += 1
+                    block_summary['tableNumber'] = table_number
+                block_summary['blockNumber'] = block_number
+                block_number += 1
+            block_summaries.append(block_summary)
+
+        deck_summaries.append({
+            'title': deck['title'],
+            'weekEnding': deck['weekEnding'],
+            'blockStartingNumber': deck['blockStartingNumber'],
+            'xAxisMonthlyDisplay': deck.get('xAxisMonthlyDisplay'),
+            'eventErrors': deck.get('eventErrors'),
+            'pages': math.ceil(len(block_summaries) / page_size),
+            'blocks': block_summaries
+        })
+    return {'pageSize': page_size, 'decks': deck_summaries}
+
+
+def get_deck_page(decks: list, deck_number: int, page: int, page_size: int = None) -> dict:
+    """
+    Returns a page of blocks of one of the decks.
+
+    Args:
+        decks (list): A list of decks in their JSON form.
+        deck_number (int): Index of the deck in the list.
+        page (int): Index of the page in the deck.
+        page_size (int): Number of blocks per page, defaults to the WBR_DECK_PAGE_SIZE environment variable.
+
+    Returns:
+        dict: The deck and page numbers, the index of the first block of the page and the blocks of the page.
+
+    Raises:
+        IndexError: If the deck or the page does not exist.
+    """
+    page_size = page_size or deck_page_size
+    if deck_number < 0 or deck_number >= len(decks):
+        raise IndexError(f"Deck {deck_number} does not exist, the report has {len(decks)} deck(s)")
+
+    blocks = decks[deck_number]['blocks']
+    pages = math.ceil(len(blocks) / page_size)
+    if page < 0 or page >= pages:
+        raise IndexError(f"Page {page} does not exist, deck {deck_number} has {pages} page(s)")
+
+    start = page * page_size
+    return {'deck': deck_number, 'page': page, 'start': start, 'blocks': blocks[start:start + page_size]}
+
+
 def get_dict(column):
     metric_dict = {'column': column, 'aggf': 'sum'}
     return metric_dict
@@ -1093,6 +1344,8 @@ def load_yaml_from_stream(config_file):
 
 
 def load_yaml_from_url(url: str):
+    # requests is only needed for configs loaded from a URL, keep it out of the start up of the app
+    import requests
     # Retrieve the file content from the URL
     response = requests.get(url, allow_redirects=True)
     # Convert bytes to string
@@ -1105,3 +1358,92 @@ def load_yaml_from_url(url: str):
         error_message = traceback.format_exc().split('.yaml')[-1].replace(',', '').replace('"', '')
         # Return an error response if there is an issue with the YAML configuration
         raise Exception(f"Could not create WBR metrics due to incorrect yaml, caused due to error in {error_message}")
+
+
+def get_config_fingerprint(cfg: dict) -> dict:
+    """
+    Summarizes the shape of a report configuration, so slow reports can be compared by the features of their
+    configuration. Only counts are kept, not the names, queries or titles of the configuration.
+
+    Args:
+        cfg (dict): The configuration of the report, as loaded from its YAML file.
+
+    Returns:
+        dict: The number of metrics by type and by aggregation, the number of filter metrics, the number of
+              function metrics by operation, the deepest nesting of function metrics, the number of blocks by
+              ui_type, and a hash of all of them, equal for configurations of the same shape.
+    """
+    metrics_configs = {name: config for name, config in (cfg.get('metrics') or {}).items()
+                       if name != '__line__' and isinstance(config, dict)}
+    metric_types = Counter()
+    aggregations = Counter()
+    operations = Counter()
+    for config in metrics_configs.values():
+        metric_type = next((key for key in ('function', 'filter', 'column') if key in config), 'unknown')
+        metric_types[metric_type] += 1
+        if metric_type == 'function':
+            count_function_operations(config['function'], operations)
+        elif 'aggf' in config:
+            aggregations[str(config['aggf'])] += 1
+
+    depths = {}
+    function_depth = max([get_function_depth(name, metrics_configs, depths) for name in metrics_configs], default=0)
+
+    blocks = Counter()
+    for plot in cfg.get('deck') or []:
+        block = plot.get('block') if isinstance(plot, dict) else None
+        blocks[str(block.get('ui_type')) if isinstance(block, dict) else 'invalid'] += 1
+
+    fingerprint = {
+        'metrics': dict(sorted(metric_types.items())),
+        'aggregations': dict(sorted(aggregations.items())),
+        'filters': metric_types['filter'],
+        'functionOperations': dict(sorted(operations.items())),
+        'functionDepth': function_depth,
+        'blocks': dict(sorted(blocks.items())),
+        'blockCount': sum(blocks.values())
+    }
+    fingerprint['hash'] = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return fingerprint
+
+
+def count_function_operations(function_config: dict, operations: Counter):
+    for operation, operands in function_config.items():
+        if operation == '__line__':
+            continue
+        operations[str(operation)] += 1
+        for operand in operands or []:
+            metric = operand.get('metric') if isinstance(operand, dict) else None
+            if isinstance(metric, dict) and isinstance(metric.get('function'), dict):
+                count_function_operations(metric['function'], operations)
+
+
+def get_function_depth(name: str, metrics_configs: dict, depths: dict) -> int:
+    """
+    Returns how deeply the function metrics of a metric are nested, 0 for a metric which is not a function, 1 for a
+    function of columns and metrics which are not functions. Metrics referring to themselves are counted once.
+    """
+    if name in depths:
+        return depths[name]
+    config = metrics_configs.get(name)
+    if not isinstance(config, dict) or not isinstance(config.get('function'), dict):
+        return 0
+    depths[name] = 1
+    depths[name] = get_operation_depth(config['function'], metrics_configs, depths)
+    return depths[name]
+
+
+def get_operation_depth(function_config: dict, metrics_configs: dict, depths: dict) -> int:
+    depth = 0
+    for operation, operands in function_config.items():
+        if operation == '__line__':
+            continue
+        for operand in operands or []:
+            metric = operand.get('metric') if isinstance(operand, dict) else None
+            if not isinstance(metric, dict):
+                continue
+            if isinstance(metric.get('function'), dict):
+                depth = max(depth, get_operation_depth(metric['function'], metrics_configs, depths))
+            else:
+                depth = max(depth, get_function_depth(metric.get('name'), metrics_configs, depths))
+    return depth + 1
@@ -0,0 +1,224 @@
+import argparse
+import datetime
+import os
+import pathlib
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+# The operations of the nested function metrics, in the order they are nested
+function_operations = ['divide', 'sum', 'product', 'difference']
+
+# A report needs the trailing twelve months of the current and the previous year
+minimum_days = 2 * 371
+
+
+def get_week_ending(last_date: datetime.date) -> datetime.date:
+    """
+    Returns the last Saturday on or before the given date, the week ending of a report on the generated data.
+    """
+    return last_date - datetime.timedelta(days=(last_date.weekday() - 5) % 7)
+
+
+def generate_data_frame(days: int, metrics: int, dimension_values: int = 0, seed: int = 0,
+                        start_date: datetime.date = datetime.date(2019, 1, 1)) -> pd.DataFrame:
+    """
+    Generates daily metric data with a trend, a weekly seasonality and noise. The same arguments always generate
+    the same data.
+
+    Without dimension values the data is wide, a row per day with a column per metric. With dimension values the
+    data is long, a row per day and value of the `dimension` column, which the filter metrics query.
+
+    Args:
+        days (int): The number of days of data.
+        metrics (int): The number of metric columns, `metric_000` to `metric_<metrics - 1>`.
+        dimension_values (int): The number of values of the dimension column, 0 generates no dimension column.
+        seed (int): The seed of the random numbers.
+        start_date (datetime.date): The first day of data.
+
+    Returns:
+        pd.DataFrame: The data, with a `Date` column first.
+    """
+    rng = np.random.default_rng(seed)
+    rows_per_day = max(dimension_values, 1)
+    day_offsets = np.repeat(np.arange(days), rows_per_day)
+    dates = pd.to_datetime(start_date) + pd.to_timedelta(day_offsets, unit='D')
+
+    data = {'Date': dates.strftime('%Y-%m-%d')}
+    if dimension_values:
+        data['dimension'] = np.tile([f'D{value:03d}' for value in range(dimension_values)], days)
+
+    level = rng.uniform(1e3, 1e6, metrics)
+    growth = rng.uniform(-0.1, 0.3, metrics)
+    weekly_amplitude = rng.uniform(0, 0.2, metrics)
+    years = day_offsets / 365.0
+    weekday = np.sin(2 * np.pi * (day_offsets % 7) / 7)
+    for metric in range(metrics):
+        values = (1 + growth[metric] * years) * (1 + weekly_amplitude[metric] * weekday) \
+            * rng.normal(1, 0.05, len(day_offsets))
+        # Every fourth metric is a rate averaged over the period, the others are counts summed over the period
+        data[f'metric_{metric:03d}'] = np.round(values / 10, 4) if metric % 4 == 3 \
+            else np.round(values * level[metric] / rows_per_day)
+    return pd.DataFrame(data)
+
+
+def generate_config(data_frame: pd.DataFrame, metrics: int, filter_metrics: int = 0, function_depth: int = 0,
+                    blocks: int = 10, title: str = 'Synthetic WBR') -> dict:
+    """
+    Generates a WBR configuration for generated data.
+
+    Every metric column is a metric. The filter metrics sum the first metric column for one value of the dimension
+    column each. The function metrics are a chain, each applying the next function operation to the previous
+    function metric and a metric column, so the last one is nested `function_depth` levels deep. The blocks chart
+    the metrics in turn, every fifth block is a six weeks table and every tenth a twelve months table.
+
+    Args:
+        data_frame (pd.DataFrame): The generated data.
+        metrics (int): The number of metric columns of the data.
+        filter_metrics (int): The number of filter metrics, at most the number of dimension values.
+        function_depth (int): The number of nested function metrics.
+        blocks (int): The number of blocks of the deck.
+        title (str): The title of the report.
+
+    Returns:
+        dict: The configuration, with the setup, metrics and deck sections.
+    """
+    week_ending = get_week_ending(datetime.date.fromisoformat(data_frame['Date'].iloc[-1]))
+    metrics_config = {}
+    for metric in range(metrics):
+        metrics_config[f'Metric{metric:03d}'] = {'column': f'metric_{metric:03d}',
+                                                 'aggf': 'mean' if metric % 4 == 3 else 'sum'}
+
+    dimension_values = data_frame['dimension'].unique() if 'dimension' in data_frame else []
+    for value in dimension_values[:filter_metrics]:
+        metrics_config[f'Metric000{value}'] = {
+            'filter': {'base_column': 'metric_000', 'query': f"dimension == '{value}'"},
+            'aggf': 'sum'
+        }
+
+    previous_metric = 'Metric000'
+    for depth in range(1, function_depth + 1):
+        operation = function_operations[(depth - 1) % len(function_operations)]
+        metrics_config[f'Function{depth:02d}'] = {'function': {operation: [
+            {'metric': {'name': previous_metric}},
+            {'metric': {'name': f'Metric{depth % metrics:03d}'}}
+        ]}}
+        previous_metric = f'Function{depth:02d}'
+
+    metric_names = list(metrics_config)
+    deck = []
+    for block in range(blocks):
+        metric_name = metric_names[block % len(metric_names)]
+        if block % 10 == 9:
+            deck.append({'block': generate_table_block('12_MonthsTable', f'Metric{block % metrics:03d}', 'MOM')})
+        elif block % 5 == 4:
+            deck.append({'block': generate_table_block('6_WeeksTable', f'Metric{block % metrics:03d}', 'WOW')})
+        else:
+            deck.append({'block': {
+                'ui_type': '6_12Graph',
+                'title': metric_name,
+                'metrics': {metric_name: {'line_style': 'primary', 'graph_prior_year_flag': True}}
+            }})
+
+    return {
+        'setup': {
+            'week_ending': week_ending.strftime('%d-%b-%Y').upper(),
+            'week_number': week_ending.isocalendar()[1],
+            'title': title,
+            'fiscal_year_end_month': 'DEC',
+            'block_starting_number': 1
+        },
+        'metrics': metrics_config,
+        'deck': deck
+    }
+
+
+def generate_table_block(ui_type: str, metric_name: str, comparison: str) -> dict:
+    return {
+        'ui_type': ui_type,
+        'title': f'{metric_name} Summary',
+        'rows': [
+            {'row': {'header': metric_name, 'style': 'font-weight: bold; text-align:left;'}},
+            {'row': {'header': 'Actual', 'metric': metric_name, 'style': 'text-align:right;'}},
+            {'row': {'header': 'YOY', 'metric': f'{metric_name}YOY', 'style': 'text-align:right;',
+                     'y_scaling': '##.1%'}},
+            {'row': {'header': comparison, 'metric': f'{metric_name}{comparison}', 'style': 'text-align:right;',
+                     'y_scaling': '##.1%'}}
+        ]
+    }
+
+
+def generate_scenario(directory: str, days: int = 5 * 365, metrics: int = 10, dimension_values: int = 0,
+                      filter_metrics: int = 0, function_depth: int = 2, blocks: int = 10, seed: int = 0,
+                      file_format: str = 'csv') -> Path:
+    """
+    Writes a generated dataset and its configuration as a scenario folder, with the `original.csv` (or
+    `original.parquet`) and `config.yaml` files of the scenarios in `src/unit_test_case`. Scenario folders can be
+    benchmarked with `python -m src.benchmark --folder`.
+
+    Args:
+        directory (str): The scenario folder, created if it does not exist.
+        days (int): The number of days of data, at least two years.
+        metrics (int): The number of metric columns.
+        dimension_values (int): The number of values of the dimension column, 0 generates wide data.
+        filter_metrics (int): The number of filter metrics on the dimension column.
+        function_depth (int): The number of nested function metrics.
+        blocks (int): The number of blocks of the deck.
+        seed (int): The seed of the random numbers.
+        file_format (str): 'csv' or 'parquet', Parquet needs pyarrow or fastparquet to be installed.
+
+    Returns:
+        Path: The scenario folder.
+
+    Raises:
+        ValueError: If the arguments can not generate a report.
+    """
+    if days < minimum_days:
+        raise ValueError(f"At least {minimum_days} days are needed for the trailing twelve months of the previous "
+                         f"year, got {days}")
+    if metrics < 1 or filter_metrics > dimension_values:
+        raise ValueError("At least one metric, and a dimension value per filter metric, are needed")
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported file format {file_format}, use csv or parquet")
+
+    scenario = Path(directory)
+    os.makedirs(scenario, exist_ok=True)
+    data_frame = generate_data_frame(days, metrics, dimension_values, seed)
+    config = generate_config(data_frame, metrics, filter_metrics, function_depth, blocks,
+                             f'Synthetic WBR ({len(data_frame)} rows, {metrics} metrics)')
+
+    if file_format == 'parquet':
+        data_frame.to_parquet(scenario / 'original.parquet', index=False)
+    else:
+        data_frame.to_csv(scenario / 'original.csv', index=False)
+    with open(scenario / 'config.yaml', 'w') as config_file:
+        yaml.safe_dump(config, config_file, sort_keys=False)
+    return scenario
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Generates a synthetic dataset and WBR configuration.')
+    parser.add_argument('directory', help='The scenario folder to write original.csv and config.yaml to')
+    parser.add_argument('--days', type=int, default=5 * 365, help='Days of data')
+    parser.add_argument('--metrics', type=int, default=10, help='Metric columns')
+    parser.add_argument('--dimension-values', type=int, default=0,
+                        help='Values of the dimension column, a row per day and value, 0 for a row per day')
+    parser.add_argument('--filter-metrics', type=int, default=0, help='Filter metrics on the dimension column')
+    parser.add_argument('--function-depth', type=int, default=2, help='Nested function metrics')
+    parser.add_argument('--blocks', type=int, default=10, help='Blocks of the deck')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random numbers')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Format of the data file')
+    args = parser.parse_args(argv)
+
+    scenario = generate_scenario(args.directory, args.days, args.metrics, args.dimension_values,
+                                 args.filter_metrics, args.function_depth, args.blocks, args.seed, args.format)
+    print(f"Generated {scenario}")
+
+
+if __name__ == '__main__':
+    main()
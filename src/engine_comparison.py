@@ -0,0 +1,328 @@
+import argparse
+import importlib
+import json
+import logging
+import math
+import numbers
+import pathlib
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.benchmark as benchmark
+import src.controller_utility as controller_util
+import src.dataset_generator as dataset_generator
+
+# The engine reports are built with today
+reference_engine = 'src.wbr:WBR'
+
+# The synthetic scenarios compared along with the unit test scenarios, as arguments of
+# `dataset_generator.generate_scenario`: wide data with nested function metrics, and long data with filter metrics
+synthetic_scenarios = [
+    {'metrics': 8, 'function_depth': 3, 'blocks': 10},
+    {'metrics': 6, 'dimension_values': 4, 'filter_metrics': 3, 'function_depth': 4, 'blocks': 10}
+]
+
+# The number of discrepancies listed for each metric, the others are only counted
+example_count = 3
+
+
+def load_engine(spec: str):
+    """
+    Loads an engine from its import path, like 'src.wbr:WBR'.
+
+    An engine is called like the WBR class, with the configuration of a report and the path of its CSV file as
+    `csv`, and returns an object with the `metrics` and `box_totals` data frames of a WBR that
+    `controller_utility.get_wbr_deck` builds the deck of, usually a subclass of WBR.
+    """
+    module_name, _, attribute = spec.partition(':')
+    engine = importlib.import_module(module_name)
+    for name in attribute.split('.') if attribute else []:
+        engine = getattr(engine, name)
+    return engine
+
+
+def is_missing(value) -> bool:
+    """
+    Returns True for the values a report shows as missing: None, NaN, NaT and the 'N/A' of the box totals.
+    """
+    if value is None or value is pd.NaT or (isinstance(value, str) and value == 'N/A'):
+        return True
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and math.isnan(value)
+
+
+def is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def values_match(reference, candidate, rel_tol: float = 0.0, abs_tol: float = 0.0) -> bool:
+    """
+    Compares two cells. Missing values only match missing values, numbers match within the tolerances, which
+    compare them exactly when both are 0, and other values, like dates and labels, must be equal.
+    """
+    if is_missing(reference) or is_missing(candidate):
+        return is_missing(reference) and is_missing(candidate)
+    if is_number(reference) and is_number(candidate):
+        if rel_tol == 0 and abs_tol == 0:
+            return reference == candidate
+        return math.isclose(reference, candidate, rel_tol=rel_tol, abs_tol=abs_tol)
+    return reference == candidate
+
+
+def get_discrepancy(section: str, metric: str, location: str, reference, candidate) -> dict:
+    discrepancy = {'section': section, 'metric': metric, 'location': location,
+                   'reference': to_reported(reference), 'candidate': to_reported(candidate)}
+    if is_number(reference) and is_number(candidate) and not is_missing(reference) and not is_missing(candidate):
+        discrepancy['absDiff'] = abs(float(candidate) - float(reference))
+    return discrepancy
+
+
+def to_reported(value):
+    """
+    Converts a cell to a value of the JSON report, NaN being reported as 'NaN'.
+    """
+    if is_missing(value) and not isinstance(value, str):
+        return None if value is None else 'NaN'
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if is_number(value):
+        return value.item() if hasattr(value, 'item') else value
+    return str(value)
+
+
+def compare_frames(section: str, reference: pd.DataFrame, candidate: pd.DataFrame, rel_tol: float = 0.0,
+                   abs_tol: float = 0.0) -> list:
+    """
+    Compares every cell of two data frames of a WBR, like the `metrics` or the `box_totals`, column by column. Rows
+    are compared in order and named by their position and their `Axis` label, like '1 WOW'.
+
+    Args:
+        section (str): The name of the data frames in the discrepancies, like 'box_totals'.
+        reference (pd.DataFrame): The data frame of the reference engine.
+        candidate (pd.DataFrame): The data frame of the candidate engine.
+        rel_tol (float): The relative tolerance of numbers.
+        abs_tol (float): The absolute tolerance of numbers.
+
+    Returns:
+        list: The discrepancies, with the metric (the column), the location (the row) and both values.
+    """
+    discrepancies = []
+    for column in reference.columns:
+        if column not in candidate.columns:
+            discrepancies.append(get_discrepancy(section, str(column), 'column', 'present', 'missing'))
+    for column in candidate.columns:
+        if column not in reference.columns:
+            discrepancies.append(get_discrepancy(section, str(column), 'column', 'missing', 'present'))
+    if len(reference) != len(candidate):
+        discrepancies.append(get_discrepancy(section, '*', 'row count', len(reference), len(candidate)))
+
+    rows = min(len(reference), len(candidate))
+    labels = reference['Axis'].tolist() if 'Axis' in reference.columns else [''] * rows
+    for column in [column for column in reference.columns if column in candidate.columns]:
+        reference_values = reference[column].tolist()
+        candidate_values = candidate[column].tolist()
+        for row in range(rows):
+            if not values_match(reference_values[row], candidate_values[row], rel_tol, abs_tol):
+                discrepancies.append(get_discrepancy(section, str(column), f'{row} {labels[row]}'.strip(),
+                                                     reference_values[row], candidate_values[row]))
+    return discrepancies
+
+
+def compare_decks(reference, candidate, rel_tol: float = 0.0, abs_tol: float = 0.0) -> list:
+    """
+    Compares every value of two decks in their plain form, see `controller_utility.to_plain`. Discrepancies of a
+    block are attributed to the block, and to the row or line of the metric they are found in.
+
+    Args:
+        reference: The plain deck of the reference engine.
+        candidate: The plain deck of the candidate engine.
+        rel_tol (float): The relative tolerance of numbers.
+        abs_tol (float): The absolute tolerance of numbers.
+
+    Returns:
+        list: The discrepancies, with the metric, the location (the path of the value in the deck) and both values.
+    """
+    discrepancies = []
+
+    def compare(reference_value, candidate_value, path: str, metric: str):
+        if isinstance(reference_value, dict) and isinstance(candidate_value, dict):
+            metric = reference_value.get('rowHeader') or reference_value.get('legendName') or metric
+            for key in list(reference_value) + [key for key in candidate_value if key not in reference_value]:
+                if key not in candidate_value or key not in reference_value:
+                    discrepancies.append(get_discrepancy(
+                        'deck', metric, f'{path}.{key}', 'present' if key in reference_value else 'missing',
+                        'present' if key in candidate_value else 'missing'))
+                else:
+                    compare(reference_value[key], candidate_value[key], f'{path}.{key}', metric)
+        elif isinstance(reference_value, list) and isinstance(candidate_value, list):
+            if len(reference_value) != len(candidate_value):
+                discrepancies.append(get_discrepancy('deck', metric, f'{path} length', len(reference_value),
+                                                     len(candidate_value)))
+            for index, (reference_item, candidate_item) in enumerate(zip(reference_value, candidate_value)):
+                compare(reference_item, candidate_item, f'{path}[{index}]', metric)
+        elif not values_match(reference_value, candidate_value, rel_tol, abs_tol):
+            discrepancies.append(get_discrepancy('deck', metric, path, reference_value, candidate_value))
+
+    reference_blocks = reference.get('blocks', [])
+    candidate_blocks = candidate.get('blocks', [])
+    compare({key: value for key, value in reference.items() if key != 'blocks'},
+            {key: value for key, value in candidate.items() if key != 'blocks'}, 'deck', 'deck')
+    if len(reference_blocks) != len(candidate_blocks):
+        discrepancies.append(get_discrepancy('deck', 'deck', 'blocks length', len(reference_blocks),
+                                             len(candidate_blocks)))
+    for index, (reference_block, candidate_block) in enumerate(zip(reference_blocks, candidate_blocks)):
+        compare(reference_block, candidate_block, f'blocks[{index}]',
+                f"block {index + 1}: {reference_block.get('title') or reference_block.get('plotStyle')}")
+    return discrepancies
+
+
+def summarize(discrepancies: list) -> dict:
+    """
+    Groups discrepancies by section and metric.
+
+    Returns:
+        dict: For each section and metric, the number of cells which differ, the largest absolute difference of
+              numbers, and the first discrepancies.
+    """
+    summary = {}
+    for discrepancy in discrepancies:
+        metric = summary.setdefault(discrepancy['section'], {}).setdefault(
+            discrepancy['metric'], {'cells': 0, 'maxAbsDiff': None, 'examples': []})
+        metric['cells'] += 1
+        if 'absDiff' in discrepancy:
+            metric['maxAbsDiff'] = max(metric['maxAbsDiff'] or 0.0, discrepancy['absDiff'])
+        if len(metric['examples']) < example_count:
+            metric['examples'].append({key: value for key, value in discrepancy.items()
+                                       if key not in ('section', 'metric')})
+    return summary
+
+
+def build(engine, scenario: Path) -> tuple:
+    # The configuration is reloaded for every engine because building a report modifies it
+    with open(scenario / 'config.yaml') as config_file:
+        cfg = yaml.load(config_file, controller_util.SafeLineLoader)
+    wbr1 = engine(cfg, csv=str(scenario / 'original.csv'))
+    return wbr1, controller_util.to_plain(controller_util.get_wbr_deck(wbr1))
+
+
+def compare_engines(scenario: Path, reference, candidate, rel_tol: float = 0.0, abs_tol: float = 0.0) -> dict:
+    """
+    Builds the report of a scenario with both engines and compares every cell of their `metrics`, their
+    `box_totals` and their decks.
+
+    Args:
+        scenario (Path): The scenario folder, with an `original.csv` and a `config.yaml`.
+        reference: The reference engine, see `load_engine`.
+        candidate: The candidate engine.
+        rel_tol (float): The relative tolerance of numbers, 0 with an `abs_tol` of 0 requires equal numbers.
+        abs_tol (float): The absolute tolerance of numbers.
+
+    Returns:
+        dict: The scenario, whether both engines built the same report, the number of discrepancies and their
+              summary by section and metric. An engine failing to build the report is reported in `error`.
+    """
+    result = {'scenario': scenario.name}
+    try:
+        reference_wbr, reference_deck = build(reference, scenario)
+    except Exception as e:
+        logging.error(f"The reference engine failed to build {scenario.name}: {e}", exc_info=True)
+        return {**result, 'equivalent': False, 'error': f"Reference engine failed: {e}"}
+    try:
+        candidate_wbr, candidate_deck = build(candidate, scenario)
+    except Exception as e:
+        logging.error(f"The candidate engine failed to build {scenario.name}: {e}", exc_info=True)
+        return {**result, 'equivalent': False, 'error': f"Candidate engine failed: {e}"}
+
+    discrepancies = compare_frames('metrics', reference_wbr.metrics, candidate_wbr.metrics, rel_tol, abs_tol)
+    discrepancies += compare_frames('box_totals', reference_wbr.box_totals, candidate_wbr.box_totals, rel_tol,
+                                    abs_tol)
+    discrepancies += compare_decks(reference_deck, candidate_deck, rel_tol, abs_tol)
+    return {**result, 'equivalent': not discrepancies, 'discrepancies': len(discrepancies),
+            'metrics': summarize(discrepancies)}
+
+
+def run_comparison(candidate_spec: str, reference_spec: str = reference_engine, rel_tol: float = 0.0,
+                   abs_tol: float = 0.0, name_filter: str = None, folder: Path = benchmark.test_suite_folder,
+                   synthetic: int = 1) -> dict:
+    """
+    Compares two engines on every scenario of a folder, the unit test suite by default, and on generated
+    scenarios.
+
+    Args:
+        candidate_spec (str): The import path of the candidate engine, like 'mypackage.fast_wbr:FastWBR'.
+        reference_spec (str): The import path of the reference engine, the WBR class by default.
+        rel_tol (float): The relative tolerance of numbers.
+        abs_tol (float): The absolute tolerance of numbers.
+        name_filter (str): Only scenarios whose folder name contains the filter are compared.
+        folder (Path): The folder of the scenarios.
+        synthetic (int): The number of seeds each of the `synthetic_scenarios` is generated with, 0 generates none.
+
+    Returns:
+        dict: The engines, the tolerances, whether the engines built the same reports and the result of each
+              scenario.
+    """
+    reference = load_engine(reference_spec)
+    candidate = load_engine(candidate_spec)
+    scenarios = []
+    with tempfile.TemporaryDirectory(prefix='wbr-engine-comparison-') as directory:
+        for scenario in benchmark.get_scenarios(name_filter, folder):
+            scenarios.append(compare_engines(scenario, reference, candidate, rel_tol, abs_tol))
+        for seed in range(synthetic):
+            for index, arguments in enumerate(synthetic_scenarios):
+                scenario = Path(directory) / f'synthetic_{index + 1}_seed_{seed}'
+                if name_filter is not None and name_filter not in scenario.name:
+                    continue
+                dataset_generator.generate_scenario(str(scenario), seed=seed, **arguments)
+                scenarios.append(compare_engines(scenario, reference, candidate, rel_tol, abs_tol))
+
+    return {
+        'reference': reference_spec,
+        'candidate': candidate_spec,
+        'relTol': rel_tol,
+        'absTol': abs_tol,
+        'equivalent': all(scenario['equivalent'] for scenario in scenarios),
+        'scenarios': scenarios
+    }
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Compares the reports built by two WBR engines cell by cell.')
+    parser.add_argument('candidate', help='Import path of the candidate engine, like mypackage.fast_wbr:FastWBR')
+    parser.add_argument('--reference', default=reference_engine, help='Import path of the reference engine')
+    parser.add_argument('--rel-tol', type=float, default=0.0,
+                        help='Relative tolerance of numbers, numbers must be equal with both tolerances at 0')
+    parser.add_argument('--abs-tol', type=float, default=0.0, help='Absolute tolerance of numbers')
+    parser.add_argument('--scenario', help='Only compares scenarios whose name contains this')
+    parser.add_argument('--folder', default=str(benchmark.test_suite_folder), help='Folder of the scenarios')
+    parser.add_argument('--synthetic', type=int, default=1,
+                        help='Seeds each synthetic scenario is generated with, 0 compares no synthetic scenario')
+    parser.add_argument('--output', help='Writes the report to this JSON file instead of the standard output')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    report = run_comparison(args.candidate, args.reference, args.rel_tol, args.abs_tol, args.scenario,
+                            Path(args.folder), args.synthetic)
+    for scenario in report['scenarios']:
+        if scenario.get('error'):
+            logging.error(f"{scenario['scenario']}: {scenario['error']}")
+        elif not scenario['equivalent']:
+            for section, metrics in scenario['metrics'].items():
+                for metric, summary in metrics.items():
+                    logging.error(f"{scenario['scenario']} {section} {metric}: {summary['cells']} cells differ, "
+                                  f"max absolute difference {summary['maxAbsDiff']}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0 if report['equivalent'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import bisect
+import math
+import threading
+
+# Upper bounds of the latency histograms in seconds, the buckets of the Prometheus client libraries
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds of the histograms of dataset sizes in rows
+row_buckets = (100, 1000, 10000, 100000, 1000000, 10000000)
+# Upper bounds of the histograms of memory in bytes
+memory_buckets = tuple(2 ** power * 1024 * 1024 for power in range(0, 15, 2))
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if math.isnan(value):
+            return 'NaN'
+        return repr(value)
+    return str(value)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + '}'
+
+
+class Metric:
+    """
+    A metric in the Prometheus text exposition format, with a value per combination of its label values.
+
+    Attributes:
+        name (str): The name of the metric, like 'wbr_http_requests_total'.
+        documentation (str): The help text of the metric.
+        label_names (tuple): The names of the labels of the metric.
+    """
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} has the labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.get_key(labels), 0)
+
+    def samples(self):
+        """
+        Returns:
+            list: The (name, labels, value) of every sample of the metric.
+        """
+        with self.lock:
+            return [(self.name, dict(zip(self.label_names, key)), value) for key, value in sorted(self.values.items())]
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        lines.extend(f'{name}{format_labels(labels)} {format_value(value)}' for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """
+    A value which only goes up, like the number of requests.
+    """
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """
+        Sets the value from a counter kept elsewhere, like the hits of a cache, when the metrics are collected.
+        """
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Gauge(Metric):
+    """
+    A value which goes up and down, like the number of requests in flight.
+    """
+    metric_type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values, like request latencies, counted in cumulative buckets.
+
+    Attributes:
+        buckets (tuple): The upper bounds of the buckets, in increasing order. The +Inf bucket is added.
+    """
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = latency_buckets):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # The count of each bucket, the count of +Inf being the number of observations, and their sum
+                counts = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+
+    def get(self, **labels):
+        """
+        Returns:
+            tuple: The number and the sum of the observations with the given labels.
+        """
+        with self.lock:
+            counts = self.values.get(self.get_key(labels))
+            return (sum(counts[0]), counts[1]) if counts else (0, 0.0)
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(counts[0]), counts[1]) for key, counts in sorted(self.values.items())]
+
+        samples = []
+        for key, bucket_counts, total in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative += count
+                samples.append((self.name + '_bucket', {**labels, 'le': format_value(float(bound))}, cumulative))
+            samples.append((self.name + '_count', labels, cumulative))
+            samples.append((self.name + '_sum', labels, total))
+        return samples
+
+
+class Registry:
+    """
+    The metrics of the app, rendered in the Prometheus text exposition format by the /metrics endpoint. Values only
+    known when the metrics are scraped, like the counters of the caches, are set by collectors called first.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Args:
+            collector (function): Called without arguments before the metrics are rendered.
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'wbr_http_requests_total', 'Number of HTTP requests by route, method and status code.',
+    ('route', 'method', 'status')))
+http_request_duration = registry.register(Histogram(
+    'wbr_http_request_duration_seconds', 'Time taken to respond to HTTP requests by route.', ('route', 'method')))
+http_requests_in_flight = registry.register(Gauge(
+    'wbr_http_requests_in_flight', 'Number of HTTP requests being handled by route.', ('route',)))
+stage_duration = registry.register(Histogram(
+    'wbr_pipeline_stage_duration_seconds', 'Time taken by each stage of building and publishing reports.',
+    ('stage',)))
+dataset_rows = registry.register(Histogram(
+    'wbr_dataset_rows', 'Number of rows of the datasets reports are built from.', (), row_buckets))
+dataset_columns_processed = registry.register(Counter(
+    'wbr_dataset_columns_processed_total', 'Number of columns of the datasets reports were built from.'))
+report_memory_estimate = registry.register(Histogram(
+    'wbr_report_memory_estimate_bytes', 'Estimated peak memory of building each report, from the size of its data.',
+    (), memory_buckets))
+report_memory_peak = registry.register(Histogram(
+    'wbr_report_memory_peak_bytes', 'Growth of the resident memory of the process while building each report, '
+                                    'sampled during the build.', (), memory_buckets))
+dataset_memory = registry.register(Histogram(
+    'wbr_dataset_memory_bytes', 'Memory of the parsed data frame of each report.', (), memory_buckets))
+memory_reserved = registry.register(Gauge(
+    'wbr_memory_reserved_bytes', 'Estimated memory of the reports being built, out of the memory budget.'))
+memory_budget_bytes = registry.register(Gauge(
+    'wbr_memory_budget_bytes', 'Memory budget of the reports of the process, 0 when reports are not limited.'))
+memory_waiting = registry.register(Gauge(
+    'wbr_memory_waiting_reports', 'Number of reports waiting for memory to be released by other reports.'))
+memory_rejected = registry.register(Counter(
+    'wbr_memory_rejected_reports_total', 'Number of reports rejected for lack of memory since the start.'))
+resident_memory = registry.register(Gauge(
+    'wbr_process_resident_memory_bytes', 'Resident memory of the process.'))
+storage_duration = registry.register(Histogram(
+    'wbr_storage_operation_duration_seconds', 'Time taken to upload reports to and download them from the object '
+                                              'storage.', ('operation', 'backend')))
+cache_requests = registry.register(Counter(
+    'wbr_cache_requests_total', 'Number of lookups of each cache since the start, by outcome.', ('cache', 'result')))
+cache_hit_ratio = registry.register(Gauge(
+    'wbr_cache_hit_ratio', 'Share of the lookups of each cache served from it since the start.', ('cache',)))
+cache_entries = registry.register(Gauge(
+    'wbr_cache_entries', 'Number of entries held by each cache.', ('cache',)))
+report_cache_bytes = registry.register(Gauge(
+    'wbr_report_cache_bytes', 'Size of the published reports held in memory by the report cache.'))
+report_cache_evictions = registry.register(Counter(
+    'wbr_report_cache_evictions_total', 'Number of published reports evicted from memory since the start.'))
+background_uploads = registry.register(Gauge(
+    'wbr_background_uploads', 'Number of published reports queued or being uploaded in the background.'))
+failed_uploads = registry.register(Counter(
+    'wbr_failed_uploads_total', 'Number of background uploads which failed after all their retries since the start.'))
+
+
+def set_cache_metrics(cache: str, hits: int, misses: int, entries: int):
+    """
+    Sets the metrics of a cache from its counters.
+
+    Args:
+        cache (str): The name of the cache, the value of the cache label.
+        hits (int): The number of lookups served from the cache.
+        misses (int): The number of lookups which were not.
+        entries (int): The number of entries held by the cache.
+    """
+    cache_requests.set(hits, cache=cache, result='hit')
+    cache_requests.set(misses, cache=cache, result='miss')
+    cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache=cache)
+    cache_entries.set(entries, cache=cache)
@@ -0,0 +1,373 @@
+import contextvars
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# The recorder of the stages run by the current request or benchmark, None when nothing is recorded
+current_recorder = contextvars.ContextVar('stage_recorder', default=None)
+
+# The modules whose functions are listed with their times in a profile, the whole stack is kept in its flame graph
+profiled_modules = ('wbr.py', 'wbr_utility.py', 'controller_utility.py')
+source_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+class StageRecorder:
+    """
+    Records the wall time, and optionally the memory, of the stages of building a report. Stages are marked in the
+    code with the `stage` context manager, which does nothing unless a recorder is active.
+
+    The time of a stage excludes the stages nested in it, so the times of all stages add up to the time spent in
+    stages. The peak memory of a stage includes its nested stages.
+
+    Attributes:
+        trace_memory (bool): Records the peak memory and the allocated blocks of each stage with tracemalloc, which
+                             slows the stages down.
+        stages (dict): The recorded stages by name, in the order they first ran, with their number of calls, time in
+                       seconds, peak memory in bytes and net number of allocated memory blocks.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.active = []
+
+    def enter(self, name: str):
+        frame = {'name': name, 'started': time.perf_counter(), 'nested': 0.0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.active:
+                # The peak of the enclosing stage so far, the peak is reset to measure this stage
+                self.active[-1]['peak'] = max(self.active[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame.update({'memory': current, 'peak': current, 'blocks': sys.getallocatedblocks()})
+        self.active.append(frame)
+
+    def exit(self):
+        frame = self.active.pop()
+        elapsed = time.perf_counter() - frame['started']
+        stage = self.stages.setdefault(frame['name'], {'calls': 0, 'seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += elapsed - frame['nested']
+        if self.active:
+            self.active[-1]['nested'] += elapsed
+
+        if self.trace_memory:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            stage['peakBytes'] = max(stage.get('peakBytes', 0), peak - frame['memory'])
+            stage['allocatedBlocks'] = stage.get('allocatedBlocks', 0) + sys.getallocatedblocks() - frame['blocks']
+            if self.active:
+                self.active[-1]['peak'] = max(self.active[-1]['peak'], peak)
+
+    def total_seconds(self):
+        return sum(stage['seconds'] for stage in self.stages.values())
+
+
+@contextmanager
+def record_stages(trace_memory: bool = False):
+    """
+    Records the stages run in the current context, threads started meanwhile are not recorded.
+
+    Args:
+        trace_memory (bool): Records the memory of each stage as well, tracing is started if it is not running.
+
+    Returns:
+        StageRecorder: The recorder, filled as the stages run.
+    """
+    recorder = StageRecorder(trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Marks a stage of building a report, recorded by the active recorder if any.
+
+    Args:
+        name (str): The name of the stage, like 'box_totals'.
+    """
+    recorder = current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    recorder.enter(name)
+    try:
+        yield
+    finally:
+        recorder.exit()
+
+
+def get_profile(recorder: StageRecorder, total_seconds: float = None) -> dict:
+    """
+    Summarizes the recorded stages in milliseconds, like for the profile section of a response.
+
+    Args:
+        recorder (StageRecorder): The recorder of the stages.
+        total_seconds (float): The time of the whole request, defaults to the time spent in stages.
+
+    Returns:
+        dict: The total time and the time and number of calls of each stage, in the order they first ran.
+    """
+    total_seconds = recorder.total_seconds() if total_seconds is None else total_seconds
+    return {
+        'totalMs': round(total_seconds * 1000, 2),
+        'stages': {name: {'calls': stage['calls'], 'ms': round(stage['seconds'] * 1000, 2)}
+                   for name, stage in recorder.stages.items()}
+    }
+
+
+def get_server_timing(recorder: StageRecorder, total_seconds: float = None) -> str:
+    """
+    Formats the recorded stages as the value of a Server-Timing header, shown by the network panel of browsers.
+
+    Args:
+        recorder (StageRecorder): The recorder of the stages.
+        total_seconds (float): The time of the whole request, added as the `total` metric when given.
+
+    Returns:
+        str: The header value, like 'validate;dur=12.5, deck;dur=3.1, total;dur=20.4'.
+    """
+    metrics = [f"{name};dur={stage['seconds'] * 1000:.2f}" for name, stage in recorder.stages.items()]
+    if total_seconds is not None:
+        metrics.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ', '.join(metrics)
+
+
+def get_dominant_stage(recorder: StageRecorder):
+    """
+    Returns:
+        str: The name of the stage which took the most time, None if no stage was recorded.
+    """
+    return max(recorder.stages, key=lambda name: recorder.stages[name]['seconds'], default=None)
+
+
+class SlowReportLog:
+    """
+    A thread safe log of the slowest report builds since the start of the process. Once it is full, a report only
+    enters the log if it was slower than the fastest report logged, which leaves the log.
+
+    Attributes:
+        size (int): The number of reports kept, 0 keeps none.
+        recorded (int): The number of reports offered to the log.
+    """
+
+    def __init__(self, size: int = 50):
+        self.size = size
+        self.recorded = 0
+        self.heap = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, entry: dict) -> bool:
+        """
+        Args:
+            entry (dict): The report build, with its time in milliseconds in `totalMs`.
+
+        Returns:
+            bool: True if the report is kept as one of the slowest.
+        """
+        if self.size <= 0:
+            return False
+        # The sequence breaks ties between reports of the same time, the earlier one leaves the log first
+        item = (entry['totalMs'], next(self.sequence), entry)
+        with self.lock:
+            self.recorded += 1
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, item)
+                return True
+            if item[0] <= self.heap[0][0]:
+                return False
+            heapq.heapreplace(self.heap, item)
+            return True
+
+    def entries(self) -> list:
+        """
+        Returns:
+            list: The logged report builds, from the slowest.
+        """
+        with self.lock:
+            return [entry for _, _, entry in sorted(self.heap, key=lambda item: (-item[0], item[1]))]
+
+
+def get_frame_name(code) -> str:
+    """
+    Names a function in a stack of a profile, like 'create_wbr_metrics (src/wbr.py:152)'. Files of the app are named
+    from the root of the project, files of libraries from their site-packages folder.
+    """
+    filename = code.co_filename
+    if filename.startswith(os.path.dirname(source_folder) + os.sep):
+        filename = os.path.relpath(filename, os.path.dirname(source_folder))
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackProfiler:
+    """
+    Profiles a function call of the current thread by its stacks, in either of two modes:
+
+    - 'deterministic' follows every call and return of Python functions with sys.setprofile, which gives the exact
+      number of calls and time of each stack, and slows the profiled code down several times.
+    - 'sampling' takes the stack of the thread every interval from another thread, which barely slows the profiled
+      code down. Times are estimated from the number of samples and calls are not counted.
+
+    Calls of C functions are attributed to the Python function calling them. Threads started by the profiled code,
+    like the threads building the blocks of a deck in parallel, are not profiled.
+
+    Attributes:
+        mode (str): 'deterministic' or 'sampling'.
+        interval (float): The interval between two samples in seconds.
+        stacks (Counter): The seconds spent in each stack, a tuple of frame names from the outermost call.
+        calls (Counter): The number of calls of each frame, counted in deterministic mode only.
+    """
+
+    def __init__(self, mode: str = 'deterministic', interval: float = 0.005):
+        if mode not in ('deterministic', 'sampling'):
+            raise ValueError(f"Unsupported profiler {mode}, use deterministic or sampling")
+        self.mode = mode
+        self.interval = interval
+        self.stacks = Counter()
+        self.calls = Counter()
+        self.seconds = 0.0
+
+    def run(self, function):
+        """
+        Calls the function under the profiler.
+
+        Args:
+            function (function): Called without arguments.
+
+        Returns:
+            The value returned by the function.
+        """
+        started = time.perf_counter()
+        try:
+            if self.mode == 'sampling':
+                return self.run_sampled(function)
+            return self.run_traced(function)
+        finally:
+            self.seconds = time.perf_counter() - started
+
+    def run_traced(self, function):
+        stack = []
+        # The stack of the frames active when profiling starts is not recorded, only the calls made since
+        last_event = [time.perf_counter()]
+
+        def profile(frame, event, arg):
+            if event not in ('call', 'return'):
+                return
+            now = time.perf_counter()
+            if stack:
+                self.stacks[tuple(stack)] += now - last_event[0]
+            if event == 'call':
+                name = get_frame_name(frame.f_code)
+                stack.append(name)
+                self.calls[name] += 1
+            elif stack:
+                stack.pop()
+            last_event[0] = time.perf_counter()
+
+        sys.setprofile(profile)
+        try:
+            return function()
+        finally:
+            sys.setprofile(None)
+
+    def run_sampled(self, function):
+        thread_id = threading.get_ident()
+        outer_frames = len(get_stack(sys._getframe()))
+        finished = threading.Event()
+
+        def sample():
+            while not finished.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    # The frames of the profiler and of its callers are left out
+                    stack = tuple(get_stack(frame)[outer_frames:])
+                    if stack:
+                        self.stacks[stack] += self.interval
+
+        sampler = threading.Thread(target=sample, name='stack-sampler', daemon=True)
+        sampler.start()
+        try:
+            return function()
+        finally:
+            finished.set()
+            sampler.join()
+
+    def get_functions(self, modules: tuple = profiled_modules) -> list:
+        """
+        Sums the time of the functions of the given modules over the stacks, from the slowest.
+
+        Args:
+            modules (tuple): The file names of the modules, like 'wbr.py'.
+
+        Returns:
+            list: The name, number of calls, own time and cumulative time in seconds of each function. The own time
+                  excludes the functions it called, the cumulative time includes them.
+        """
+        own = Counter()
+        cumulative = Counter()
+        for stack, seconds in self.stacks.items():
+            own[stack[-1]] += seconds
+            # A recursive function is counted once per stack
+            for name in set(stack):
+                cumulative[name] += seconds
+
+        def is_profiled(name):
+            return name.rsplit(' (', 1)[1].split(':')[0].replace(os.sep, '/').rsplit('/', 1)[-1] in modules
+
+        return [{'function': name, 'calls': self.calls.get(name) if self.mode == 'deterministic' else None,
+                 'ownSeconds': round(own[name], 6), 'cumulativeSeconds': round(seconds, 6)}
+                for name, seconds in cumulative.most_common() if is_profiled(name)]
+
+    def get_collapsed_stacks(self, library_frames: int = 3) -> str:
+        """
+        Formats the stacks in the collapsed format of flamegraph.pl, speedscope and most flame graph viewers, a line
+        per stack with its frames separated by semicolons and its time in microseconds.
+
+        Args:
+            library_frames (int): The number of frames kept below the last frame of the app, the time of deeper
+                                  frames of libraries like pandas is attributed to the last frame kept.
+
+        Returns:
+            str: The collapsed stacks.
+        """
+        app_folder = os.path.basename(source_folder) + '/'
+        folded = Counter()
+        for stack, seconds in self.stacks.items():
+            app_frames = [index for index, name in enumerate(stack) if f'({app_folder}' in name.replace(os.sep, '/')]
+            folded[stack[:app_frames[-1] + 1 + library_frames] if app_frames else stack] += seconds
+
+        return ''.join(f"{';'.join(stack)} {round(seconds * 1000000)}\n"
+                       for stack, seconds in sorted(folded.items()) if round(seconds * 1000000) > 0)
+
+    def get_profile(self) -> dict:
+        return {
+            'mode': self.mode,
+            'seconds': round(self.seconds, 6),
+            'functions': self.get_functions(),
+            'collapsedStacks': self.get_collapsed_stacks()
+        }
+
+
+def get_stack(frame) -> list:
+    stack = []
+    while frame is not None:
+        stack.append(get_frame_name(frame.f_code))
+        frame = frame.f_back
+    return stack[::-1]
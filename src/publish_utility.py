@@ -1,12 +1,170 @@
+import base64
+import datetime
+import functools
+import gzip
+import hashlib
+import hmac
+import itertools
 import json
 import logging
 import os
-from pathlib import Path
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient
-from google.cloud import storage
+import src.metrics_utility as metrics_util
+from src.storage_backend import content_encoding_suffixes, create_storage_backend
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Size of the characters serialized JSON is encoded in, and of the parts it is uploaded in. S3 parts are 5 MB at
+# least and GCP resumable upload chunks are multiples of 256 KB.
+json_chunk_size = 1024 * 1024
+minimum_upload_part_size = 5 * 1024 * 1024
+upload_part_size_multiple = 256 * 1024
+
+# Iterations of PBKDF2-SHA256 the passwords of protected reports are hashed with
+password_hash_iterations = 200000
+
+
+class ReportCache:
+    """
+    A read-through, least recently used cache of downloaded reports, keyed by their object path. Published reports
+    never change once written, so cached reports are never invalidated, only evicted when the cache is full. Reports
+    are kept in memory as they are stored, compressed, and optionally in a directory on disk as a second tier which
+    survives restarts and is shared by the worker processes of a host.
+
+    Attributes:
+        max_bytes (int): The size limit of the reports kept in memory, 0 disables the in-memory tier.
+        disk_path (str): The directory of the on-disk tier, None disables it.
+        max_disk_bytes (int): The size limit of the reports kept on disk.
+        hits (int): Number of downloads served from memory.
+        disk_hits (int): Number of downloads served from disk.
+        misses (int): Number of downloads which went to the object storage.
+        evictions (int): Number of reports evicted from memory.
+    """
+
+    def __init__(self, max_bytes: int, disk_path: str = None, max_disk_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self.reports = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+
+    def get(self, path: str):
+        """
+        Looks a report up in memory and then on disk, counting the outcome.
+
+        Args:
+            path (str): The object path of the report.
+
+        Returns:
+            tuple: The stored bytes and their content encoding, or None if the report is not cached.
+        """
+        with self.lock:
+            if path in self.reports:
+                self.reports.move_to_end(path)
+                self.hits += 1
+                return self.reports[path]
+
+        report = self.read_from_disk(path)
+        with self.lock:
+            if report is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self.put_in_memory(path, report)
+        return report
+
+    def put(self, path: str, body: bytes, content_encoding):
+        """
+        Caches a downloaded or uploaded report in memory and on disk.
+
+        Args:
+            path (str): The object path of the report.
+            body (bytes): The stored bytes of the report.
+            content_encoding (str): The content encoding of the bytes.
+        """
+        self.put_in_memory(path, (body, content_encoding))
+        self.write_to_disk(path, body, content_encoding)
+
+    def put_in_memory(self, path: str, report: tuple):
+        if len(report[0]) > self.max_bytes:
+            return
+        with self.lock:
+            if path in self.reports:
+                self.size -= len(self.reports.pop(path)[0])
+            self.reports[path] = report
+            self.size += len(report[0])
+            while self.size > self.max_bytes:
+                self.size -= len(self.reports.popitem(last=False)[1][0])
+                self.evictions += 1
+
+    def read_from_disk(self, path: str):
+        if not self.disk_path:
+            return None
+        report = read_encoded_file(self.disk_path, path)
+        if report is not None:
+            # The modification time orders the files from the least to the most recently used
+            try:
+                os.utime(get_encoded_file(self.disk_path, path, report[1]))
+            except OSError:
+                pass
+        return report
+
+    def write_to_disk(self, path: str, body: bytes, content_encoding):
+        if not self.disk_path or len(body) > self.max_disk_bytes:
+            return
+        try:
+            write_encoded_file(self.disk_path, path, body, content_encoding)
+            self.evict_from_disk()
+        except OSError as e:
+            # The disk tier is best effort, the report is still served from memory or the object storage
+            logging.warning(f"Failed to cache {path} on disk: {e}")
+
+    def evict_from_disk(self):
+        files = []
+        for entry in os.scandir(self.disk_path):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        disk_size = sum(size for _, size, _ in files)
+        for _, size, file in sorted(files):
+            if disk_size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            disk_size -= size
+
+    def stats(self):
+        """
+        Returns:
+            dict: The counters of the cache and the number and size of the reports in memory.
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'diskHits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'reports': len(self.reports),
+                'bytes': self.size
+            }
 
 
 class PublishWbr:
@@ -15,11 +173,16 @@ class PublishWbr:
     such as AWS S3, GCP, and Azure. If no storage option is provided, files are saved locally.
 
     Attributes:
-        storage_option (str): The storage service to use ('s3', 'gcp', 'azure', or local).
+        storage_option (str): The storage service to use ('s3', 'gcp', 'azure', 'memory' or local).
         object_storage_bucket (str): The bucket or container name in the chosen storage service.
-        s3_client (boto3.client): The client object for S3 interaction (used if storage_option is 's3').
-        gcp_client (google.cloud.storage.Client): The client object for GCP interaction (used if storage_option is 'gcp').
-        azure_client (azure.storage.blob.BlobServiceClient): The client object for Azure interaction (used if storage_option is 'azure').
+        backend (StorageBackend): The storage backend registered for the storage option.
+        content_encoding (str): The encoding reports are compressed with ('gzip', 'br'), None stores them uncompressed.
+        cache (ReportCache): The cache of downloaded reports.
+        upload_workers (int): Number of threads uploading reports in the background, 0 uploads them while the
+                              publishing request waits.
+        spool_path (str): The directory reports wait in until their background upload completes.
+        upload_part_size (int): Size of the parts a large report is uploaded in.
+        upload_concurrency (int): Number of parts of a report uploaded at the same time.
     """
 
     def __init__(self, storage_option, object_storage_bucket):
@@ -27,75 +190,146 @@ class PublishWbr:
         Initializes the PublishWbr class based on the chosen storage option.
 
         Args:
-           storage_option (str): The storage service to use ('s3', 'gcp', 'azure', or local).
+           storage_option (str): The storage service to use ('s3', 'gcp', 'azure', 'memory' or local).
            object_storage_bucket (str): The bucket or container name in the chosen storage service.
 
         Raises:
            Warning: Logs a warning if no storage option is provided.
         """
-        self.s3_client = None
-        self.gcp_client = None
-        self.azure_client = None
         self.object_storage_bucket = object_storage_bucket
         self.storage_option = storage_option
+        self.content_encoding = get_content_encoding(os.environ.get("PUBLISH_COMPRESSION"))
+        self.cache = ReportCache(int(os.environ.get("PUBLISH_CACHE_MAX_BYTES") or 64 * 1024 * 1024),
+                                 os.environ.get("PUBLISH_CACHE_DIR"),
+                                 int(os.environ.get("PUBLISH_CACHE_DISK_MAX_BYTES") or 1024 * 1024 * 1024))
+
+        part_size = max(int(os.environ.get("PUBLISH_UPLOAD_PART_SIZE") or 8 * 1024 * 1024), minimum_upload_part_size)
+        self.upload_part_size = -(-part_size // upload_part_size_multiple) * upload_part_size_multiple
+        self.upload_concurrency = int(os.environ.get("PUBLISH_UPLOAD_CONCURRENCY") or 4)
+
+        self.upload_workers = int(os.environ.get("PUBLISH_UPLOAD_WORKERS") or 0)
+        self.upload_retries = int(os.environ.get("PUBLISH_UPLOAD_RETRIES") or 3)
+        self.spool_path = os.environ.get("PUBLISH_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), 'wbr-spool')
+        self.upload_executor = None
+        self.pending_uploads = None
+        self.failed_uploads = 0
+        self.background_uploads = 0
+        self.upload_lock = threading.Lock()
+        if self.upload_workers > 0:
+            self.upload_executor = ThreadPoolExecutor(max_workers=self.upload_workers,
+                                                      thread_name_prefix='report-upload')
+            # Publishing waits for a free slot once this many uploads are queued or running
+            self.pending_uploads = threading.BoundedSemaphore(self.upload_workers * 4)
+            os.makedirs(self.spool_path, exist_ok=True)
+
+        # Keep a connection per upload worker and part in the pool of the client, shared by all threads
+        self.backend = create_storage_backend(storage_option, object_storage_bucket, self.upload_part_size,
+                                              self.upload_concurrency,
+                                              max(10, self.upload_workers * 2, self.upload_concurrency * 2))
+
+    def upload(self, data, destination_file_path, content_type: str = 'application/json'):
+        """
+        Uploads data to the selected object storage or saves it locally if no storage option is selected. The data
+        is compressed with the content encoding of the publisher, which is recorded as the Content-Encoding of the
+        object, or as the suffix of the file when it is saved locally.
 
-        if storage_option == "s3":
-            aws_access_key_id = os.environ.get("S3_STORAGE_KEY") or None
-            s3config = {
-                "region_name": os.environ.get("S3_REGION_NAME") or "",
-                "aws_access_key_id": aws_access_key_id,
-                "aws_secret_access_key": os.environ.get("S3_STORAGE_SECRET") or ""
-            }
-            if os.environ.get("S3_STORAGE_ENDPOINT"):
-                s3config["endpoint_url"] = os.environ.get("S3_STORAGE_ENDPOINT")
-            self.s3_client = boto3.client('s3', **s3config) if aws_access_key_id else boto3.client('s3')
-
-        elif storage_option == "gcp":
-            gcp_service_account_json_file = os.getenv("GCP_SERVICE_ACCOUNT_PATH")  # JSON file path
-            self.gcp_client = get_gcp_client_for_credentials(gcp_service_account_json_file) \
-                if gcp_service_account_json_file else get_gcp_client_for_iam()
-
-        elif storage_option == "azure":
-            azure_connection_string = os.getenv("AZURE_CONNECTION_STRING")
-            self.azure_client = BlobServiceClient.from_connection_string(azure_connection_string) \
-                if azure_connection_string else get_azure_from_default_credentials()
-
-        else:
-            logging.warning("No OBJECT_STORAGE_OPTION is provided hence the published report will be saved locally")
+        The data is serialized and compressed in chunks which are streamed to the storage in parts of the upload
+        part size, so a large report is never held in memory uncompressed. The parts are kept for the report cache
+        while they fit into its memory, a larger report is cached when it is first downloaded.
 
-    def upload(self, data, destination_file_path):
-        """
-        Uploads data to the selected object storage or saves it locally if no storage option is selected.
+        With upload workers the data is streamed to the spool directory and uploaded from there on a worker thread,
+        the method returns without waiting for the upload. Downloads read the spooled report until the upload
+        completes.
 
         Args:
-            data (list|dict): The data to upload.
+            data (list|dict|str): The data to upload, either already serialized to JSON or to be serialized.
             destination_file_path (str): The destination file path in the object storage or local directory.
+            content_type (str): The content type of the data, like 'text/html' for the HTML snapshot of a report.
 
         Raises:
             Exception: Raises exceptions specific to the storage service (if any occur).
         """
-        if self.storage_option == "s3":
-            byte_data = bytes(json.dumps(data).encode('utf-8'))
-            self.s3_client.put_object(Body=byte_data, Bucket=self.object_storage_bucket, Key=destination_file_path)
+        parts = iter_parts(compress_chunks(iter_json_chunks(data), self.content_encoding), self.upload_part_size)
+        kept_parts = KeptParts(self.cache.max_bytes)
 
-        elif self.storage_option == "gcp":
-            byte_data = bytes(json.dumps(data).encode('utf-8'))
-            bucket = self.gcp_client.bucket(self.object_storage_bucket)
-            blob = bucket.blob(destination_file_path)
-            blob.upload_from_string(byte_data, content_type='application/json')
+        if self.upload_executor is None:
+            self.upload_to_storage(kept_parts.keep(parts), destination_file_path, content_type)
+        else:
+            write_encoded_file(self.spool_path, destination_file_path, kept_parts.keep(parts), self.content_encoding)
+
+        # Reports are immutable, the next download of the report is served from the cache
+        byte_data = kept_parts.get_bytes()
+        if byte_data is not None:
+            self.cache.put(destination_file_path, byte_data, self.content_encoding)
+        if self.upload_executor is None:
+            return
+
+        self.pending_uploads.acquire()
+        with self.upload_lock:
+            self.background_uploads += 1
+        try:
+            self.upload_executor.submit(self.upload_spooled_report, destination_file_path, content_type)
+        except Exception:
+            with self.upload_lock:
+                self.background_uploads -= 1
+            self.pending_uploads.release()
+            raise
+
+    def upload_spooled_report(self, destination_file_path, content_type: str = 'application/json'):
+        """
+        Uploads a spooled report, retrying with an exponential backoff. The spooled report is read a part at a time,
+        and removed once it is uploaded. A report which could not be uploaded stays in the spool directory and is
+        still served from there.
 
-        elif self.storage_option == "azure":
-            byte_data = bytes(json.dumps(data).encode('utf-8'))
-            blob_client = self.azure_client.get_blob_client(container=self.object_storage_bucket,
-                                                            blob=destination_file_path)
-            blob_client.upload_blob(byte_data)
+        Args:
+            destination_file_path (str): The destination file path in the object storage or local directory.
+            content_type (str): The content type of the report.
+        """
+        try:
+            for attempt in range(self.upload_retries + 1):
+                try:
+                    with open(get_encoded_file(self.spool_path, destination_file_path, self.content_encoding),
+                              'rb') as spooled_file:
+                        spooled_parts = iter(functools.partial(spooled_file.read, self.upload_part_size), b'')
+                        self.upload_to_storage(iter_parts(spooled_parts, self.upload_part_size),
+                                               destination_file_path, content_type)
+                    remove_encoded_file(self.spool_path, destination_file_path, self.content_encoding)
+                    return
+                except Exception as e:
+                    if attempt == self.upload_retries:
+                        with self.upload_lock:
+                            self.failed_uploads += 1
+                        logging.error(f"Failed to upload {destination_file_path} after {attempt + 1} attempts, it is "
+                                      f"kept in {self.spool_path}", exc_info=True)
+                        return
+                    logging.warning(f"Upload of {destination_file_path} failed, retrying: {e}")
+                    time.sleep(0.5 * 2 ** attempt)
+        finally:
+            with self.upload_lock:
+                self.background_uploads -= 1
+            self.pending_uploads.release()
+
+    def upload_to_storage(self, parts, destination_file_path, content_type: str = 'application/json'):
+        """
+        Uploads compressed data to the selected object storage or saves it locally, bypassing the spool and the
+        report cache. Data of a single part is uploaded in one request, larger data is streamed to the storage
+        backend part by part, as a multipart upload to S3, a resumable upload to GCP or a block blob to Azure.
 
+        Args:
+            parts (iterator): The compressed data, in parts of the upload part size.
+            destination_file_path (str): The destination file path in the object storage or local directory.
+            content_type (str): The content type of the data.
+        """
+        started = time.perf_counter()
+        first_part = next(parts, b'')
+        second_part = next(parts, None)
+        if second_part is None:
+            self.backend.put_object(first_part, destination_file_path, self.content_encoding, content_type)
         else:
-            path = str(Path(os.path.dirname(__file__)).parent)
-            file_path = path + '/publish/' + destination_file_path
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, 'w') as json_file:
-                json.dump(data, json_file, indent=4)
+            parts = itertools.chain([first_part, second_part], parts)
+            self.backend.upload_parts(parts, destination_file_path, self.content_encoding, content_type)
+        metrics_util.storage_duration.observe(time.perf_counter() - started, operation='upload',
+                                              backend=type(self.backend).__name__)
 
     def download(self, path):
         """
@@ -110,68 +344,338 @@ class PublishWbr:
         Raises:
             Exception: Raises exceptions specific to the storage service (if any occur).
         """
-        if self.storage_option == "s3":
-            response = self.s3_client.get_object(Bucket=self.object_storage_bucket, Key=path)
-            json_file_content = response['Body'].read()
-            return json.loads(json_file_content)
+        body, content_encoding = self.download_encoded(path)
+        return json.loads(decompress(body, content_encoding))
 
-        elif self.storage_option == "gcp":
-            bucket = self.gcp_client.bucket(self.object_storage_bucket)
-            blob = bucket.blob(path)
-            return json.loads(blob.download_as_string(client=None))
+    def download_encoded(self, path):
+        """
+        Downloads data from the selected object storage or locally without decompressing it. Reports published
+        before they were compressed are returned as they are, with no content encoding. Downloads are served from
+        the report cache when possible.
 
-        elif self.storage_option == "azure":
-            blob_client = self.azure_client.get_blob_client(container=self.object_storage_bucket,
-                                                            blob=path)
-            stream = blob_client.download_blob()
-            return json.loads(stream.readall())
+        Args:
+            path (str): The file path in the object storage or local directory.
 
-        else:
-            base_path = str(Path(os.path.dirname(__file__)).parent)
-            file = base_path + '/publish/' + path
-            current_file = open(file)
-            return json.load(current_file)
+        Returns:
+            tuple: The stored bytes and their content encoding ('gzip', 'br' or None).
+
+        Raises:
+            Exception: Raises exceptions specific to the storage service (if any occur).
+        """
+        report = self.cache.get(path)
+        if report is None and self.upload_executor is not None:
+            # The report may still be waiting for its upload
+            report = read_encoded_file(self.spool_path, path)
+        if report is None:
+            report = self.download_from_storage(path)
+            self.cache.put(path, *report)
+        return report
+
+    def download_from_storage(self, path):
+        """
+        Downloads data from the selected object storage or locally, bypassing the report cache.
+
+        Args:
+            path (str): The file path in the object storage or local directory.
+
+        Returns:
+            tuple: The stored bytes and their content encoding ('gzip', 'br' or None).
+        """
+        started = time.perf_counter()
+        report = self.backend.get_object(path)
+        metrics_util.storage_duration.observe(time.perf_counter() - started, operation='download',
+                                              backend=type(self.backend).__name__)
+        return report
 
 
-def get_gcp_client_for_iam():
+def iter_json_chunks(data):
     """
-    Initializes a GCP storage client using IAM credentials.
+    Serializes data to JSON in chunks of bytes. Data already serialized is encoded a slice at a time, other data is
+    serialized incrementally.
+
+    Args:
+        data (list|dict|str|bytes): The data to serialize.
 
     Returns:
-        google.cloud.storage.Client: The GCP storage client initialized with IAM credentials.
+        iterator: The UTF-8 encoded JSON, in chunks.
     """
-    return storage.Client()
+    if isinstance(data, bytes):
+        for start in range(0, len(data), json_chunk_size):
+            yield data[start:start + json_chunk_size]
+    elif isinstance(data, str):
+        for start in range(0, len(data), json_chunk_size):
+            yield data[start:start + json_chunk_size].encode('utf-8')
+    else:
+        for chunk in json.JSONEncoder().iterencode(data):
+            yield chunk.encode('utf-8')
+
+
+def compress_chunks(chunks, content_encoding):
+    """
+    Compresses a stream of chunks with the given content encoding, the compressed chunks joined together are a
+    single gzip or brotli stream.
 
+    Args:
+        chunks (iterator): The chunks of bytes to compress.
+        content_encoding (str): 'gzip', 'br' or None to leave the chunks as they are.
 
-def get_gcp_client_for_credentials(credentials_json_file):
+    Returns:
+        iterator: The compressed chunks.
+    """
+    if content_encoding is None:
+        yield from chunks
+        return
+    if content_encoding == 'gzip':
+        # wbits of 16 + MAX_WBITS writes a gzip header and trailer, the header has no modification time
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress_chunk, flush = compressor.compress, compressor.flush
+    else:
+        compressor = brotli.Compressor()
+        compress_chunk, flush = compressor.process, compressor.finish
+    for chunk in chunks:
+        compressed = compress_chunk(chunk)
+        if compressed:
+            yield compressed
+    yield flush()
+
+
+def iter_parts(chunks, part_size: int):
     """
-    Initializes a GCP storage client using a service account JSON.
+    Regroups a stream of chunks into parts of the given size, the last part may be smaller.
 
     Args:
-        credentials_json_file (str): The JSON string containing the GCP service account credentials.
+        chunks (iterator): The chunks of bytes.
+        part_size (int): The size of the parts.
 
     Returns:
-        google.cloud.storage.Client: The GCP storage client initialized with the provided service account JSON.
+        iterator: The parts, at least one even when there is no data.
+    """
+    buffer = bytearray()
+    produced = False
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+            produced = True
+    if buffer or not produced:
+        yield bytes(buffer)
+
+
+class KeptParts:
+    """
+    Keeps the parts of a report streamed to the storage or the spool while their total size fits into a limit, to
+    cache the report once it is uploaded. The parts kept so far are released as soon as the report outgrows the
+    limit, so a large report is never held in memory in full.
 
-    Raises:
-        Exception: If the client initialization fails, an exception is raised and logged.
+    Attributes:
+        max_bytes (int): The size limit of the kept parts, the size limit of the in-memory report cache.
+        parts (list): The kept parts, None once the report outgrew the limit.
+        size (int): The size of the parts streamed so far.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.parts = []
+        self.size = 0
+
+    def keep(self, parts):
+        """
+        Passes the parts through, keeping them while they fit into the size limit.
+
+        Args:
+            parts (iterator): The parts of the report.
+
+        Returns:
+            iterator: The same parts.
+        """
+        for part in parts:
+            self.size += len(part)
+            if self.parts is not None:
+                if self.size <= self.max_bytes:
+                    self.parts.append(part)
+                else:
+                    self.parts = None
+            yield part
+
+    def get_bytes(self):
+        """
+        Returns:
+            bytes: The report joined from its kept parts, None if it outgrew the size limit.
+        """
+        return None if self.parts is None else b''.join(self.parts)
+
+
+def get_encoded_file(directory: str, path: str, content_encoding):
+    """
+    Names the file a report is kept in outside of the object storage, in the report cache or the upload spool.
+
+    Args:
+        directory (str): The directory of the file.
+        path (str): The object path of the report.
+        content_encoding (str): The content encoding of the report.
+
+    Returns:
+        str: The file path, named after a hash of the object path and suffixed with the content encoding.
     """
+    name = hashlib.sha256(path.encode('utf-8')).hexdigest()
+    return os.path.join(directory, name + content_encoding_suffixes.get(content_encoding, '.json'))
+
+
+def read_encoded_file(directory: str, path: str):
+    """
+    Reads a report kept in a directory by write_encoded_file.
+
+    Returns:
+        tuple: The bytes of the report and their content encoding, or None if the report is not in the directory.
+    """
+    for content_encoding in list(content_encoding_suffixes) + [None]:
+        try:
+            with open(get_encoded_file(directory, path, content_encoding), 'rb') as encoded_file:
+                return encoded_file.read(), content_encoding
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def write_encoded_file(directory: str, path: str, body, content_encoding):
+    """
+    Keeps a report in a directory, the file is written under a temporary name first so that other threads and
+    processes never read a partially written report. The body is the bytes of the report, or an iterator of its
+    parts written as they come.
+    """
+    file = get_encoded_file(directory, path, content_encoding)
+    temp_file = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file, 'wb') as encoded_file:
+        for part in [body] if isinstance(body, bytes) else body:
+            encoded_file.write(part)
+    os.replace(temp_file, file)
+
+
+def remove_encoded_file(directory: str, path: str, content_encoding):
     try:
-        with open(credentials_json_file, mode="r") as credentials_json:
-            # Initialize GCP client with the IAM credentials file
-            return storage.Client.from_service_account_json(credentials_json.name)
+        os.remove(get_encoded_file(directory, path, content_encoding))
+    except FileNotFoundError:
+        pass
+
+
+def get_content_encoding(compression):
+    """
+    Resolves the content encoding published reports are compressed with, gzip unless configured otherwise.
+
+    Args:
+        compression (str): The configured compression, 'gzip', 'br' or 'none'.
 
-    except Exception as e:
-        logging.error(f"Failed to upload to GCP: {str(e)}")
+    Returns:
+        str: 'gzip', 'br' or None to store reports uncompressed.
+    """
+    compression = (compression or 'gzip').lower()
+    if compression == 'none':
+        return None
+    if compression == 'br' and brotli is None:
+        logging.warning("PUBLISH_COMPRESSION is br but brotli is not installed, compressing with gzip instead")
+        return 'gzip'
+    if compression not in content_encoding_suffixes:
+        logging.warning(f"Unknown PUBLISH_COMPRESSION {compression}, compressing with gzip instead")
+        return 'gzip'
+    return compression
+
+
+def decompress(data: bytes, content_encoding):
+    """
+    Decompresses data downloaded with the given content encoding. Gzip data is recognised by its header as well, in
+    case the storage service did not keep the content encoding of the object.
+
+    Args:
+        data (bytes): The downloaded data.
+        content_encoding (str): 'gzip', 'br' or None.
+
+    Returns:
+        bytes: The decompressed data.
+
+    Raises:
+        ValueError: If the data is compressed with brotli and brotli is not installed.
+    """
+    if content_encoding == 'gzip' or data[:2] == b'\x1f\x8b':
+        return gzip.decompress(data)
+    if content_encoding == 'br':
+        if brotli is None:
+            raise ValueError("The report is compressed with brotli, install brotli to read it")
+        return brotli.decompress(data)
+    return data
+
+
+def starts_with(data: bytes, content_encoding, prefix: bytes):
+    """
+    Checks how downloaded data starts without decompressing all of it.
+
+    Args:
+        data (bytes): The downloaded data.
+        content_encoding (str): 'gzip', 'br' or None.
+        prefix (bytes): The expected start of the decompressed data.
+
+    Returns:
+        bool: True if the decompressed data starts with the prefix.
+    """
+    if content_encoding == 'gzip' or data[:2] == b'\x1f\x8b':
+        # wbits of 16 + MAX_WBITS reads the gzip header
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, len(prefix)) == prefix
+    return decompress(data, content_encoding).startswith(prefix)
 
 
-def get_azure_from_default_credentials():
+def create_protected_report_metadata(byte_data: bytes, password: str):
     """
-    Initializes an Azure BlobServiceClient using the DefaultAzureCredential for authentication.
+    Creates the metadata record stored next to a protected report, it is all /login reads to authenticate a viewer.
+
+    Args:
+        byte_data (bytes): The JSON of the report.
+        password (str): The password of the report.
+
+    Returns:
+        dict: The salted password hash, the creation time, the size and the checksum of the report.
+    """
+    salt = os.urandom(16)
+    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, password_hash_iterations)
+    return {
+        "passwordHash": "pbkdf2_sha256${}${}${}".format(password_hash_iterations,
+                                                        base64.b64encode(salt).decode('ascii'),
+                                                        base64.b64encode(password_hash).decode('ascii')),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "size": len(byte_data),
+        "checksum": "sha256:" + hashlib.sha256(byte_data).hexdigest()
+    }
+
+
+def check_password(metadata: dict, password: str):
+    """
+    Checks a password against the password hash in the metadata of a protected report.
+
+    Args:
+        metadata (dict): The metadata record of the report.
+        password (str): The password to check.
+
+    Returns:
+        bool: True if the password is the password of the report.
+    """
+    algorithm, iterations, salt, password_hash = metadata['passwordHash'].split('$')
+    if algorithm != 'pbkdf2_sha256':
+        raise ValueError(f"Unknown password hash algorithm {algorithm}")
+    candidate_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), base64.b64decode(salt), int(iterations))
+    return hmac.compare_digest(candidate_hash, base64.b64decode(password_hash))
+
+
+def to_json_bytes(data):
+    """
+    Encodes the data to upload as JSON bytes, data already serialized to JSON is only encoded.
+
+    Args:
+        data (list|dict|str|bytes): The data to upload.
 
     Returns:
-        azure.storage.blob.BlobServiceClient: The Azure BlobServiceClient initialized with the default credentials.
+        bytes: The UTF-8 encoded JSON.
     """
-    default_credential = DefaultAzureCredential()
-    account_url = os.getenv("AZURE_ACCOUNT_URL")
-    return BlobServiceClient(account_url, credential=default_credential)
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return json.dumps(data).encode('utf-8')
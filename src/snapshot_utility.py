@@ -0,0 +1,376 @@
+import math
+from decimal import Decimal, ROUND_HALF_UP
+from html import escape
+
+import src.controller_utility as controller_util
+
+# Colors and markers of the lines of a chart by line style, the same the report page draws them with
+cy_colors = {"primary": "#3944BC", "secondary": "#3141f5", "tertiary": "#6975fa", "quaternary": "#7c86fc",
+             "quinary": "#979ffc"}
+py_colors = {"primary": "#FFC0CB", "secondary": "#ffd6dd", "tertiary": "#fad9df", "quaternary": "#fae1e5",
+             "quinary": "#fff0f2"}
+markers = {"primary": "circle", "secondary": "square", "tertiary": "diamond", "quaternary": "triangle-down"}
+target_color = "green"
+axis_colors = ["#058DC7", "#ED561B"]
+scale_labels = {"MM": "M", "BB": "B", "KK": "K", "bps": "bps", "%": "%"}
+
+# Size of a chart and of its plot area, the chart is scaled to the width of its block
+chart_width = 640
+chart_height = 340
+plot_left = 72
+plot_right = 568
+plot_top = 48
+plot_bottom = 250
+
+
+def get_snapshot_decks(decks: list):
+    """
+    Prepares the decks of a report for the static snapshot template, charts are drawn as inline SVG and the cells
+    of the tables are formatted the way the report page formats them.
+
+    Args:
+        decks (list): The list of decks of the report.
+
+    Returns:
+        list: The decks with the blocks ready to be rendered.
+    """
+    deck_index = controller_util.get_deck_index(decks, page_size=1)
+    snapshot_decks = []
+    for deck, deck_summary in zip(decks, deck_index['decks']):
+        blocks = []
+        for block, block_summary in zip(deck.get('blocks', []), deck_summary['blocks']):
+            blocks.append(get_snapshot_block(block, block_summary.get('blockNumber')))
+        snapshot_decks.append({
+            'title': deck.get('title'),
+            'weekEnding': deck.get('weekEnding'),
+            'eventErrors': deck.get('eventErrors'),
+            'blocks': blocks
+        })
+    return snapshot_decks
+
+
+def get_snapshot_block(block: dict, block_number: int):
+    """
+    Prepares a block for the static snapshot template.
+
+    Args:
+        block (dict): The block of the deck.
+        block_number (int): The number of the block in the report, None for sections and embedded content.
+
+    Returns:
+        dict: The block with its chart or formatted table.
+    """
+    plot_style = block.get('plotStyle')
+    snapshot_block = {'plotStyle': plot_style, 'title': block.get('title'), 'blockNumber': block_number}
+    if plot_style == '6_12_chart':
+        table = block.get('table') or {}
+        snapshot_block['svg'] = render_chart(block, block_number)
+        snapshot_block['boxTotalsHeader'] = table.get('tableHeader', [])
+        snapshot_block['boxTotals'] = [
+            [format_box_total(value, index, block.get('yScale', ''), block.get('boxTotalScale', ''))
+             for index, value in enumerate(row)]
+            for row in table.get('tableBody', [])
+        ]
+    elif plot_style in controller_util.table_plot_styles:
+        headers = block.get('headers', [])
+        snapshot_block['headers'] = headers
+        snapshot_block['rows'] = [{
+            'header': row.get('rowHeader'),
+            'style': row.get('rowStyle', ''),
+            'cells': [format_cell(value, row.get('yScale', '')) for value in row.get('rowData', [])],
+            'cellStyle': ''
+        } if row.get('rowData') else {
+            # Rows without data, like the section rows of a table, are styled across the table
+            'header': row.get('rowHeader'),
+            'style': row.get('rowStyle', ''),
+            'cells': [''] * len(headers),
+            'cellStyle': row.get('rowStyle', '')
+        } for row in block.get('rows', [])]
+    elif plot_style == 'embedded_content':
+        snapshot_block.update({key: block.get(key) for key in ['id', 'source', 'name', 'height', 'width']})
+    return snapshot_block
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def get_precision(format_mask: str):
+    """
+    Returns the number of decimals of a format mask, like 2 for '##.##KK'.
+    """
+    if "." in format_mask:
+        decimals = format_mask.split(".")[1][:1]
+        return int(decimals) if decimals.isdigit() else 0
+    return 0
+
+
+def to_fixed(value, precision: int):
+    """
+    Formats a number with a fixed number of decimals, rounding halves away from zero like JavaScript toFixed does.
+    """
+    return str(Decimal(float(value)).quantize(Decimal(1).scaleb(-precision), rounding=ROUND_HALF_UP))
+
+
+def format_label(format_mask: str, value, add_label: bool = False):
+    """
+    Formats a value of a chart with the scale of its block, like the data labels and axis labels of the report page.
+
+    Args:
+        format_mask (str): The y scale of the block, like '##MM' or '##.#%'.
+        value (float): The value.
+        add_label (bool): Appends the unit of the scale, like 'M' or '%'.
+
+    Returns:
+        str: The formatted value.
+    """
+    precision = get_precision(format_mask)
+    for mask, factor in [("MM", 1 / 1000000), ("BB", 1 / 1000000000), ("KK", 1 / 1000), ("bps", 10000),
+                         ("%", 100)]:
+        if mask in format_mask:
+            return to_fixed(value * factor, precision) + (scale_labels[mask] if add_label else "")
+    return to_fixed(value, precision)
+
+
+def format_cell(value, format_mask: str):
+    """
+    Formats a cell of a 6 weeks or 12 months table like the report page does.
+
+    Args:
+        value (float|str): The value of the cell.
+        format_mask (str): The y scale of the row.
+
+    Returns:
+        str: The formatted cell.
+    """
+    if not is_number(value):
+        return value if isinstance(value, str) else ""
+
+    precision = get_precision(format_mask)
+    if "MM" in format_mask:
+        return to_fixed(value / 1000000, precision) + "M"
+    elif "BB" in format_mask or 1E9 <= value <= 1E12:
+        return to_fixed(value / 1000000000, precision) + "B"
+    elif "KK" in format_mask:
+        return to_fixed(value / 1000, precision) + "K"
+    elif "bps" in format_mask:
+        return to_fixed(value * 10000, precision) + "bps"
+    elif "%" in format_mask:
+        return to_fixed(value * 100, precision) + "%"
+    return to_fixed(value, precision)
+
+
+def format_box_total(value, index: int, y_scale: str, box_total_scale: str):
+    """
+    Formats a box total under a chart like the report page does, the comparisons (WOW, YOY) are percentages or
+    basis points, the totals are formatted with the scale of the chart.
+
+    Args:
+        value (float|str): The box total.
+        index (int): The column of the box total.
+        y_scale (str): The y scale of the chart.
+        box_total_scale (str): The scale of the comparisons, '%' or 'bps'.
+
+    Returns:
+        str: The formatted box total.
+    """
+    if not is_number(value):
+        return value if isinstance(value, str) else ""
+    if index == 1 or (index % 2 == 0 and index != 0):
+        if "bps" in box_total_scale:
+            return f"{math.floor(value + 0.5)}bps"
+        return to_fixed(value, get_precision(y_scale)) + "%"
+    return format_label(y_scale, value, True)
+
+
+def nice_number(value_range: float, round_number: bool):
+    """
+    Rounds a range to a 'nice' number, 1, 2, 5 or 10 times a power of 10, to place the ticks of an axis on.
+    """
+    exponent = math.floor(math.log10(value_range))
+    fraction = value_range / 10 ** exponent
+    if round_number:
+        nice_fraction = 1 if fraction < 1.5 else 2 if fraction < 3 else 5 if fraction < 7 else 10
+    else:
+        nice_fraction = 1 if fraction <= 1 else 2 if fraction <= 2 else 5 if fraction <= 5 else 10
+    return nice_fraction * 10 ** exponent
+
+
+def get_axis_range(values: list):
+    """
+    Computes the minimum, maximum and tick interval of an axis with 5 intervals, leaving some room above and below
+    the values like the report page does.
+
+    Args:
+        values (list): The values on the axis.
+
+    Returns:
+        tuple: The minimum, maximum and interval of the axis, None if there are no values.
+    """
+    if not values:
+        return None
+    min_value = min(values)
+    max_value = max(values)
+    # A flat line still gets an axis around its value
+    value_range = nice_number((max_value - min_value) or abs(max_value) or 1, False)
+    tick_spacing = nice_number(value_range / 5, True)
+    axis_min = math.floor(min_value / tick_spacing) * tick_spacing
+    axis_max = math.ceil(max_value / tick_spacing) * tick_spacing
+    interval = (axis_max - axis_min) / 5
+
+    if min_value - axis_min < interval * 0.10:
+        axis_min -= interval
+        interval = (axis_max - axis_min) / 5
+    if axis_max - max_value < interval * 0.10:
+        axis_max += interval
+        interval = (axis_max - axis_min) / 5
+    return axis_min, axis_max, interval
+
+
+def get_series_values(data: dict, period: str, index: int):
+    """
+    Returns the values of the current or previous period of a metric on the weekly (index 0) or monthly (index 1)
+    part of the x axis, with an empty string where there is no value.
+    """
+    try:
+        return list(data[period][index]['primaryAxis' if index == 0 else 'secondaryAxis'])
+    except (KeyError, IndexError, TypeError):
+        return []
+
+
+def get_chart_series(block: dict):
+    """
+    Collects the series of a 6-12 chart, the weeks and months of each series are drawn as separate lines.
+
+    Args:
+        block (dict): The 6-12 chart block.
+
+    Returns:
+        list: The series, with their name, kind ('cy', 'py' or 'target'), line style, axis and values.
+    """
+    if block.get('axes') not in (1, 2):
+        return []
+    monthly_axis = 1 if block.get('axes') == 2 else 0
+
+    series = []
+    for metric in block.get('yAxis', []):
+        line_style = metric.get('lineStyle')
+        if line_style is None:
+            continue
+        name = metric.get('legendName')
+        if line_style == 'target':
+            for index, axis in [(0, 0), (1, monthly_axis)]:
+                series.append({'name': name, 'kind': 'target', 'lineStyle': line_style, 'axis': axis,
+                               'values': get_series_values(metric.get('Target'), 'current', index)})
+            continue
+        for kind, period in [('cy', 'current'), ('py', 'previous')]:
+            for index, axis in [(0, 0), (1, monthly_axis)]:
+                series.append({'name': f"{name} - {kind.upper()}", 'kind': kind, 'lineStyle': line_style,
+                               'axis': axis, 'values': get_series_values(metric.get('metric'), period, index)})
+    return series
+
+
+def render_marker(marker: str, x: float, y: float, color: str, size: float = 8):
+    half = size / 2
+    if marker == 'square':
+        return f'<rect x="{x - half:.1f}" y="{y - half:.1f}" width="{size}" height="{size}" fill="{color}"/>'
+    if marker == 'diamond':
+        points = f"{x:.1f},{y - half:.1f} {x + half:.1f},{y:.1f} {x:.1f},{y + half:.1f} {x - half:.1f},{y:.1f}"
+        return f'<polygon points="{points}" fill="{color}"/>'
+    if marker in ('triangle', 'triangle-down'):
+        tip = half if marker == 'triangle-down' else -half
+        points = f"{x:.1f},{y + tip:.1f} {x + half:.1f},{y - tip:.1f} {x - half:.1f},{y - tip:.1f}"
+        return f'<polygon points="{points}" fill="{color}"/>'
+    return f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{half - 1}" fill="#fff" stroke="{color}" stroke-width="2"/>'
+
+
+def render_chart(block: dict, block_number: int):
+    """
+    Draws a 6-12 chart as inline SVG, the last weeks and the months of the current year as lines with data labels,
+    the previous year as lines without markers and targets as triangles.
+
+    Args:
+        block (dict): The 6-12 chart block.
+        block_number (int): The number of the block in the report.
+
+    Returns:
+        str: The SVG markup of the chart.
+    """
+    y_scale = block.get('yScale', '')
+    x_axis = block.get('xAxis', [])
+    series = get_chart_series(block)
+    axis_ranges = [get_axis_range([value for line in series if line['axis'] == axis
+                                   for value in line['values'] if is_number(value)]) for axis in (0, 1)]
+    band = (plot_right - plot_left) / max(len(x_axis), 1)
+
+    def to_x(position):
+        return plot_left + band * (position + 0.5)
+
+    def to_y(value, axis):
+        axis_min, axis_max, _ = axis_ranges[axis]
+        return plot_bottom - (value - axis_min) / ((axis_max - axis_min) or 1) * (plot_bottom - plot_top)
+
+    title = escape(f"{block_number}. {block.get('title', '')}")
+    svg = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {chart_width} {chart_height}" width="100%" '
+           f'height="{chart_height}" role="img" aria-label="{title}" font-family="sans-serif" font-size="11">',
+           f'<text x="{chart_width / 2}" y="24" text-anchor="middle" font-size="16" font-weight="bold" '
+           f'fill="#464646">{title}</text>',
+           f'<line x1="{plot_left}" y1="{plot_bottom}" x2="{plot_right}" y2="{plot_bottom}" stroke="#6E7079"/>']
+
+    # Axis labels, the monthly values are drawn against the right axis on charts with two axes
+    for axis, axis_range in enumerate(axis_ranges):
+        if axis_range is None:
+            continue
+        axis_min, axis_max, interval = axis_range
+        for tick in range(6):
+            value = axis_min + interval * tick
+            x, anchor = (plot_left - 6, 'end') if axis == 0 else (plot_right + 6, 'start')
+            svg.append(f'<text x="{x}" y="{to_y(value, axis) + 4:.1f}" text-anchor="{anchor}" '
+                       f'fill="{axis_colors[axis]}">{escape(format_label(y_scale, value, True))}</text>')
+    for position, label in enumerate(x_axis):
+        x = to_x(position)
+        svg.append(f'<text x="{x:.1f}" y="{plot_bottom + 14}" text-anchor="end" fill="#6E7079" '
+                   f'transform="rotate(-30 {x:.1f} {plot_bottom + 14})">{escape(str(label))}</text>')
+
+    # Lines are broken where there is no value, between the weeks and the months. The markers and data labels of
+    # the current year are drawn over all lines
+    markers_and_labels = []
+    for line in series:
+        if axis_ranges[line['axis']] is None:
+            continue
+        points = [(position, to_x(position), to_y(value, line['axis']), value)
+                  for position, value in enumerate(line['values']) if is_number(value) and position < len(x_axis)]
+        if line['kind'] == 'target':
+            markers_and_labels.extend(render_marker('triangle', x, y, target_color, 10) for _, x, y, _ in points)
+            continue
+
+        color = (cy_colors if line['kind'] == 'cy' else py_colors).get(line['lineStyle'], cy_colors['primary'])
+        path = [f"{'L' if index and points[index - 1][0] == position - 1 else 'M'}{x:.1f} {y:.1f}"
+                for index, (position, x, y, _) in enumerate(points)]
+        if path:
+            svg.append(f'<path d="{" ".join(path)}" fill="none" stroke="{color}" stroke-width="2"/>')
+        if line['kind'] == 'cy':
+            for _, x, y, value in points:
+                markers_and_labels.append(render_marker(markers.get(line['lineStyle'], 'circle'), x, y, color))
+                markers_and_labels.append(f'<text x="{x:.1f}" y="{y - 8:.1f}" text-anchor="middle" fill="#333">'
+                                          f'{escape(format_label(y_scale, value))}</text>')
+    svg.extend(markers_and_labels)
+
+    # Legend, one entry per series name centered under the chart
+    legend = []
+    for line in series:
+        if line['name'] not in [entry['name'] for entry in legend]:
+            legend.append(line)
+    entry_widths = [24 + len(str(entry['name'])) * 6 for entry in legend]
+    x = (chart_width - sum(entry_widths)) / 2
+    for entry, width in zip(legend, entry_widths):
+        if entry['kind'] == 'target':
+            color, marker = target_color, 'triangle'
+        else:
+            color = (cy_colors if entry['kind'] == 'cy' else py_colors).get(entry['lineStyle'], cy_colors['primary'])
+            marker = markers.get(entry['lineStyle'], 'circle') if entry['kind'] == 'cy' else 'square'
+        svg.append(render_marker(marker, x + 8, chart_height - 14, color, 10))
+        svg.append(f'<text x="{x + 18:.1f}" y="{chart_height - 10}" fill="#333">{escape(str(entry["name"]))}</text>')
+        x += width
+    svg.append('</svg>')
+    return ''.join(svg)
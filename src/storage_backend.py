@@ -0,0 +1,451 @@
+import base64
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Content encodings published reports can be stored with, and the suffix of the local files stored with them
+content_encoding_suffixes = {'gzip': '.gz', 'br': '.br'}
+
+# Storage backends by the OBJECT_STORAGE_OPTION selecting them, filled by register_storage_backend
+storage_backends = {}
+
+
+def register_storage_backend(name: str):
+    """
+    Registers a storage backend class under the given name, used as a class decorator. A backend registered by a
+    module imported before the publisher is created can be selected with the OBJECT_STORAGE_OPTION environment
+    variable.
+
+    Args:
+        name (str): The storage option selecting the backend.
+
+    Returns:
+        function: The decorator registering the class.
+    """
+    def register(backend_class):
+        storage_backends[name] = backend_class
+        return backend_class
+    return register
+
+
+def create_storage_backend(storage_option, bucket, upload_part_size: int, upload_concurrency: int, connections: int):
+    """
+    Creates the storage backend registered for the storage option, the local backend when no storage option is
+    provided.
+
+    Args:
+        storage_option (str): The storage option, 's3', 'gcp', 'azure', 'memory', 'local' or a registered option.
+        bucket (str): The bucket or container name in the chosen storage service.
+        upload_part_size (int): Size of the parts large objects are uploaded in.
+        upload_concurrency (int): Number of parts of an object uploaded at the same time.
+        connections (int): Number of connections the client of the storage service keeps open.
+
+    Returns:
+        StorageBackend: The storage backend.
+    """
+    if storage_option not in storage_backends:
+        if storage_option:
+            logging.warning(f"Unknown OBJECT_STORAGE_OPTION {storage_option}, the published report will be saved "
+                            f"locally. Registered options are {', '.join(storage_backends)}")
+        else:
+            logging.warning("No OBJECT_STORAGE_OPTION is provided hence the published report will be saved locally")
+        storage_option = 'local'
+    return storage_backends[storage_option](bucket, upload_part_size, upload_concurrency, connections)
+
+
+class StorageBackend:
+    """
+    Base class of the storages published reports are kept in. A backend stores the bytes of an object under its path
+    along with their content encoding, compressing, caching and spooling the objects is left to PublishWbr.
+
+    Attributes:
+        bucket (str): The bucket or container name in the storage service.
+        upload_part_size (int): Size of the parts large objects are uploaded in.
+        upload_concurrency (int): Number of parts of an object uploaded at the same time.
+    """
+
+    def __init__(self, bucket, upload_part_size: int, upload_concurrency: int, connections: int):
+        self.bucket = bucket
+        self.upload_part_size = upload_part_size
+        self.upload_concurrency = upload_concurrency
+
+    def put_object(self, body: bytes, path: str, content_encoding, content_type: str = 'application/json'):
+        """
+        Uploads an object in a single request.
+
+        Args:
+            body (bytes): The bytes of the object.
+            path (str): The path of the object.
+            content_encoding (str): The content encoding of the bytes, None if they are not compressed.
+            content_type (str): The content type of the object, recorded by the cloud storage services.
+        """
+        raise NotImplementedError
+
+    def upload_parts(self, parts, path: str, content_encoding, content_type: str = 'application/json'):
+        """
+        Uploads a large object part by part, backends without multipart uploads join the parts and put the object.
+
+        Args:
+            parts (iterator): The bytes of the object, in parts of the upload part size.
+            path (str): The path of the object.
+            content_encoding (str): The content encoding of the bytes, None if they are not compressed.
+            content_type (str): The content type of the object, recorded by the cloud storage services.
+        """
+        self.put_object(b''.join(parts), path, content_encoding, content_type)
+
+    def get_object(self, path: str):
+        """
+        Downloads an object.
+
+        Args:
+            path (str): The path of the object.
+
+        Returns:
+            tuple: The bytes of the object and their content encoding, None if they are not compressed.
+
+        Raises:
+            Exception: If the object does not exist, or errors specific to the storage service.
+        """
+        raise NotImplementedError
+
+
+@register_storage_backend('s3')
+class S3StorageBackend(StorageBackend):
+    """
+    Keeps objects in an AWS S3, or S3 compatible, bucket. Large objects are uploaded as multipart uploads.
+
+    Attributes:
+        s3_client (boto3.client): The client object for S3 interaction, shared by all threads.
+    """
+
+    def __init__(self, bucket, upload_part_size: int, upload_concurrency: int, connections: int, s3_client=None):
+        super().__init__(bucket, upload_part_size, upload_concurrency, connections)
+        self.s3_client = s3_client or get_s3_client(connections)
+
+    def put_object(self, body: bytes, path: str, content_encoding, content_type: str = 'application/json'):
+        encoding_args = {"ContentEncoding": content_encoding} if content_encoding else {}
+        self.s3_client.put_object(Body=body, Bucket=self.bucket, Key=path, ContentType=content_type,
+                                  **encoding_args)
+
+    def upload_parts(self, parts, path: str, content_encoding, content_type: str = 'application/json'):
+        """
+        Uploads the parts as an S3 multipart upload, aborting the upload if a part fails.
+        """
+        encoding_args = {"ContentEncoding": content_encoding} if content_encoding else {}
+        multipart_upload = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=path,
+                                                                  ContentType=content_type, **encoding_args)
+        upload_id = multipart_upload['UploadId']
+
+        def upload_part(part_number, part):
+            response = self.s3_client.upload_part(Body=part, Bucket=self.bucket, Key=path, PartNumber=part_number,
+                                                  UploadId=upload_id)
+            return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+        try:
+            etags = upload_parts_concurrently(parts, upload_part, self.upload_concurrency)
+            self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=path, UploadId=upload_id,
+                                                     MultipartUpload={'Parts': etags})
+        except Exception:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=path, UploadId=upload_id)
+            raise
+
+    def get_object(self, path: str):
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=path)
+        return response['Body'].read(), response.get('ContentEncoding')
+
+
+@register_storage_backend('gcp')
+class GcpStorageBackend(StorageBackend):
+    """
+    Keeps objects in a Google Cloud Storage bucket. Large objects are uploaded as resumable uploads.
+
+    Attributes:
+        gcp_client (google.cloud.storage.Client): The client object for GCP interaction.
+        gcp_bucket (google.cloud.storage.Bucket): The bucket handle, created once and shared by all threads.
+    """
+
+    def __init__(self, bucket, upload_part_size: int, upload_concurrency: int, connections: int, gcp_client=None):
+        super().__init__(bucket, upload_part_size, upload_concurrency, connections)
+        gcp_service_account_json_file = os.getenv("GCP_SERVICE_ACCOUNT_PATH")  # JSON file path
+        self.gcp_client = gcp_client or (get_gcp_client_for_credentials(gcp_service_account_json_file)
+                                         if gcp_service_account_json_file else get_gcp_client_for_iam())
+        self.gcp_bucket = self.gcp_client.bucket(bucket)
+
+    def put_object(self, body: bytes, path: str, content_encoding, content_type: str = 'application/json'):
+        blob = self.gcp_bucket.blob(path)
+        blob.content_encoding = content_encoding
+        blob.upload_from_string(body, content_type=content_type)
+
+    def upload_parts(self, parts, path: str, content_encoding, content_type: str = 'application/json'):
+        """
+        Uploads the parts as a resumable upload, which sends them one after the other. The upload part size is a
+        multiple of 256 KB as resumable uploads require.
+        """
+        blob = self.gcp_bucket.blob(path)
+        blob.content_encoding = content_encoding
+        with blob.open('wb', chunk_size=self.upload_part_size, content_type=content_type) as writer:
+            for part in parts:
+                writer.write(part)
+
+    def get_object(self, path: str):
+        blob = self.gcp_bucket.get_blob(path)
+        if blob is None:
+            raise FileNotFoundError(f"{path} does not exist in {self.bucket}")
+        # A raw download keeps Cloud Storage from decompressing the object on the fly
+        return blob.download_as_bytes(raw_download=True), blob.content_encoding
+
+
+@register_storage_backend('azure')
+class AzureStorageBackend(StorageBackend):
+    """
+    Keeps objects in an Azure Blob Storage container. Large objects are uploaded as the blocks of a block blob.
+
+    Attributes:
+        azure_client (azure.storage.blob.BlobServiceClient): The client object for Azure interaction.
+        azure_container (azure.storage.blob.ContainerClient): The container client, created once and shared by all
+                                                              threads.
+    """
+
+    def __init__(self, bucket, upload_part_size: int, upload_concurrency: int, connections: int, azure_client=None):
+        super().__init__(bucket, upload_part_size, upload_concurrency, connections)
+        if azure_client is None:
+            from azure.storage.blob import BlobServiceClient
+            azure_connection_string = os.getenv("AZURE_CONNECTION_STRING")
+            azure_client = BlobServiceClient.from_connection_string(azure_connection_string) \
+                if azure_connection_string else get_azure_from_default_credentials()
+        self.azure_client = azure_client
+        self.azure_container = self.azure_client.get_container_client(bucket)
+
+    def put_object(self, body: bytes, path: str, content_encoding, content_type: str = 'application/json'):
+        from azure.storage.blob import ContentSettings
+        blob_client = self.azure_container.get_blob_client(path)
+        blob_client.upload_blob(body, content_settings=ContentSettings(content_type=content_type,
+                                                                       content_encoding=content_encoding))
+
+    def upload_parts(self, parts, path: str, content_encoding, content_type: str = 'application/json'):
+        """
+        Uploads the parts as the blocks of a block blob, the blob is created when the block list is committed.
+        """
+        from azure.storage.blob import BlobBlock, ContentSettings
+        blob_client = self.azure_container.get_blob_client(path)
+
+        def stage_block(block_number, part):
+            # Block ids of a blob have the same length
+            block_id = base64.b64encode(f"{block_number:08d}".encode('ascii')).decode('ascii')
+            blob_client.stage_block(block_id=block_id, data=part)
+            return BlobBlock(block_id=block_id)
+
+        blocks = upload_parts_concurrently(parts, stage_block, self.upload_concurrency)
+        blob_client.commit_block_list(blocks, content_settings=ContentSettings(content_type=content_type,
+                                                                               content_encoding=content_encoding))
+
+    def get_object(self, path: str):
+        blob_client = self.azure_container.get_blob_client(path)
+        stream = blob_client.download_blob()
+        return stream.readall(), stream.properties.content_settings.content_encoding
+
+
+@register_storage_backend('local')
+class LocalStorageBackend(StorageBackend):
+    """
+    Keeps objects as files in the publish directory of the project, the content encoding of an object is the suffix
+    of its file. Large objects are streamed to the file.
+
+    Attributes:
+        path (str): The directory the objects are kept in.
+    """
+
+    def __init__(self, bucket, upload_part_size: int, upload_concurrency: int, connections: int):
+        super().__init__(bucket, upload_part_size, upload_concurrency, connections)
+        self.path = str(Path(os.path.dirname(__file__)).parent) + '/publish/'
+
+    def get_file(self, path: str, content_encoding):
+        file_path = self.path + path + content_encoding_suffixes.get(content_encoding, '')
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        return file_path
+
+    def put_object(self, body: bytes, path: str, content_encoding, content_type: str = 'application/json'):
+        self.upload_parts([body], path, content_encoding, content_type)
+
+    def upload_parts(self, parts, path: str, content_encoding, content_type: str = 'application/json'):
+        """
+        Writes the parts to a temporary file, which replaces the file of the object once all parts are written.
+        """
+        file_path = self.get_file(path, content_encoding)
+        temp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file_path, 'wb') as json_file:
+            for part in parts:
+                json_file.write(part)
+        os.replace(temp_file_path, file_path)
+
+    def get_object(self, path: str):
+        for content_encoding, suffix in list(content_encoding_suffixes.items()) + [(None, '')]:
+            file = self.path + path + suffix
+            if os.path.exists(file):
+                with open(file, 'rb') as current_file:
+                    return current_file.read(), content_encoding
+        raise FileNotFoundError(f"{path} does not exist in {self.path}")
+
+
+@register_storage_backend('memory')
+class MemoryStorageBackend(StorageBackend):
+    """
+    Keeps objects in the memory of the process, to load test and benchmark the publishing paths without cloud
+    credentials. Every request waits for the simulated latency, and for the transfer of its bytes at the simulated
+    throughput. Parts of large objects are uploaded concurrently like they are to S3 and Azure.
+
+    Attributes:
+        latency (float): The simulated latency of a request, in seconds.
+        throughput (float): The simulated throughput of a request in bytes per second, 0 transfers instantly.
+        objects (dict): The stored objects, the bytes and content encoding of each object by its path.
+    """
+
+    def __init__(self, bucket, upload_part_size: int, upload_concurrency: int, connections: int,
+                 latency: float = None, throughput: float = None):
+        super().__init__(bucket, upload_part_size, upload_concurrency, connections)
+        self.latency = latency if latency is not None \
+            else float(os.environ.get("MEMORY_STORAGE_LATENCY_MS") or 0) / 1000
+        self.throughput = throughput if throughput is not None \
+            else float(os.environ.get("MEMORY_STORAGE_THROUGHPUT_MBPS") or 0) * 1024 * 1024
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def simulate_request(self, size: int):
+        delay = self.latency + (size / self.throughput if self.throughput else 0)
+        if delay:
+            time.sleep(delay)
+
+    def put_object(self, body: bytes, path: str, content_encoding, content_type: str = 'application/json'):
+        self.simulate_request(len(body))
+        with self.lock:
+            self.objects[path] = (bytes(body), content_encoding)
+
+    def upload_parts(self, parts, path: str, content_encoding, content_type: str = 'application/json'):
+        def upload_part(_, part):
+            self.simulate_request(len(part))
+            return part
+
+        body = b''.join(upload_parts_concurrently(parts, upload_part, self.upload_concurrency))
+        with self.lock:
+            self.objects[path] = (body, content_encoding)
+
+    def get_object(self, path: str):
+        with self.lock:
+            if path not in self.objects:
+                raise FileNotFoundError(f"{path} does not exist in memory")
+            body, content_encoding = self.objects[path]
+        self.simulate_request(len(body))
+        return body, content_encoding
+
+
+def upload_parts_concurrently(parts, upload_part, concurrency: int):
+    """
+    Uploads parts on a pool of threads, at most `concurrency` parts are uploaded at the same time. Parts are numbered
+    from 1 in order, and no further part is read once an upload failed. A part is released once it is uploaded.
+
+    Args:
+        parts (iterator): The parts to upload.
+        upload_part (function): Uploads a part, called with the number of the part and the part.
+        concurrency (int): Number of parts uploaded at the same time.
+
+    Returns:
+        list: The results of upload_part, in the order of the parts.
+
+    Raises:
+        Exception: The error of the first failed part.
+    """
+    futures = []
+    in_flight = threading.BoundedSemaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='report-part-upload')
+    try:
+        for part_number, part in enumerate(parts, start=1):
+            in_flight.acquire()
+            if any(future.done() and future.exception() for future in futures):
+                in_flight.release()
+                break
+            future = executor.submit(upload_part, part_number, part)
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append(future)
+        return [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_s3_client(connections: int):
+    """
+    Initializes an S3 client from the S3_* environment variables, or the default AWS credentials.
+
+    Args:
+        connections (int): Size of the connection pool of the client.
+
+    Returns:
+        boto3.client: The S3 client, which can be shared by threads.
+    """
+    import boto3
+    from botocore.config import Config
+
+    config = Config(max_pool_connections=connections)
+    aws_access_key_id = os.environ.get("S3_STORAGE_KEY") or None
+    if not aws_access_key_id:
+        return boto3.client('s3', config=config)
+
+    s3config = {
+        "region_name": os.environ.get("S3_REGION_NAME") or "",
+        "aws_access_key_id": aws_access_key_id,
+        "aws_secret_access_key": os.environ.get("S3_STORAGE_SECRET") or "",
+        "config": config
+    }
+    if os.environ.get("S3_STORAGE_ENDPOINT"):
+        s3config["endpoint_url"] = os.environ.get("S3_STORAGE_ENDPOINT")
+    return boto3.client('s3', **s3config)
+
+
+def get_gcp_client_for_iam():
+    """
+    Initializes a GCP storage client using IAM credentials.
+
+    Returns:
+        google.cloud.storage.Client: The GCP storage client initialized with IAM credentials.
+    """
+    from google.cloud import storage
+    return storage.Client()
+
+
+def get_gcp_client_for_credentials(credentials_json_file):
+    """
+    Initializes a GCP storage client using a service account JSON.
+
+    Args:
+        credentials_json_file (str): The JSON string containing the GCP service account credentials.
+
+    Returns:
+        google.cloud.storage.Client: The GCP storage client initialized with the provided service account JSON.
+
+    Raises:
+        Exception: If the client initialization fails, an exception is raised and logged.
+    """
+    from google.cloud import storage
+    try:
+        with open(credentials_json_file, mode="r") as credentials_json:
+            # Initialize GCP client with the IAM credentials file
+            return storage.Client.from_service_account_json(credentials_json.name)
+
+    except Exception as e:
+        logging.error(f"Failed to upload to GCP: {str(e)}")
+
+
+def get_azure_from_default_credentials():
+    """
+    Initializes an Azure BlobServiceClient using the DefaultAzureCredential for authentication.
+
+    Returns:
+        azure.storage.blob.BlobServiceClient: The Azure BlobServiceClient initialized with the default credentials.
+    """
+    from azure.identity import DefaultAzureCredential
+    from azure.storage.blob import BlobServiceClient
+    default_credential = DefaultAzureCredential()
+    account_url = os.getenv("AZURE_ACCOUNT_URL")
+    return BlobServiceClient(account_url, credential=default_credential)
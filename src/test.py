@@ -1,5 +1,11 @@
+import argparse
+import json
 import logging
+import multiprocessing
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List
@@ -9,16 +15,33 @@ import numpy as np
 import pandas
 import yaml
 
+import src.benchmark as benchmark
 import src.wbr as wbr
 from src.controller_utility import SixTwelveChart, TrailingTable, get_wbr_deck, SafeLineLoader
 
 test_suite_folder = Path(os.path.dirname(__file__)) / 'unit_test_case'
 
+# A benchmark of every scenario, recorded with `python -m src.test --write-baseline` or
+# `python -m src.benchmark --output`
+performance_baseline_file = Path(os.environ.get("UNIT_TEST_PERFORMANCE_BASELINE")
+                                 or test_suite_folder / 'performance_baseline.json')
+# A scenario fails its performance test when a stage takes this many times its baseline time or peak memory
+time_tolerance = float(os.environ.get("UNIT_TEST_TIME_TOLERANCE") or 1.5)
+memory_tolerance = float(os.environ.get("UNIT_TEST_MEMORY_TOLERANCE") or 1.25)
+# Stages faster than this in the baseline and the scenario are not compared, their times are mostly noise
+minimum_seconds = 0.05
+# Number of processes `python -m src.test` tests scenarios in at the same time, /wbr-unit-test tests them one after
+# the other in the request thread
+test_workers = int(os.environ.get("UNIT_TEST_WORKERS") or os.cpu_count() or 1)
+# Scenarios taking longer than this to test are listed in the slow scenarios of the result
+slow_scenario_seconds = float(os.environ.get("UNIT_TEST_SLOW_SCENARIO_SECONDS") or 5)
+
 
 @dataclass
 class Result:
     def __init__(self):
         self.scenarios = []
+        self.slowScenarios = []
         self.resultStatement: str
 
 
@@ -27,6 +50,7 @@ class ScenarioResult:
         self.scenario: str
         self.weekEnding: str
         self.fiscalMonth: str
+        self.seconds: float
         self.testCases: List[Test]
 
 
@@ -56,6 +80,14 @@ class TrailingTableTest(Test):
         self.headerResult: List[TestResult]
 
 
+class PerformanceTest(Test):
+    def __init__(self):
+        super().__init__("Performance")
+        self.testNumber = "performance"
+        self.buildTimeResult: TestResult
+        self.peakMemoryResult: TestResult
+
+
 class TestResult:
     def __init__(self, result: str, failure_message=None, expected=None, calculated=None):
         self.result = result
@@ -64,61 +96,224 @@ class TestResult:
         self.calculated = calculated
 
 
-def test_wbr():
+def test_wbr(performance: bool = False, baseline_file: Path = None, name_filter: str = None, workers: int = 1):
     """
     Executes a series of tests on WBR scenarios defined in a test suite.
 
-    This function traverses the specified directory for test scenarios, loading the corresponding CSV
-    and YAML configuration files for each scenario. It then creates a WBR object for each scenario,
-    collects results for each test case defined in the scenario's configuration, and aggregates the
-    results into a final result object.
+    This function traverses the specified directory for test scenarios, and tests each scenario in a pool of
+    processes with `test_scenario`. The results of the scenarios are merged in the order of their folders, whichever
+    finished first, and the scenarios taking longer than `slow_scenario_seconds` are listed in the slow scenarios of
+    the result.
+
+    Parameters:
+        performance (bool): Also benchmarks the stages of each scenario with `src.benchmark` and compares them
+                            with the performance baseline, in a `Performance` test case of the scenario. Scenarios are
+                            measured one after the other once all of them are tested, so the scenarios tested at
+                            the same time do not slow down the measurements.
+        baseline_file (Path): The performance baseline, defaults to `performance_baseline_file`.
+        name_filter (str): Only scenarios whose folder name contains the filter are tested.
+        workers (int): The number of processes testing scenarios, 1 tests them one after the other in the calling
+                       process. Processes are spawned rather than forked, the calling process may be the web server
+                       with its threads and locks.
 
     Returns:
         Result: An object containing the results of all executed scenarios and their respective test cases.
 
-    Process:
-        - For each scenario directory found, the function checks if it contains a 'scenario' in its name.
-        - It loads the configuration and test files and attempts to create a WBR object.
-        - If successful, it initializes a `ScenarioResult` object for the scenario, captures the week ending
-          and fiscal month, and runs each defined test case against the WBR object.
-        - The results of each scenario are stored in a `Result` object, which is returned after all scenarios
-          have been processed.
-
     Raises:
         Exception: Propagates any errors encountered during the creation of the WBR object or while executing tests.
     """
     result = Result()
-    for i, scr in enumerate(sorted(os.walk(test_suite_folder))):
-        scenario = scr[0]
-        if 'scenario' not in scenario:
-            continue
-
-        scenario_name = scenario.split("/")[-1]
-        csv_file = scenario + '/original.csv'
-        config_file_path = scenario + '/config.yaml'
-        test_config_file = scenario + '/testconfig.yml'
-
-        config = yaml.load(open(config_file_path), SafeLineLoader)
-        test_config = yaml.safe_load(open(test_config_file))
-        try:
-            # Create a WBR object using the CSV data and configuration
-            wbr1 = wbr.WBR(config, csv=csv_file)
-        except Exception as error:
-            logging.error(error, exc_info=True)
-            raise error
+    scenarios = [scenario for scenario in get_scenario_folders()
+                 if name_filter is None or name_filter in scenario.split("/")[-1]]
+    workers = min(workers, len(scenarios))
+    if workers > 1:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            # map returns the results in the order of the scenarios
+            result.scenarios = list(executor.map(test_scenario, scenarios))
+    else:
+        result.scenarios = [test_scenario(scenario) for scenario in scenarios]
+
+    result.slowScenarios = [{'scenario': scenario_result.scenario, 'seconds': scenario_result.seconds}
+                            for scenario_result in sorted(result.scenarios, key=lambda item: -item.seconds)
+                            if scenario_result.seconds > slow_scenario_seconds]
+    for slow_scenario in result.slowScenarios:
+        logging.warning(f"{slow_scenario['scenario']} took {slow_scenario['seconds']:.1f} s to test")
+
+    if performance:
+        baseline = read_performance_baseline(baseline_file or performance_baseline_file)
+        for scenario, scenario_result in zip(scenarios, result.scenarios):
+            scenario_result.testCases.append(test_performance(measure_scenario(scenario), baseline))
+    return result
 
-        scenario_result = ScenarioResult()
-        scenario_result.scenario = scenario_name
-        scenario_result.weekEnding = str(wbr1.cy_week_ending)
-        scenario_result.fiscalMonth = wbr1.fiscal_month
 
-        scenario_result.testCases = [build_and_test_wbr(wbr1, test["test"]) for test in test_config["tests"]]
+def test_scenario(scenario: str) -> ScenarioResult:
+    """
+    Tests a scenario of the test suite, by building its WBR object and deck and running each test case of its
+    testconfig.yml against the deck.
 
-        result.scenarios.append(scenario_result)
-    return result
+    Parameters:
+        scenario (str): The path of the scenario folder, with the original.csv, config.yaml and testconfig.yml files.
+
+    Returns:
+        ScenarioResult: The week ending and fiscal month of the scenario, the results of its test cases and the
+                        seconds it took to test.
+
+    Raises:
+        Exception: Propagates any errors encountered during the creation of the WBR object or while executing tests.
+    """
+    started = time.perf_counter()
+    csv_file = scenario + '/original.csv'
+    with open(scenario + '/config.yaml') as config_file:
+        config = yaml.load(config_file, SafeLineLoader)
+    with open(scenario + '/testconfig.yml') as test_config_file:
+        test_config = yaml.safe_load(test_config_file)
+    try:
+        # Create a WBR object using the CSV data and configuration
+        wbr1 = wbr.WBR(config, csv=csv_file)
+        # The deck is built once, every test case of the scenario reads its blocks
+        deck = get_wbr_deck(wbr1)
+    except Exception as error:
+        logging.error(error, exc_info=True)
+        raise error
+
+    scenario_result = ScenarioResult()
+    scenario_result.scenario = scenario.split("/")[-1]
+    scenario_result.weekEnding = str(wbr1.cy_week_ending)
+    scenario_result.fiscalMonth = wbr1.fiscal_month
+    scenario_result.testCases = [build_and_test_wbr(wbr1, test["test"], deck) for test in test_config["tests"]]
+    scenario_result.seconds = round(time.perf_counter() - started, 3)
+    return scenario_result
+
+
+def get_scenario_folders() -> list:
+    """
+    Returns:
+        list: The paths of the scenario folders of the test suite, in the order they are tested.
+    """
+    return [folder for folder, _, _ in sorted(os.walk(test_suite_folder)) if 'scenario' in folder]
+
+
+def measure_scenario(scenario: str, repeat: int = 3) -> dict:
+    """
+    Measures building, serializing and publishing the report of a scenario with `src.benchmark`.
+
+    Parameters:
+        scenario (str): The path of the scenario folder.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: The result of the scenario in a benchmark, with the median time and the peak memory of each stage.
+    """
+    return benchmark.run_benchmark(repeat=repeat, folder=Path(scenario))['results'][0]
 
 
-def build_and_test_wbr(wbr1, test):
+def test_performance(measurement: dict, baseline: dict = None) -> PerformanceTest:
+    """
+    Compares the measurement of a scenario with its result in the baseline with `src.benchmark.compare_baselines`.
+    A scenario without a result in the baseline is skipped.
+
+    Parameters:
+        measurement (dict): The result of the scenario in a benchmark, see `measure_scenario`.
+        baseline (dict): The benchmark taken as the baseline, None if there is none.
+
+    Returns:
+        PerformanceTest: The results of the time and peak memory of the stages.
+    """
+    test_case = PerformanceTest()
+    seconds = measurement['totalSeconds']
+    peak_megabytes = get_peak_bytes(measurement) / (1024 * 1024)
+    baseline_result = next((result for result in (baseline or {}).get('results', [])
+                            if (result['scenario'], result['scale']) == (measurement['scenario'],
+                                                                           measurement['scale'])), None)
+    if baseline_result is None:
+        message = "No baseline for the scenario, record one with python -m src.test --write-baseline"
+        test_case.buildTimeResult = TestResult("SKIPPED", message, None, f"{seconds * 1000:.0f} ms")
+        test_case.peakMemoryResult = TestResult("SKIPPED", message, None, f"{peak_megabytes:.1f} MB")
+        return test_case
+
+    regressions = benchmark.compare_baselines(
+        baseline, {'version': benchmark.baseline_version, 'results': [measurement]}, time_tolerance, minimum_seconds,
+        memory_tolerance)
+    test_case.buildTimeResult = compare_measurement(
+        [regression for regression in regressions if 'seconds' in regression], "Time",
+        f"every stage at most {time_tolerance}x its baseline "
+        f"(baseline {baseline_result['totalSeconds'] * 1000:.0f} ms)",
+        f"{seconds * 1000:.0f} ms")
+    test_case.peakMemoryResult = compare_measurement(
+        [regression for regression in regressions if 'peakBytes' in regression], "Peak memory",
+        f"every stage at most {memory_tolerance}x its baseline "
+        f"(baseline {get_peak_bytes(baseline_result) / (1024 * 1024):.1f} MB)",
+        f"{peak_megabytes:.1f} MB")
+    return test_case
+
+
+def get_peak_bytes(measurement: dict) -> int:
+    return max((stage['peakBytes'] for stage in measurement['stages'].values()), default=0)
+
+
+def compare_measurement(regressions: list, name: str, expected: str, calculated: str) -> TestResult:
+    if not regressions:
+        return TestResult("SUCCESS", None, expected, calculated)
+    stages = ", ".join(f"{regression['stage']} {benchmark.format_regression(regression)}"
+                       for regression in regressions)
+    return TestResult("FAILED", f"{name} regressed beyond the tolerance of the baseline: {stages}", expected,
+                      calculated)
+
+
+def read_performance_baseline(baseline_file: Path):
+    """
+    Returns:
+        dict: The benchmark taken as the baseline, None if there is no baseline of the current version.
+    """
+    try:
+        with open(baseline_file) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        logging.warning(f"No performance baseline found at {baseline_file}, the performance tests are skipped")
+        return None
+    if baseline.get('version') != benchmark.baseline_version:
+        logging.warning(f"The performance baseline {baseline_file} is of version {baseline.get('version')}, "
+                        f"expected {benchmark.baseline_version}, the performance tests are skipped")
+        return None
+    return baseline
+
+
+def write_performance_baseline(baseline_file: Path = None, repeat: int = 3) -> dict:
+    """
+    Benchmarks every scenario of the test suite with `src.benchmark` and writes the benchmark as the performance
+    baseline. Record the baseline on the machine the tests run on, the times of different machines can not be
+    compared.
+
+    Parameters:
+        baseline_file (Path): The file the baseline is written to, defaults to `performance_baseline_file`.
+        repeat (int): The number of timed runs of each scenario.
+
+    Returns:
+        dict: The baseline.
+    """
+    baseline = benchmark.run_benchmark(repeat=repeat)
+    with open(baseline_file or performance_baseline_file, 'w') as file:
+        json.dump(baseline, file, indent=2)
+    return baseline
+
+
+def get_failures(result: Result) -> list:
+    """
+    Returns:
+        list: The scenario, test number and name of every failed test result, like
+              ('scenario_1', 'performance', 'buildTimeResult').
+    """
+    failures = []
+    for scenario_result in result.scenarios:
+        for test_case in scenario_result.testCases:
+            for name, value in vars(test_case).items():
+                for test_result in value if isinstance(value, list) else [value]:
+                    if isinstance(test_result, TestResult) and test_result.result == "FAILED":
+                        failures.append((scenario_result.scenario, test_case.testNumber, name))
+    return failures
+
+
+def build_and_test_wbr(wbr1, test, deck=None):
     """
     Generates a WBR deck from a WBR object and tests specific metrics against predefined test cases.
 
@@ -129,6 +324,7 @@ def build_and_test_wbr(wbr1, test):
     Parameters:
         wbr1 (WBR): The WBR object containing the configuration and data for generating the deck.
         test (dict): A dictionary containing the test case details, including the metric name to be tested.
+        deck (Deck): The deck of the WBR object, built when it is not given.
 
     Returns:
         Test: An object representing the outcome of the test for the specified metric. Returns None if the metric is not found.
@@ -136,12 +332,13 @@ def build_and_test_wbr(wbr1, test):
     Raises:
         Exception: Propagates any errors encountered during the deck generation or extraction processes.
     """
-    try:
-        # Generate the WBR deck using the WBR object
-        deck = get_wbr_deck(wbr1)
-    except Exception as error:
-        logging.error(error, exc_info=True)
-        raise error
+    if deck is None:
+        try:
+            # Generate the WBR deck using the WBR object
+            deck = get_wbr_deck(wbr1)
+        except Exception as error:
+            logging.error(error, exc_info=True)
+            raise error
 
     blocks = list(filter(lambda x: x.title == test["metric_name"], deck.blocks))
 
@@ -730,3 +927,34 @@ def round_off(n, ndigits):
     else:
         part = math.floor(part)
     return part / (10 ** ndigits) if ndigits >= 0 else part * 10 ** abs(ndigits)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Runs the WBR unit test scenarios.')
+    parser.add_argument('--performance', action='store_true',
+                        help='Also compares the build time and peak memory of each scenario with the baseline')
+    parser.add_argument('--baseline', default=str(performance_baseline_file), help='The performance baseline file')
+    parser.add_argument('--write-baseline', action='store_true',
+                        help='Measures every scenario and writes the performance baseline instead of testing')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs of each scenario for the baseline')
+    parser.add_argument('--scenario', help='Only tests scenarios whose name contains this')
+    parser.add_argument('--workers', type=int, default=test_workers, help='Processes testing scenarios at the same time')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.write_baseline:
+        baseline = write_performance_baseline(Path(args.baseline), args.repeat)
+        logging.info(f"Wrote the baseline of {len(baseline['results'])} scenarios to {args.baseline}")
+        return 0
+
+    started = time.perf_counter()
+    result = test_wbr(args.performance, Path(args.baseline), args.scenario, args.workers)
+    logging.info(f"Tested {len(result.scenarios)} scenarios in {time.perf_counter() - started:.1f} s")
+    failures = get_failures(result)
+    for scenario, test_number, name in failures:
+        logging.error(f"{scenario} test {test_number}: {name} FAILED")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import io
+import json
+import pathlib
+import sys
+import threading
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.admission_utility as admission_util
+import src.controller as controller
+
+scenario_folder = pathlib.Path(__file__).resolve().parent / 'unit_test_case' / 'scenario_1'
+
+
+def test_data_size_is_measured_without_moving_the_stream():
+    stream = io.BytesIO(b'\xef\xbb\xbfDate,"Page, Views",Clicks\n"Sun, 05-Jan-2020",1,2\n"Mon, 06-Jan-2020",3,4')
+    stream.seek(0)
+
+    assert admission_util.get_data_size(stream) == (len(stream.getvalue()), 2, 3)
+    assert stream.tell() == 0
+    assert admission_util.get_data_size(io.StringIO('Date,Clicks\n2020-01-05,1\n')) == (25, 1, 2)
+
+
+def test_budget_queues_reports_then_rejects_them():
+    budget = admission_util.MemoryBudget(100, queue_timeout=0.05)
+
+    with pytest.raises(admission_util.MemoryBudgetExceeded) as too_large:
+        with budget.admit(101):
+            pass
+    assert too_large.value.status == 413 and too_large.value.retry_after is None
+
+    with budget.admit(60):
+        with pytest.raises(admission_util.MemoryBudgetExceeded) as busy:
+            with budget.admit(50):
+                pass
+    assert busy.value.status == 503 and busy.value.retry_after == 1
+    assert budget.rejected == 2 and budget.reserved_bytes == 0
+
+    budget.queue_timeout = 5
+    admitted = threading.Event()
+    released = threading.Event()
+
+    def build_report():
+        with budget.admit(60):
+            admitted.set()
+            released.wait()
+
+    first_report = threading.Thread(target=build_report)
+    first_report.start()
+    admitted.wait()
+    threading.Timer(0.05, released.set).start()
+    with budget.admit(60):
+        assert budget.reserved_bytes == 60
+    first_report.join()
+    assert budget.reserved_bytes == 0
+
+
+def test_report_beyond_the_memory_budget_is_rejected(monkeypatch):
+    monkeypatch.setattr(controller, 'memory_budget', admission_util.MemoryBudget(1024 * 1024))
+    client = controller.app.test_client()
+
+    with open(scenario_folder / 'original.csv', 'rb') as csv_file, \
+            open(scenario_folder / 'config.yaml', 'rb') as config_file:
+        response = client.post('/report?outputType=JSON', data={'dataFile': (csv_file, 'original.csv'),
+                                                                'configFile': (config_file, 'config.yaml')})
+
+    assert response.status_code == 413
+    assert 'MB of memory to build the report' in json.loads(response.data)['error']
+    assert controller.memory_budget.reserved_bytes == 0
+
+
+def test_peak_memory_of_a_build_is_measured():
+    if admission_util.get_resident_memory() is None:
+        pytest.skip("The resident memory of the process can not be read")
+
+    with admission_util.PeakMemory(0.001) as peak_memory:
+        data = bytearray(64 * 1024 * 1024)
+        data[::4096] = b'x' * len(data[::4096])
+        del data
+
+    assert peak_memory.growth_bytes >= 32 * 1024 * 1024
+    assert not peak_memory.thread.is_alive()
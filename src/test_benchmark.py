@@ -0,0 +1,55 @@
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.benchmark as benchmark
+import src.dataset_generator as dataset_generator
+
+
+def test_benchmark_records_every_stage_of_a_scaled_scenario():
+    result = benchmark.run_benchmark(scales=[2], repeat=1, name_filter='scenario_4')
+
+    assert [(run['scenario'], run['scale']) for run in result['results']] == [('scenario_4', 2)]
+    stages = result['results'][0]['stages']
+    assert list(stages) == benchmark.pipeline_stages
+    assert all(stage['seconds'] >= 0 and stage['peakBytes'] >= 0 for stage in stages.values())
+    assert benchmark.compare_baselines(result, result) == []
+
+
+def test_compare_baselines_reports_slower_stages():
+    def baseline(seconds):
+        return {'version': benchmark.baseline_version, 'results': [
+            {'scenario': 'scenario_1', 'scale': 1, 'stages': {'deck': {'seconds': seconds}, 'serialize': {
+                'seconds': 0.001}}}]}
+
+    regressions = benchmark.compare_baselines(baseline(0.1), baseline(0.2), threshold=1.5)
+
+    assert [(regression['stage'], regression['ratio']) for regression in regressions] == [('deck', 2.0)]
+
+
+def test_compare_baselines_reports_stages_using_more_memory():
+    def baseline(seconds, peak_bytes):
+        return {'version': benchmark.baseline_version, 'results': [
+            {'scenario': 'scenario_1', 'scale': 1, 'stages': {'deck': {'seconds': seconds, 'peakBytes': peak_bytes}}}]}
+
+    assert benchmark.compare_baselines(baseline(0.001, 100), baseline(0.001, 200)) == []
+
+    regressions = benchmark.compare_baselines(baseline(0.001, 100), baseline(0.001, 200), memory_threshold=1.5)
+
+    assert [(regression['stage'], regression['ratio']) for regression in regressions] == [('deck', 2.0)]
+    assert benchmark.format_regression(regressions[0]) == '0.0 MB -> 0.0 MB (2.0x)'
+
+
+def test_generated_scenario_is_deterministic_and_benchmarked(tmp_path):
+    arguments = dict(days=dataset_generator.minimum_days, metrics=3, dimension_values=4, filter_metrics=2,
+                     function_depth=4, blocks=10, seed=7)
+    first = dataset_generator.generate_scenario(tmp_path / 'first', **arguments)
+    second = dataset_generator.generate_scenario(tmp_path / 'second', **arguments)
+
+    assert (first / 'original.csv').read_bytes() == (second / 'original.csv').read_bytes()
+    assert (first / 'config.yaml').read_text() == (second / 'config.yaml').read_text()
+
+    result = benchmark.run_benchmark(repeat=1, folder=tmp_path / 'first')
+    assert result['results'][0]['rows'] == dataset_generator.minimum_days * 4
+    assert list(result['results'][0]['stages']) == benchmark.pipeline_stages
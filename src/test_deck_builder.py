@@ -0,0 +1,81 @@
+import datetime
+import json
+import os
+import pathlib
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller_utility as controller_util
+import src.wbr as wbr
+
+scenario_folder = Path(os.path.dirname(__file__)) / 'unit_test_case' / 'scenario_4'
+
+
+def build_wbr():
+    with open(scenario_folder / 'config.yaml') as config_file:
+        cfg = yaml.load(config_file, controller_util.SafeLineLoader)
+    return wbr.WBR(cfg, csv=scenario_folder / 'original.csv')
+
+
+def test_parallel_deck_matches_sequential_deck():
+    wbr1 = build_wbr()
+
+    sequential_deck = controller_util.get_wbr_deck(wbr1, workers=1)
+    parallel_deck = controller_util.get_wbr_deck(wbr1, workers=4)
+
+    assert len(parallel_deck.blocks) == len(wbr1.cfg['deck'])
+    assert json.dumps(parallel_deck, cls=controller_util.Encoder) == \
+        json.dumps(sequential_deck, cls=controller_util.Encoder)
+
+
+def test_parallel_deck_raises_first_failing_block_with_line_number():
+    wbr1 = build_wbr()
+    wbr1.cfg['deck'][1]['block']['ui_type'] = 'unknown'
+    wbr1.cfg['deck'][2]['block']['ui_type'] = 'unknown'
+
+    with pytest.raises(Exception, match="block number 2 in DECK Section at line"):
+        controller_util.get_wbr_deck(wbr1, workers=4)
+
+
+@pytest.mark.parametrize('fiscal_year_end_month, first_month', [('DEC', 'Jan'), ('JUN', 'Jul')])
+def test_fiscal_year_display_starts_at_the_first_fiscal_month(fiscal_year_end_month, first_month):
+    wbr1 = build_wbr()
+    wbr1.fiscal_month = fiscal_year_end_month
+    fiscal_start = controller_util.get_month_start(wbr1.cy_week_ending.month, wbr1.cy_week_ending.year,
+                                                   datetime.datetime.strptime(fiscal_year_end_month, '%b').month)
+
+    month_offset = controller_util.get_month_offset(wbr1, fiscal_start, False)
+    assert wbr1.cy_trailing_twelve_months['Date'][month_offset].strftime('%b') == first_month
+    assert controller_util.get_x_axis_label(wbr1, first_month)[7] == first_month
+    assert controller_util.get_month_offset(wbr1, fiscal_start, True) == 0
+
+
+def test_deck_index_numbers_blocks_and_pages():
+    wbr1 = build_wbr()
+    decks = [json.loads(json.dumps(controller_util.get_wbr_deck(wbr1), cls=controller_util.Encoder))]
+
+    index = controller_util.get_deck_index(decks, page_size=5)
+    blocks = index['decks'][0]['blocks']
+    assert index['decks'][0]['pages'] == 3
+    assert [block['blockNumber'] for block in blocks] == list(range(1, 13))
+
+    page = controller_util.get_deck_page(decks, 0, 2, page_size=5)
+    assert page['start'] == 10
+    assert page['blocks'] == decks[0]['blocks'][10:]
+
+    with pytest.raises(IndexError):
+        controller_util.get_deck_page(decks, 0, 3, page_size=5)
+
+
+def test_serialized_deck_matches_encoder_output():
+    deck = controller_util.get_wbr_deck(build_wbr())
+    deck.title = "<WBR> & 'weekly'"
+
+    serialized = controller_util.dumps_deck([controller_util.to_plain(deck)])
+    assert '<' not in serialized and "'" not in serialized
+    assert json.loads(serialized) == json.loads(json.dumps([deck], cls=controller_util.Encoder))
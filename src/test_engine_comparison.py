@@ -0,0 +1,51 @@
+import math
+import pathlib
+import sys
+
+import pandas as pd
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.engine_comparison as engine_comparison
+import src.wbr as wbr
+
+scenario_folder = pathlib.Path(__file__).resolve().parent / 'unit_test_case' / 'scenario_9'
+
+
+class DriftingWBR(wbr.WBR):
+    """
+    An engine whose box totals drift from the WBR by a relative 1e-9, like a faster aggregation could.
+    """
+
+    def __init__(self, cfg, daily_df=None, csv=None):
+        super().__init__(cfg, daily_df, csv)
+        self.box_totals['PageViews'] = self.box_totals['PageViews'].map(
+            lambda value: value * (1 + 1e-9) if isinstance(value, float) else value)
+
+
+def test_missing_values_and_tolerances():
+    assert engine_comparison.values_match(math.nan, 'N/A')
+    assert engine_comparison.values_match(None, pd.NaT)
+    assert not engine_comparison.values_match(0.0, 'N/A')
+    assert not engine_comparison.values_match(1.0, 1.0 + 1e-12)
+    assert engine_comparison.values_match(1.0, 1.0 + 1e-12, rel_tol=1e-9)
+    assert engine_comparison.values_match('LastWk', 'LastWk') and not engine_comparison.values_match('YOY', 'WOW')
+
+
+def test_engine_is_equivalent_to_itself():
+    result = engine_comparison.compare_engines(scenario_folder, wbr.WBR, wbr.WBR)
+
+    assert result == {'scenario': 'scenario_9', 'equivalent': True, 'discrepancies': 0, 'metrics': {}}
+
+
+def test_drift_is_reported_by_metric_unless_tolerated():
+    result = engine_comparison.compare_engines(scenario_folder, wbr.WBR, DriftingWBR)
+
+    assert not result['equivalent']
+    box_totals = result['metrics']['box_totals']
+    assert list(box_totals) == ['PageViews']
+    assert box_totals['PageViews']['cells'] == 9
+    assert box_totals['PageViews']['examples'][0]['location'] == '0 LastWk'
+    assert 0 < box_totals['PageViews']['maxAbsDiff'] < 100
+
+    assert engine_comparison.compare_engines(scenario_folder, wbr.WBR, DriftingWBR, rel_tol=1e-6)['equivalent']
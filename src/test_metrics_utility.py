@@ -0,0 +1,45 @@
+import json
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+import src.metrics_utility as metrics_util
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics_util.Histogram('test_seconds', 'Test latency.', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, route='/report')
+
+    assert histogram.render() == [
+        '# HELP test_seconds Test latency.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{route="/report",le="0.1"} 2',
+        'test_seconds_bucket{route="/report",le="1.0"} 3',
+        'test_seconds_bucket{route="/report",le="+Inf"} 4',
+        'test_seconds_count{route="/report"} 4',
+        'test_seconds_sum{route="/report"} 2.65'
+    ]
+
+
+def test_metrics_endpoint_counts_requests_and_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller, 'request_metrics', True)
+    monkeypatch.setattr(controller.publisher.backend, 'path', str(tmp_path) + '/')
+    client = controller.app.test_client()
+    published = metrics_util.http_requests.get(route='/publish-wbr-report', method='POST', status=200)
+    uploads = metrics_util.storage_duration.get(operation='upload', backend='LocalStorageBackend')[0]
+
+    decks = [{'title': 'WBR', 'weekEnding': '30 April 2022', 'blocks': []}]
+    client.post('/publish-wbr-report', data=json.dumps(decks))
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert metrics_util.http_requests.get(route='/publish-wbr-report', method='POST', status=200) == published + 1
+    assert metrics_util.storage_duration.get(operation='upload', backend='LocalStorageBackend')[0] == uploads + 1
+    assert metrics_util.stage_duration.get(stage='publish')[0] >= 1
+    lines = response.data.decode('utf-8').splitlines()
+    assert 'wbr_http_requests_in_flight{route="/metrics"} 1' in lines
+    assert any(line.startswith('wbr_cache_hit_ratio{cache="report"}') for line in lines)
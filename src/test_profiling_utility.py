@@ -0,0 +1,112 @@
+import json
+import pathlib
+import sys
+import time
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+import src.controller_utility as controller_util
+import src.dataset_generator as dataset_generator
+import src.profiling_utility as profiling_util
+
+scenario_folder = pathlib.Path(__file__).resolve().parent / 'unit_test_case' / 'scenario_1'
+
+
+def build_deck(client, query):
+    with open(scenario_folder / 'original.csv', 'rb') as csv_file, \
+            open(scenario_folder / 'config.yaml', 'rb') as config_file:
+        return client.post('/get-wbr-metrics' + query,
+                           data={'csvfile': (csv_file, 'original.csv'), 'configfile': (config_file, 'config.yaml')})
+
+
+def build_report():
+    time.sleep(0.03)
+    return sum(range(1000))
+
+
+def test_deterministic_profiler_counts_calls_and_collapses_stacks():
+    profiler = profiling_util.StackProfiler('deterministic')
+
+    assert profiler.run(lambda: [build_report() for _ in range(3)]) == [499500] * 3
+
+    name = profiling_util.get_frame_name(build_report.__code__)
+    assert name.startswith('build_report (src/test_profiling_utility.py:')
+    assert profiler.calls[name] == 3
+    lines = profiler.get_collapsed_stacks().splitlines()
+    assert any(line.startswith('<lambda> (src/test_profiling_utility.py:') and f';{name} ' in line
+               for line in lines)
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+
+def test_sampling_profiler_finds_the_slow_function():
+    profiler = profiling_util.StackProfiler('sampling', interval=0.002)
+    profiler.run(lambda: [build_report() for _ in range(3)])
+
+    name = profiling_util.get_frame_name(build_report.__code__)
+    assert sum(seconds for stack, seconds in profiler.stacks.items() if name in stack) > 0.03
+    with pytest.raises(ValueError):
+        profiling_util.StackProfiler('unknown')
+
+
+def test_report_is_profiled_for_admins_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller, 'admin_token', 'admin')
+    monkeypatch.setattr(controller.publisher.backend, 'path', str(tmp_path) + '/')
+    client = controller.app.test_client()
+
+    assert build_deck(client, '?profiler=sampling').status_code == 403
+
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'admin'
+    response = build_deck(client, '?profiler=deterministic')
+    profiler = json.loads(response.data)['profiler']
+    assert response.status_code == 200
+    assert any(function['function'].startswith('create_wbr_metrics (src/wbr.py:')
+               for function in profiler['functions'])
+
+    collapsed = client.get(response.headers['X-Profile-Url'] + '?format=collapsed')
+    assert collapsed.status_code == 200
+    assert 'get_wbr_deck (src/controller_utility.py:' in collapsed.data.decode('utf-8')
+
+
+def test_slow_report_log_keeps_the_slowest_reports():
+    slow_report_log = profiling_util.SlowReportLog(3)
+    for total_ms in [5, 40, 10, 30, 20, 40]:
+        slow_report_log.add({'totalMs': total_ms})
+
+    assert [entry['totalMs'] for entry in slow_report_log.entries()] == [40, 40, 30]
+    assert slow_report_log.recorded == 6
+    assert not profiling_util.SlowReportLog(0).add({'totalMs': 100})
+
+
+def test_config_fingerprint_counts_the_shape_of_the_config():
+    data_frame = dataset_generator.generate_data_frame(800, 4, dimension_values=2)
+    cfg = dataset_generator.generate_config(data_frame, 4, filter_metrics=2, function_depth=3, blocks=10)
+
+    fingerprint = controller_util.get_config_fingerprint(cfg)
+
+    assert fingerprint['metrics'] == {'column': 4, 'filter': 2, 'function': 3}
+    assert fingerprint['filters'] == 2
+    assert fingerprint['functionDepth'] == 3
+    assert fingerprint['functionOperations'] == {'divide': 1, 'product': 1, 'sum': 1}
+    assert fingerprint['blocks'] == {'12_MonthsTable': 1, '6_12Graph': 8, '6_WeeksTable': 1}
+    cfg['setup']['title'] = 'Another title'
+    assert controller_util.get_config_fingerprint(cfg)['hash'] == fingerprint['hash']
+
+
+def test_slow_reports_are_served_to_admins(monkeypatch):
+    monkeypatch.setattr(controller, 'admin_token', 'admin')
+    monkeypatch.setattr(controller, 'slow_report_log', profiling_util.SlowReportLog(5))
+    client = controller.app.test_client()
+    assert build_deck(client, '').status_code == 200
+
+    assert client.get('/admin/slow-reports').status_code == 403
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'admin'
+    report = json.loads(client.get('/admin/slow-reports').data)['reports'][0]
+
+    assert report['route'] == '/get-wbr-metrics'
+    assert report['dataset']['rows'] > 0
+    assert report['config']['blockCount'] == sum(report['config']['blocks'].values())
+    assert report['dominantStage'] == max(report['stages'], key=report['stages'].get)
+    assert report['memory']['estimatedBytes'] > 0 and report['memory']['peakBytes'] >= 0
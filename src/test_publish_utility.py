@@ -0,0 +1,217 @@
+import io
+import json
+import os
+import pathlib
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.publish_utility as publish_util
+import src.storage_backend as storage_backend
+
+decks = [{'title': 'WBR', 'blocks': [{'plotStyle': 'section', 'title': ''}] * 50}]
+
+
+def local_publisher(tmp_path, content_encoding):
+    publisher = publish_util.PublishWbr(None, None)
+    publisher.backend.path = str(tmp_path) + '/'
+    publisher.content_encoding = content_encoding
+    return publisher
+
+
+def test_published_report_is_stored_compressed(tmp_path):
+    publisher = local_publisher(tmp_path, 'gzip')
+    publisher.upload(decks, 'qa/report')
+
+    body, content_encoding = publisher.download_encoded('qa/report')
+    assert content_encoding == 'gzip'
+    assert (tmp_path / 'qa' / 'report.gz').exists()
+    assert len(body) < len(json.dumps(decks))
+    assert publish_util.starts_with(body, content_encoding, b'[')
+    assert publisher.download('qa/report') == decks
+
+
+def test_uncompressed_report_is_still_readable(tmp_path):
+    local_publisher(tmp_path, None).upload(decks, 'qa/report')
+
+    publisher = local_publisher(tmp_path, 'gzip')
+    assert publisher.download_encoded('qa/report')[1] is None
+    assert publisher.download('qa/report') == decks
+
+
+def test_report_cache_evicts_least_recently_used_reports():
+    cache = publish_util.ReportCache(max_bytes=10)
+    cache.put('a', b'aaaa', 'gzip')
+    cache.put('b', b'bbbb', 'gzip')
+    assert cache.get('a') == (b'aaaa', 'gzip')
+
+    cache.put('c', b'cccc', None)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats() == {'hits': 3, 'diskHits': 0, 'misses': 1, 'evictions': 1, 'reports': 2, 'bytes': 8}
+
+
+def test_downloads_are_served_from_the_cache(tmp_path):
+    publisher = local_publisher(tmp_path, 'gzip')
+    publisher.cache = publish_util.ReportCache(max_bytes=1024 * 1024, disk_path=str(tmp_path / 'cache'),
+                                               max_disk_bytes=1024 * 1024)
+    publisher.upload(decks, 'qa/report')
+    (tmp_path / 'qa' / 'report.gz').unlink()
+
+    assert publisher.download('qa/report') == decks
+    assert publisher.cache.stats()['hits'] == 1
+
+    # A new process reads the report from the on-disk tier
+    publisher.cache = publish_util.ReportCache(max_bytes=1024 * 1024, disk_path=str(tmp_path / 'cache'),
+                                               max_disk_bytes=1024 * 1024)
+    assert publisher.download('qa/report') == decks
+    assert publisher.cache.stats()['diskHits'] == 1
+
+
+def test_protected_report_metadata_checks_the_password():
+    byte_data = json.dumps(decks).encode('utf-8')
+    metadata = publish_util.create_protected_report_metadata(byte_data, 'secret')
+
+    assert 'secret' not in json.dumps(metadata)
+    assert metadata['size'] == len(byte_data)
+    assert metadata['checksum'].startswith('sha256:')
+    assert publish_util.check_password(metadata, 'secret')
+    assert not publish_util.check_password(metadata, 'Secret')
+
+
+def test_background_upload_is_served_from_the_spool_until_it_lands(tmp_path, monkeypatch):
+    monkeypatch.setenv('PUBLISH_UPLOAD_WORKERS', '2')
+    monkeypatch.setenv('PUBLISH_SPOOL_DIR', str(tmp_path / 'spool'))
+    publisher = local_publisher(tmp_path, 'gzip')
+    publisher.cache = publish_util.ReportCache(max_bytes=0)
+
+    uploaded = threading.Event()
+    attempts = []
+    upload_to_storage = publisher.upload_to_storage
+
+    def flaky_upload(byte_data, destination_file_path, content_type):
+        attempts.append(destination_file_path)
+        uploaded.wait(5)
+        if len(attempts) == 1:
+            raise ConnectionError("storage unavailable")
+        upload_to_storage(byte_data, destination_file_path, content_type)
+
+    publisher.upload_to_storage = flaky_upload
+    publisher.upload(decks, 'qa/report')
+
+    # The upload waits on the event, the report is read from the spool meanwhile
+    assert not (tmp_path / 'qa' / 'report.gz').exists()
+    assert publisher.download('qa/report') == decks
+
+    uploaded.set()
+    publisher.upload_executor.shutdown(wait=True)
+    assert len(attempts) == 2
+    assert (tmp_path / 'qa' / 'report.gz').exists()
+    assert not os.listdir(tmp_path / 'spool')
+    assert publisher.download('qa/report') == decks
+
+
+class S3StandIn:
+    """A local stand-in for the S3 client, keeping objects and multipart uploads in memory."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        self.objects[Key] = (Body, kwargs.get('ContentEncoding'))
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.uploads['upload-1'] = {'parts': {}, 'ContentEncoding': kwargs.get('ContentEncoding')}
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Body, Bucket, Key, PartNumber, UploadId):
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        assert [part['PartNumber'] for part in MultipartUpload['Parts']] == sorted(upload['parts'])
+        self.objects[Key] = (b''.join(upload['parts'][number] for number in sorted(upload['parts'])),
+                             upload['ContentEncoding'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+
+    def get_object(self, Bucket, Key):
+        body, content_encoding = self.objects[Key]
+        return {'Body': io.BytesIO(body), 'ContentEncoding': content_encoding}
+
+
+def large_decks():
+    # Random titles keep the compressed report larger than a few upload parts
+    return [{'title': 'WBR', 'blocks': [{'plotStyle': 'section', 'title': os.urandom(64).hex()}
+                                        for _ in range(100000)]}]
+
+
+def test_large_report_is_uploaded_in_parts(tmp_path):
+    publisher = local_publisher(tmp_path, 'gzip')
+    publisher.cache = publish_util.ReportCache(max_bytes=0)
+    publisher.upload_part_size = publish_util.minimum_upload_part_size
+    s3_client = S3StandIn()
+    publisher.backend = storage_backend.S3StorageBackend(None, publisher.upload_part_size, 4, 10, s3_client=s3_client)
+
+    report = large_decks()
+    publisher.upload(json.dumps(report), 'qa/report')
+
+    assert not s3_client.uploads
+    assert len(s3_client.objects['qa/report'][0]) > publisher.upload_part_size
+    assert publisher.download('qa/report') == report
+
+
+def test_large_report_is_streamed_to_a_local_file(tmp_path):
+    publisher = local_publisher(tmp_path, 'gzip')
+    publisher.upload_part_size = publish_util.minimum_upload_part_size
+
+    report = large_decks()
+    publisher.upload(report, 'qa/report')
+
+    assert publisher.download_from_storage('qa/report')[1] == 'gzip'
+    assert publisher.download('qa/report') == report
+
+
+def test_only_reports_fitting_into_the_cache_are_kept_while_uploading(tmp_path, monkeypatch):
+    monkeypatch.setenv('PUBLISH_UPLOAD_WORKERS', '1')
+    monkeypatch.setenv('PUBLISH_SPOOL_DIR', str(tmp_path / 'spool'))
+    publisher = local_publisher(tmp_path, 'gzip')
+    publisher.cache = publish_util.ReportCache(max_bytes=publish_util.minimum_upload_part_size)
+    publisher.upload_part_size = publish_util.minimum_upload_part_size
+
+    kept_parts = publish_util.KeptParts(10)
+    assert list(kept_parts.keep([b'12345', b'67890', b'1'])) == [b'12345', b'67890', b'1']
+    assert kept_parts.parts is None and kept_parts.get_bytes() is None
+
+    report = large_decks()
+    publisher.upload(report, 'qa/large')
+    publisher.upload(decks, 'qa/small')
+    publisher.upload_executor.shutdown(wait=True)
+
+    assert publisher.cache.stats()['reports'] == 1
+    assert publisher.cache.get('qa/large') is None
+    assert not os.listdir(tmp_path / 'spool')
+    assert publisher.download('qa/large') == report
+    assert publisher.download('qa/small') == decks
+
+
+def test_memory_backend_simulates_latency_per_request(monkeypatch):
+    monkeypatch.setenv('MEMORY_STORAGE_LATENCY_MS', '50')
+    publisher = publish_util.PublishWbr('memory', None)
+    publisher.cache = publish_util.ReportCache(max_bytes=0)
+
+    started = time.perf_counter()
+    publisher.upload(decks, 'qa/report')
+    assert publisher.download('qa/report') == decks
+    assert time.perf_counter() - started >= 0.1
+    assert list(publisher.backend.objects) == ['qa/report']
+
+    with pytest.raises(FileNotFoundError):
+        publisher.download('qa/missing')
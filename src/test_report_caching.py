@@ -0,0 +1,132 @@
+import json
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+
+decks = [{'title': 'WBR', 'weekEnding': '30 April 2022', 'blockStartingNumber': 1,
+          'blocks': [{'plotStyle': 'section', 'title': 'Customers'}]}]
+
+
+def publish(client, monkeypatch, tmp_path, snapshot):
+    monkeypatch.setattr(controller, 'publish_html_snapshot', snapshot)
+    monkeypatch.setattr(controller.publisher.backend, 'path', str(tmp_path) + '/')
+    response = client.post('/publish-wbr-report', data=json.dumps(decks))
+    return json.loads(response.data)['path'].split('file=')[1]
+
+
+def test_published_report_is_not_modified_for_its_etag(tmp_path, monkeypatch):
+    client = controller.app.test_client()
+    filename = publish(client, monkeypatch, tmp_path, False)
+
+    response = client.get('/build-wbr/publish?file=' + filename)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == controller.rendered_cache_control
+
+    not_modified = client.get('/build-wbr/publish?file=' + filename, headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+    assert not not_modified.data
+
+    assert client.get('/build-wbr/publish?file=00000000000', headers={'If-None-Match': etag}).status_code == 500
+    assert client.get('/build-wbr/publish?file=missing').status_code == 404
+
+
+def test_protected_report_is_not_served_by_its_storage_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller.publisher.backend, 'path', str(tmp_path) + '/')
+    client = controller.app.test_client()
+    response = client.post('/publish-protected-report?password=secret', data=json.dumps(decks))
+    filename = json.loads(response.data)['path'].split('file=')[1]
+
+    for path in ['protected/' + filename, 'protected/' + filename + '.meta.json', filename + '.meta.json',
+                 '../qa/protected/' + filename]:
+        for url in ['/build-wbr/publish/json?file=', '/build-wbr/publish/index?file=', '/build-wbr/publish/blocks?file=',
+                    '/build-wbr/publish?snapshot=false&file=', '/build-wbr/publish/protected?password=t&file=',
+                    '/login?password=secret&file=']:
+            assert client.get(url + path).status_code in (403, 404), url + path
+    for url in ['/build-wbr/publish/json?file=', '/build-wbr/publish/index?file=', '/build-wbr/publish?file=']:
+        assert client.get(url + filename).status_code in (403, 500), url + filename
+    assert client.get('/login?password=secret&file=' + filename).status_code == 302
+
+
+def test_protected_report_is_served_for_a_valid_login_token_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller.publisher.backend, 'path', str(tmp_path) + '/')
+    client = controller.app.test_client()
+    response = client.post('/publish-protected-report?password=secret', data=json.dumps(decks))
+    filename = json.loads(response.data)['path'].split('file=')[1]
+
+    login = client.get('/login?password=secret&file=' + filename)
+    token = login.headers['Location'].split('password=')[1]
+    other_report = controller.create_login_token('0123456789a')
+    expired = controller.create_login_token(filename, int(time.time()) - 1)
+    tampered = token[:-1] + ('1' if token.endswith('0') else '0')
+    for url in ['/build-wbr/publish/json?file=', '/build-wbr/publish/index?file=',
+                '/build-wbr/publish/blocks?deck=0&page=0&file=']:
+        assert client.get(f'{url}{filename}&password={token}').status_code == 200, url
+        for invalid in ['t', other_report, expired, tampered, '.' + token.split('.')[1]]:
+            assert client.get(f'{url}{filename}&password={invalid}').status_code == 403, url + invalid
+
+    assert client.get(f'/build-wbr/publish/protected?file={filename}&password={token}').status_code == 200
+    assert client.get(f'/build-wbr/publish/protected?file={filename}&password={expired}').status_code == 302
+    assert client.get('/login?password=wrong&file=' + filename).status_code == 403
+
+
+def test_snapshot_etag_depends_on_its_encoding(tmp_path, monkeypatch):
+    client = controller.app.test_client()
+    filename = publish(client, monkeypatch, tmp_path, True)
+
+    compressed = client.get('/build-wbr/publish?file=' + filename, headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/build-wbr/publish?file=' + filename)
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    not_modified = client.get('/build-wbr/publish?file=' + filename,
+                              headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['Cache-Control'] == controller.published_cache_control
+
+
+def test_demo_listing_is_reloaded_when_the_directory_changes(tmp_path, monkeypatch):
+    (tmp_path / 'b.csv').write_text('')
+    monkeypatch.setattr(controller, 'demo_uploads_folder', tmp_path)
+    monkeypatch.setattr(controller, 'demo_uploads_cache', controller.controller_util.DirectoryCache(tmp_path))
+    client = controller.app.test_client()
+
+    assert client.get('/get_file_name').get_json() == ['b.csv']
+    assert client.get('/get_file_name').get_json() == ['b.csv']
+
+    (tmp_path / 'a.csv').write_text('')
+    assert client.get('/get_file_name').get_json() == ['a.csv', 'b.csv']
+
+
+def test_sample_report_is_served_from_the_sample_folder_only(tmp_path, monkeypatch):
+    samples = tmp_path / 'sample'
+    samples.mkdir()
+    (samples / 'demo.json').write_text(json.dumps(decks))
+    (tmp_path / 'private.json').write_text(json.dumps(decks))
+    monkeypatch.setattr(controller, 'sample_folder', samples)
+    monkeypatch.setattr(controller, 'sample_cache', controller.controller_util.DirectoryCache(samples))
+    client = controller.app.test_client()
+
+    assert client.get('/build-wbr/sample?file=demo.json').status_code == 200
+    for filename in ['missing.json', '../private.json', '', '.']:
+        assert client.get('/build-wbr/sample?file=' + filename).status_code == 404, filename
+
+
+def test_published_deck_is_served_page_by_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller, 'deck_cache', controller.controller_util.DeckCache(1))
+    client = controller.app.test_client()
+    filename = publish(client, monkeypatch, tmp_path, False)
+
+    report = json.loads(client.get('/build-wbr/publish/json?file=' + filename).data)
+    index = json.loads(client.get('/build-wbr/publish/index?file=' + filename).data)
+    assert index == controller.controller_util.get_deck_index(report)
+
+    # Pages are served after the deck was evicted by viewing another report
+    client.get('/build-wbr/publish/index?file=' + publish(client, monkeypatch, tmp_path, False))
+    page = json.loads(client.get(f'/build-wbr/publish/blocks?file={filename}&deck=0&page=0').data)
+    assert page['blocks'] == report[0]['blocks'][:index['pageSize']]
@@ -0,0 +1,40 @@
+import json
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+
+scenario_folder = pathlib.Path(__file__).resolve().parent / 'unit_test_case' / 'scenario_4'
+
+
+def build_deck(client, query=''):
+    with open(scenario_folder / 'original.csv', 'rb') as csv_file, \
+            open(scenario_folder / 'config.yaml', 'rb') as config_file:
+        return client.post('/get-wbr-metrics' + query,
+                           data={'csvfile': (csv_file, 'original.csv'), 'configfile': (config_file, 'config.yaml')})
+
+
+def test_stages_are_returned_in_server_timing_header_and_profile(monkeypatch):
+    monkeypatch.setattr(controller, 'server_timing', True)
+    client = controller.app.test_client()
+
+    response = build_deck(client)
+    assert response.status_code == 200
+    metrics = [metric.split(';')[0] for metric in response.headers['Server-Timing'].split(', ')]
+    assert metrics == ['validate', 'dynamic_data_frame', 'trailing_windows', 'box_totals', 'function_metrics',
+                       'wbr_metrics', 'deck', 'serialize', 'total']
+    assert 'profile' not in json.loads(response.data)
+
+    profile = json.loads(build_deck(client, '?profile=1').data)['profile']
+    assert list(profile['stages']) == metrics[:-1]
+    assert profile['totalMs'] >= sum(stage['ms'] for stage in profile['stages'].values())
+
+
+def test_stages_are_not_recorded_when_server_timing_is_disabled(monkeypatch):
+    monkeypatch.setattr(controller, 'server_timing', False)
+    client = controller.app.test_client()
+
+    assert 'Server-Timing' not in build_deck(client).headers
+    assert 'validate;dur=' in build_deck(client, '?profile=1').headers['Server-Timing']
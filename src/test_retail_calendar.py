@@ -0,0 +1,133 @@
+import datetime
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller_utility as controller_util
+import src.wbr as wbr
+import src.wbr_utility as wbr_util
+
+SATURDAY = 5
+
+retail_config = """
+setup:
+  week_ending: 25-SEP-2021
+  week_number: 34
+  title: Retail calendar
+  fiscal_year_end_month: JAN
+metrics:
+  Orders:
+    column: orders
+    aggf: sum
+deck:
+  - block:
+      ui_type: 6_12Graph
+      title: Orders
+      metrics:
+        Orders:
+          graph_prior_year_flag: true
+  - block:
+      ui_type: 6_12Graph
+      title: Orders this fiscal year
+      x_axis_monthly_display: fiscal_year
+      metrics:
+        Orders:
+          graph_prior_year_flag: true
+"""
+
+
+def test_fiscal_year_end_anchors():
+    # The last Saturday of January 2021 is the 30th, the Saturday nearest to the 31st as well
+    assert wbr_util.get_retail_fiscal_year_end(2021, 1, SATURDAY, 'last') == datetime.date(2021, 1, 30)
+    # The last Saturday of January 2022 is the 29th, the nearest Saturday to the 31st is February 5th
+    assert wbr_util.get_retail_fiscal_year_end(2022, 1, SATURDAY, 'last') == datetime.date(2022, 1, 29)
+    assert wbr_util.get_retail_fiscal_year_end(2025, 1, SATURDAY, 'nearest') == datetime.date(2025, 2, 1)
+
+
+def test_period_table_adds_the_53rd_week_to_the_last_period():
+    period_table = wbr_util.create_retail_period_table(2021, 2022, 1, SATURDAY, [4, 4, 5], 'last')
+
+    fiscal_2021 = period_table[period_table['FiscalYear'] == 2021]
+    weeks = list(((fiscal_2021['End'] - fiscal_2021['Start']).dt.days + 1) // 7)
+    assert weeks == [4, 4, 5, 4, 4, 5, 4, 4, 5, 4, 4, 6]
+    assert list(fiscal_2021['Label'][:2]) == ['Feb', 'Mar']
+
+    fiscal_2022 = period_table[period_table['FiscalYear'] == 2022]
+    assert fiscal_2022['Start'].iloc[0] == pd.Timestamp(2021, 1, 31)
+    assert fiscal_2022['End'].iloc[-1] == pd.Timestamp(2022, 1, 29)
+    assert list(fiscal_2022['Quarter'].unique()) == [1, 2, 3, 4]
+
+
+def test_aggregate_by_period_joins_daily_rows_on_period_id():
+    period_table = wbr_util.create_retail_period_table(2022, 2022, 1, SATURDAY, [4, 4, 5], 'last')
+    dates = pd.date_range('2021-01-25', '2021-04-10')
+    daily_df = pd.DataFrame({'Date': dates, 'Orders': np.ones(len(dates))})
+
+    period_ids = wbr_util.assign_period_ids(daily_df['Date'], period_table)
+    assert period_ids[0] == -1
+    assert period_ids[-1] == 2
+
+    period_data = wbr_util.aggregate_by_period(daily_df, period_table, {'Orders': 'sum'})
+    assert list(period_data['Orders'][:2]) == [28, 28]
+    assert np.isnan(period_data['Orders'][4])
+    assert period_data['Date'][0] == pd.Timestamp(2021, 2, 27)
+
+
+@pytest.mark.parametrize('calendar', ['4-4-5', {'type': '5-4-4', 'year_end': 'nearest'}])
+def test_retail_deck_totals_and_labels_follow_the_periods(tmp_path, calendar):
+    # One order a day, so every total is the number of days it covers
+    dates = pd.date_range('2019-01-01', '2021-09-25')
+    pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'), 'orders': 1}).to_csv(tmp_path / 'original.csv', index=False)
+    cfg = yaml.load(retail_config, controller_util.SafeLineLoader)
+    cfg['setup']['calendar'] = calendar
+
+    wbr1 = wbr.WBR(cfg, csv=tmp_path / 'original.csv')
+    deck = json.loads(json.dumps(controller_util.get_wbr_deck(wbr1), cls=controller_util.Encoder))
+    trailing_chart, fiscal_year_chart = deck['blocks']
+
+    period_table = wbr1.period_table
+    period_days = (period_table['End'] - period_table['Start']).dt.days + 1
+    week_ending = pd.Timestamp(2021, 9, 25)
+    current_period_id = wbr_util.get_period_id(period_table, week_ending)
+    # The 4-4-5 period ends with the week, the 5-4-4 one does not and the trailing periods end with the one before
+    last_period_id = current_period_id if period_table.loc[current_period_id, 'End'] == week_ending \
+        else current_period_id - 1
+    trailing_ids = range(last_period_id - 11, last_period_id + 1)
+
+    # The trailing twelve periods are labelled with their months, and their values follow their weeks
+    assert trailing_chart['xAxis'][7:] == list(period_table.loc[trailing_ids, 'Label'])
+    months = trailing_chart['yAxis'][0]['metric']['current'][1]['secondaryAxis'][7:]
+    assert list(months) == list(period_days[trailing_ids])
+    previous_months = trailing_chart['yAxis'][0]['metric']['previous'][1]['secondaryAxis'][7:]
+    assert list(previous_months) == list(period_days[[period_id - 12 for period_id in trailing_ids]])
+    month_over_month = wbr1.metrics['OrdersMOM'][7:19].to_numpy()
+    assert np.allclose(month_over_month, period_days[trailing_ids].to_numpy() /
+                       period_days[[period_id - 1 for period_id in trailing_ids]].to_numpy() - 1)
+
+    # Box totals of the period, the quarter and the fiscal year to date
+    period_start, quarter_start, year_start = wbr_util.get_period_to_date_starts(period_table, week_ending)
+    expected = [(week_ending - start).days + 1 for start in (period_start, quarter_start, year_start)]
+    box_totals = trailing_chart['table']['tableBody'][0]
+    assert box_totals[0] == 7
+    assert [box_totals[3], box_totals[5], box_totals[7]] == expected
+    if calendar == '4-4-5':
+        # Fiscal 2022 started on 31 January 2021, its September period ends with the week. The January period of the
+        # 53 week fiscal 2021 has 6 weeks
+        assert expected == [28, 56, 238] and months[3] == 42
+
+    # The fiscal year display starts with the first period of the fiscal year, the periods to come are empty
+    fiscal_year = period_table[period_table['FiscalYear'] == period_table.loc[current_period_id, 'FiscalYear']]
+    assert fiscal_year_chart['xAxis'][7:] == list(fiscal_year['Label'])
+    fiscal_months = fiscal_year_chart['yAxis'][0]['metric']['current'][1]['secondaryAxis'][7:]
+    elapsed = fiscal_year.index[fiscal_year['Start'] <= week_ending]
+    days_to_date = [(min(end, week_ending) - start).days + 1 for start, end in
+                    zip(fiscal_year.loc[elapsed, 'Start'], fiscal_year.loc[elapsed, 'End'])]
+    assert list(fiscal_months[:len(elapsed)]) == days_to_date
+    assert set(fiscal_months[len(elapsed):]) == {''}
@@ -0,0 +1,65 @@
+import json
+import os
+import pathlib
+import sys
+from pathlib import Path
+
+import yaml
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+import src.controller_utility as controller_util
+import src.snapshot_utility as snapshot_util
+import src.wbr as wbr
+
+scenario_folder = Path(os.path.dirname(__file__)) / 'unit_test_case' / 'scenario_4'
+
+
+def build_decks():
+    with open(scenario_folder / 'config.yaml') as config_file:
+        cfg = yaml.load(config_file, controller_util.SafeLineLoader)
+    deck = controller_util.get_wbr_deck(wbr.WBR(cfg, csv=scenario_folder / 'original.csv'))
+    return [controller_util.to_plain(deck)]
+
+
+def test_values_are_formatted_like_the_report_page():
+    assert snapshot_util.format_label('##.1MM', 2460000, True) == '2.5M'
+    # Halves are rounded away from zero like JavaScript toFixed does
+    assert snapshot_util.format_label('', 2.5) == '3'
+    assert snapshot_util.format_label('##%', 0.125) == '13'
+    assert snapshot_util.format_cell(2500000000, '##.1') == '2.5B'
+    assert snapshot_util.format_cell(' ', '##KK') == ' '
+    assert snapshot_util.format_box_total(12.345, 2, '##.1', '%') == '12.3%'
+    assert snapshot_util.format_box_total(12.5, 1, '', 'bps') == '13bps'
+    assert snapshot_util.format_box_total('N/A', 3, '', '%') == 'N/A'
+    assert snapshot_util.get_axis_range([]) is None
+
+
+def test_snapshot_draws_every_chart_as_svg():
+    decks = build_decks()
+    decks[0]['blocks'][0]['title'] = '<Orders> & "Revenue"'
+
+    with controller.app.test_request_context():
+        html = controller.render_snapshot(decks)
+
+    assert html.count('<svg') == len(decks[0]['blocks'])
+    assert '<script' not in html
+    assert '1. &lt;Orders&gt; &amp; &quot;Revenue&quot;' in html
+
+
+def test_published_snapshot_is_served_with_cache_headers(tmp_path, monkeypatch):
+    monkeypatch.setattr(controller, 'publish_html_snapshot', True)
+    monkeypatch.setattr(controller.publisher.backend, 'path', str(tmp_path) + '/')
+    client = controller.app.test_client()
+
+    response = client.post('/publish-wbr-report', data=json.dumps(build_decks()))
+    filename = json.loads(response.data)['path'].split('file=')[1]
+
+    snapshot = client.get('/build-wbr/publish?file=' + filename, headers={'Accept-Encoding': 'gzip'})
+    assert snapshot.mimetype == 'text/html'
+    assert snapshot.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in snapshot.headers['Cache-Control']
+
+    interactive = client.get('/build-wbr/publish?file=' + filename + '&snapshot=false')
+    assert '<svg' not in interactive.get_data(as_text=True)
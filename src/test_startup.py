@@ -0,0 +1,25 @@
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+
+
+def test_startup_report_splits_start_up_time():
+    response = controller.app.test_client().get('/startup-report')
+
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['totalMs'] >= report['importsMs'] > 0
+    assert report['storageBackend'] == 'LocalStorageBackend'
+    assert 'src.system_design_agent' in report['lazyModules']
+
+
+def test_login_token_is_only_accepted_with_the_key_signing_it(monkeypatch):
+    token = controller.create_login_token('0123456789a')
+    with controller.app.test_request_context('/build-wbr/publish/json?password=' + token):
+        assert controller.is_login_token_valid('0123456789a')
+        assert not controller.is_login_token_valid('0123456789b')
+        monkeypatch.setattr(controller, 'login_token_key', b'another process')
+        assert not controller.is_login_token_valid('0123456789a')
@@ -0,0 +1,76 @@
+import json
+import pathlib
+import sys
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import src.controller as controller
+import src.benchmark as benchmark
+import src.controller_utility as controller_util
+import src.test as unit_test
+
+scenario_folder = pathlib.Path(__file__).resolve().parent / 'unit_test_case' / 'scenario_3'
+
+
+def get_benchmark(seconds, peak_bytes):
+    stages = {'deck': {'seconds': seconds, 'peakBytes': peak_bytes, 'allocatedBlocks': 0}}
+    return {'version': benchmark.baseline_version,
+            'results': [{'scenario': 'scenario_3', 'scale': 1, 'rows': 10, 'stages': stages, 'totalSeconds': seconds}]}
+
+
+def test_performance_is_compared_with_the_baseline():
+    measurement = get_benchmark(0.5, 30 * 1024 * 1024)['results'][0]
+
+    passed = unit_test.test_performance(measurement, get_benchmark(0.4, 28 * 1024 * 1024))
+    assert passed.buildTimeResult.result == 'SUCCESS'
+    assert passed.peakMemoryResult.result == 'SUCCESS'
+
+    failed = unit_test.test_performance(measurement, get_benchmark(0.2, 20 * 1024 * 1024))
+    assert failed.buildTimeResult.result == 'FAILED'
+    assert failed.peakMemoryResult.result == 'FAILED'
+    assert failed.buildTimeResult.expected == 'every stage at most 1.5x its baseline (baseline 200 ms)'
+    assert failed.buildTimeResult.failureMessage.endswith('deck 200.0 ms -> 500.0 ms (2.5x)')
+    assert failed.peakMemoryResult.failureMessage.endswith('deck 20.0 MB -> 30.0 MB (1.5x)')
+
+    assert unit_test.test_performance(measurement).buildTimeResult.result == 'SKIPPED'
+    other_scale = {**measurement, 'scale': 10}
+    assert unit_test.test_performance(other_scale, get_benchmark(0.2, 1)).peakMemoryResult.result == 'SKIPPED'
+
+
+def test_unit_test_endpoint_reports_performance_regressions(tmp_path, monkeypatch):
+    measurement = unit_test.measure_scenario(str(scenario_folder), repeat=1)
+    assert measurement['scenario'] == 'scenario_3'
+    assert measurement['totalSeconds'] > 0 and unit_test.get_peak_bytes(measurement) > 0
+
+    baseline_file = tmp_path / 'performance_baseline.json'
+    baseline_file.write_text(json.dumps(get_benchmark(0.000001, 1)))
+    monkeypatch.setattr(unit_test, 'performance_baseline_file', baseline_file)
+    monkeypatch.setattr(unit_test, 'minimum_seconds', 0)
+    # The endpoint tests scenarios in the request, without starting processes from the web server
+    monkeypatch.setattr(unit_test, 'ProcessPoolExecutor', None)
+    monkeypatch.setattr(unit_test, 'test_workers', 4)
+
+    result = json.loads(controller.app.test_client().get('/wbr-unit-test?performance=true&scenario=_3').data)
+
+    assert [scenario['scenario'] for scenario in result['scenarios']] == ['scenario_3']
+    performance = result['scenarios'][0]['testCases'][-1]
+    assert performance['blockType'] == 'Performance'
+    assert performance['buildTimeResult']['result'] == 'FAILED'
+    assert performance['peakMemoryResult']['result'] == 'FAILED'
+    assert unit_test.test_performance(measurement, None).peakMemoryResult.result == 'SKIPPED'
+
+
+def test_scenarios_tested_in_processes_are_merged_in_order(monkeypatch):
+    scenarios = [str(scenario_folder.parent / name) for name in ('scenario_3', 'scenario_2', 'scenario_8')]
+    monkeypatch.setattr(unit_test, 'get_scenario_folders', lambda: scenarios)
+    monkeypatch.setattr(unit_test, 'slow_scenario_seconds', 0)
+
+    sequential = unit_test.test_wbr(workers=1)
+    parallel = unit_test.test_wbr(workers=2)
+
+    assert [result.scenario for result in parallel.scenarios] == ['scenario_3', 'scenario_2', 'scenario_8']
+    assert json.dumps([result.testCases for result in parallel.scenarios], cls=controller_util.Encoder) == \
+        json.dumps([result.testCases for result in sequential.scenarios], cls=controller_util.Encoder)
+    assert sorted(slow['scenario'] for slow in parallel.slowScenarios) == ['scenario_2', 'scenario_3', 'scenario_8']
+    assert [result.scenario for result in unit_test.test_wbr(name_filter='_8', workers=2).scenarios] == \
+        ['scenario_8']
@@ -2,6 +2,8 @@ from datetime import datetime
 
 import pandas as pd
 
+from src.wbr_utility import retail_calendar_patterns, retail_calendar_year_end_anchors
+
 week_ending_date_format = '%d-%b-%Y'
 
 
@@ -17,6 +19,7 @@ class WBRValidator:
 
     def validate_yaml(self):
         self.check_week_ending()
+        self.check_calendar()
         self.validate_aggf()
 
     def check_week_ending(self):
@@ -36,6 +39,26 @@ class WBRValidator:
             raise ValueError(f"week_ending is in an invalid format, example of correct format: 25-SEP-2012, at line: "
                              f"{self.cfg['setup']['__line__']}")
 
+    def check_calendar(self):
+        """
+        Checks the optional retail calendar in the configuration.
+
+        Raises:
+            ValueError: If the calendar type or the year end anchor is not supported.
+        """
+        calendar_config = self.cfg['setup'].get('calendar')
+        if calendar_config is None or calendar_config == 'gregorian':
+            return
+        line = calendar_config['__line__'] if isinstance(calendar_config, dict) else self.cfg['setup']['__line__']
+        calendar_type = calendar_config.get('type') if isinstance(calendar_config, dict) else calendar_config
+        if str(calendar_type) not in retail_calendar_patterns:
+            raise ValueError(f"Invalid calendar type {calendar_type}, expected one of gregorian, "
+                             f"{', '.join(retail_calendar_patterns.keys())} at line: {line}")
+        if isinstance(calendar_config, dict) and \
+                calendar_config.get('year_end', 'last') not in retail_calendar_year_end_anchors:
+            raise ValueError(f"Invalid calendar year_end {calendar_config['year_end']}, expected one of "
+                             f"{', '.join(retail_calendar_year_end_anchors)} at line: {line}")
+
     def validate_aggf(self):
         """
         Validates the aggregate function (aggf) configuration for metrics.
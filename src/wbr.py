@@ -6,6 +6,7 @@ import numpy as np
 import pandas as pd
 from dateutil import relativedelta
 
+import src.profiling_utility as profiling_util
 import src.wbr_utility as wbr_util
 
 
@@ -96,8 +97,10 @@ class WBR:
             "difference": lambda name, column, box_total: self.box_total_diff_calculation(name, column, box_total),
             "product": lambda name, column, box_total: self.box_total_product_calculation(name, column, box_total)
         }
-        self.daily_df = daily_df if daily_df is not None else (
-            pd.read_csv(csv, parse_dates=['Date'], thousands=',').sort_values(by='Date'))
+        if daily_df is None:
+            with profiling_util.stage('csv_parse'):
+                daily_df = pd.read_csv(csv, parse_dates=['Date'], thousands=',').sort_values(by='Date')
+        self.daily_df = daily_df
         self.cfg = cfg
         self.cy_week_ending = datetime.strptime(self.cfg['setup']['week_ending'], '%d-%b-%Y')
         self.week_number = self.cfg['setup']['week_number']
@@ -108,7 +111,38 @@ class WBR:
         self.metrics_configs.__delitem__("__line__")
 
         self.metric_aggregation = dict(filter(None, list(map(build_agg, self.metrics_configs.items()))))
-        self.dyna_data_frame = wbr_util.create_dynamic_data_frame(self.daily_df, self.metrics_configs)
+        with profiling_util.stage('dynamic_data_frame'):
+            self.dyna_data_frame = wbr_util.create_dynamic_data_frame(self.daily_df, self.metrics_configs)
+
+        with profiling_util.stage('trailing_windows'):
+            self.create_trailing_windows()
+
+        self.function_bps_metrics, self.bps_metrics, self.function_percentile_metrics, self.percentile_metrics =\
+            get_bps_and_percentile_metrics(self.metrics_configs)
+
+        with profiling_util.stage('box_totals'):
+            self.box_totals, self.py_box_total, self.yoy_required_metrics_data = self.calculate_box_totals()
+            self.compute_extra_months()
+        with profiling_util.stage('function_metrics'):
+            self.compute_functional_metrics()
+        with profiling_util.stage('wbr_metrics'):
+            self.graph_axis_label = wbr_util.create_axis_label(self.cy_week_ending, self.week_number,
+                                                               len(self.cy_trailing_twelve_months['Date']),
+                                                               self.get_period_labels())
+            self.metrics = self.create_wbr_metrics()
+        # init end
+
+    def create_trailing_windows(self):
+        """
+        Aggregates the trailing six weeks and twelve months, or twelve retail periods, of the current and the previous
+        year.
+        :return: None
+        """
+        # Retail (4-4-5) calendar periods replace the calendar months when configured, None otherwise
+        self.period_table = self.create_period_table()
+        self.period_data = wbr_util.aggregate_by_period(self.dyna_data_frame, self.period_table,
+                                                        self.metric_aggregation) \
+            if self.period_table is not None else None
 
         self.cy_trailing_six_weeks = wbr_util.create_trailing_six_weeks(
             self.dyna_data_frame,
@@ -122,28 +156,27 @@ class WBR:
             self.metric_aggregation
         ).add_prefix('PY__')
 
-        self.cy_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
-            self.dyna_data_frame,
-            self.cy_week_ending,
-            self.metric_aggregation
-        )
-
-        self.py_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
-            self.dyna_data_frame,
-            self.cy_week_ending - relativedelta.relativedelta(years=1),
-            self.metric_aggregation
-        ).add_prefix('PY__')
+        if self.period_table is None:
+            self.cy_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
+                self.dyna_data_frame,
+                self.cy_week_ending,
+                self.metric_aggregation
+            )
 
-        self.function_bps_metrics, self.bps_metrics, self.function_percentile_metrics, self.percentile_metrics =\
-            get_bps_and_percentile_metrics(self.metrics_configs)
+            self.py_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
+                self.dyna_data_frame,
+                self.cy_week_ending - relativedelta.relativedelta(years=1),
+                self.metric_aggregation
+            ).add_prefix('PY__')
+        else:
+            # The same period of the prior fiscal year is always 12 periods earlier
+            self.cy_trailing_twelve_months = wbr_util.create_trailing_twelve_periods(
+                self.period_data, self.get_last_full_period_id()
+            )
 
-        self.box_totals, self.py_box_total, self.yoy_required_metrics_data = self.calculate_box_totals()
-        self.compute_extra_months()
-        self.compute_functional_metrics()
-        self.graph_axis_label = wbr_util.create_axis_label(self.cy_week_ending, self.week_number,
-                                                           len(self.cy_trailing_twelve_months['Date']))
-        self.metrics = self.create_wbr_metrics()
-        # init end
+            self.py_trailing_twelve_months = wbr_util.create_trailing_twelve_periods(
+                self.period_data, self.get_last_full_period_id() - 12
+            ).add_prefix('PY__')
 
     def create_wbr_metrics(self):
         """
@@ -297,13 +330,22 @@ class WBR:
         previous_month_date = (current_date + relativedelta.relativedelta(months=-1))
 
         # Calculate the current and previous trailing twelve months metrics
-        current_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
-            self.dyna_data_frame, current_date, self.metric_aggregation
-        )
+        if self.period_table is None:
+            current_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
+                self.dyna_data_frame, current_date, self.metric_aggregation
+            )
 
-        previous_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
-            self.dyna_data_frame, previous_month_date, self.metric_aggregation
-        )
+            previous_trailing_twelve_months = wbr_util.create_trailing_twelve_months(
+                self.dyna_data_frame, previous_month_date, self.metric_aggregation
+            )
+        else:
+            current_trailing_twelve_months = wbr_util.create_trailing_twelve_periods(
+                self.period_data, self.get_last_full_period_id()
+            )
+
+            previous_trailing_twelve_months = wbr_util.create_trailing_twelve_periods(
+                self.period_data, self.get_last_full_period_id() - 1
+            )
 
         # Process each metric based on its configuration
         for metric, metric_configs in self.metrics_configs.items():
@@ -968,6 +1010,9 @@ class WBR:
                 ((operand_1/operand_2) - 1) * 100)
 
     def compute_extra_months(self):
+        if self.period_table is not None:
+            self.aggregate_periods_to_fiscal_year_end()
+            return
         if not wbr_util.is_last_day_of_month(self.cy_week_ending):
             self.aggregate_week_ending_month()
         if self.fiscal_month.lower() != self.cy_week_ending.strftime("%b").lower():
@@ -1035,6 +1080,43 @@ class WBR:
             [self.py_trailing_twelve_months, py_future_month_aggregate_data]
         ).reset_index(drop=True)
 
+    def aggregate_periods_to_fiscal_year_end(self):
+        """
+        Appends the retail calendar periods following the last full period up to the fiscal year end.
+
+        This is the retail calendar counterpart of `aggregate_week_ending_month` and
+        `aggregate_months_to_fiscal_year_end`, the period containing the week ending date and the remaining
+        periods of the fiscal year are taken from the aggregated period data. Periods which have not started
+        yet have their 0 values replaced with NaN.
+
+        Returns:
+            None: The method updates the instance variables directly.
+        """
+        last_full_period_id = self.get_last_full_period_id()
+        current_period = self.period_table.loc[wbr_util.get_period_id(self.period_table, self.cy_week_ending)]
+        fiscal_year_end_period_id = self.period_table.index[
+            self.period_table['FiscalYear'] == current_period['FiscalYear']].max()
+
+        if fiscal_year_end_period_id <= last_full_period_id:
+            return
+
+        extra_period_ids = range(last_full_period_id + 1, fiscal_year_end_period_id + 1)
+        future_periods = self.period_table.loc[extra_period_ids, 'Start'].to_numpy() > np.datetime64(
+            self.cy_week_ending)
+
+        cy_extra_periods = self.period_data.loc[extra_period_ids].reset_index(drop=True)
+        py_extra_periods = self.period_data.loc[[i - 12 for i in extra_period_ids]].reset_index(drop=True)
+        cy_extra_periods.loc[future_periods] = cy_extra_periods.loc[future_periods].replace(0, np.nan)
+        py_extra_periods.loc[future_periods] = py_extra_periods.loc[future_periods].replace(0, np.nan)
+
+        self.cy_trailing_twelve_months = pd.concat(
+            [self.cy_trailing_twelve_months, cy_extra_periods]
+        ).reset_index(drop=True)
+
+        self.py_trailing_twelve_months = pd.concat(
+            [self.py_trailing_twelve_months, py_extra_periods.add_prefix('PY__')]
+        ).reset_index(drop=True)
+
     def aggregate_week_ending_month(self):
         """
         Aggregates daily data into monthly metrics based on the current week ending date.
@@ -1145,20 +1227,31 @@ class WBR:
 
         # Extract common dates for year-over-year comparison
         cy_last_day = pd.to_datetime(self.cy_week_ending)
-        py_last_day = pd.to_datetime(cy_last_day) - relativedelta.relativedelta(years=1)
 
-        # Calculate start dates for MTD, QTD, and YTD
-        cy_first_day_mtd = cy_last_day.replace(day=1)
-        py_first_day_mtd = py_last_day.replace(day=1)
+        if self.period_table is None:
+            py_last_day = pd.to_datetime(cy_last_day) - relativedelta.relativedelta(years=1)
+
+            # Calculate start dates for MTD, QTD, and YTD
+            cy_first_day_mtd = cy_last_day.replace(day=1)
+            py_first_day_mtd = py_last_day.replace(day=1)
+
+            try:
+                cy_first_day_qtd = cy_last_day.to_period('Q-' + self.fiscal_month).to_timestamp()
+                py_first_day_qtd = py_last_day.to_period('Q-' + self.fiscal_month).to_timestamp()
+                cy_first_day_ytd = cy_last_day.to_period('Y-' + self.fiscal_month).to_timestamp()
+                py_first_day_ytd = py_last_day.to_period('Y-' + self.fiscal_month).to_timestamp()
+            except ValueError:
+                raise ValueError(f"fiscal_year_end_month' value is in incorrect format from setup section "
+                                 f"at line: {self.cfg['setup']['__line__']}")
+        else:
+            # Retail calendars compare against the same day of the same period in the prior fiscal year
+            py_last_day = wbr_util.get_prior_year_day(self.period_table, cy_last_day)
 
-        try:
-            cy_first_day_qtd = cy_last_day.to_period('Q-' + self.fiscal_month).to_timestamp()
-            py_first_day_qtd = py_last_day.to_period('Q-' + self.fiscal_month).to_timestamp()
-            cy_first_day_ytd = cy_last_day.to_period('Y-' + self.fiscal_month).to_timestamp()
-            py_first_day_ytd = py_last_day.to_period('Y-' + self.fiscal_month).to_timestamp()
-        except ValueError:
-            raise ValueError(f"fiscal_year_end_month' value is in incorrect format from setup section "
-                             f"at line: {self.cfg['setup']['__line__']}")
+            # Period, quarter and fiscal year starts come from the period table
+            cy_first_day_mtd, cy_first_day_qtd, cy_first_day_ytd = wbr_util.get_period_to_date_starts(
+                self.period_table, cy_last_day)
+            py_first_day_mtd, py_first_day_qtd, py_first_day_ytd = wbr_util.get_period_to_date_starts(
+                self.period_table, py_last_day)
 
         # Loop through different time periods (MTD, QTD, YTD)
         for period, period_range in [
@@ -1170,11 +1263,18 @@ class WBR:
             cy_data = self.dyna_data_frame.query(f'Date >= @{period_range[0][0]} and Date <= @{period_range[0][1]}')
             py_data = self.dyna_data_frame.query(f'Date >= @{period_range[1][0]} and Date <= @{period_range[1][1]}')
 
-            # Resample data annually based on fiscal month and calculate aggregated metric
-            cy_total = cy_data.resample('YE-' + self.fiscal_month, label='right', closed='right', on='Date').agg(
-                self.metric_aggregation).reset_index().sort_values(by='Date')
-            py_total = py_data.resample('YE-' + self.fiscal_month, label='right', closed='right', on='Date').agg(
-                self.metric_aggregation).reset_index().sort_values(by='Date')
+            if self.period_table is None:
+                # Resample data annually based on fiscal month and calculate aggregated metric
+                cy_total = cy_data.resample('YE-' + self.fiscal_month, label='right', closed='right',
+                                            on='Date').agg(self.metric_aggregation).reset_index().sort_values(
+                    by='Date')
+                py_total = py_data.resample('YE-' + self.fiscal_month, label='right', closed='right',
+                                            on='Date').agg(self.metric_aggregation).reset_index().sort_values(
+                    by='Date')
+            else:
+                # Retail periods do not line up with calendar years, aggregate the whole range at once
+                cy_total = wbr_util.aggregate_date_range(cy_data, cy_last_day, self.metric_aggregation)
+                py_total = wbr_util.aggregate_date_range(py_data, py_last_day, self.metric_aggregation)
 
             # If the resulting dataframe is empty, create a new row
             if cy_total.empty:
@@ -1292,6 +1392,52 @@ class WBR:
         # Set the calculated box_totals and py_box_totals to class attributes
         return box_totals, py_box_totals, yoy_required_metrics_data
 
+    def create_period_table(self):
+        """
+        Creates the retail calendar period table if a `calendar` is configured in the setup section.
+
+        The calendar can be given as a pattern only (`calendar: 4-4-5`) or as a mapping with the keys `type`
+        (4-4-5, 4-5-4 or 5-4-4) and `year_end` (`last` or `nearest`, default `last`). The fiscal year ends on the
+        weekday of the week ending date in `fiscal_year_end_month`. The table covers the data from one fiscal year
+        before the first date up to two fiscal years after the week ending date.
+
+        Returns:
+            pd.DataFrame: The period table, or None when the WBR is built on calendar months.
+        """
+        calendar_config = self.cfg['setup'].get('calendar')
+        if calendar_config is None or calendar_config == 'gregorian':
+            return None
+        if not isinstance(calendar_config, dict):
+            calendar_config = {'type': calendar_config}
+
+        first_year = min(self.dyna_data_frame['Date'].min().year, self.cy_week_ending.year - 2) - 1
+        return wbr_util.create_retail_period_table(
+            first_year,
+            self.cy_week_ending.year + 2,
+            datetime.strptime(self.fiscal_month, "%b").month,
+            self.cy_week_ending.weekday(),
+            wbr_util.retail_calendar_patterns[str(calendar_config['type'])],
+            calendar_config.get('year_end', 'last')
+        )
+
+    def get_last_full_period_id(self):
+        """
+        Returns the id of the last retail calendar period which is complete on the week ending date.
+        """
+        period_id = wbr_util.get_period_id(self.period_table, self.cy_week_ending)
+        return period_id if self.period_table.loc[period_id, 'End'] == pd.Timestamp(self.cy_week_ending) \
+            else period_id - 1
+
+    def get_period_labels(self):
+        """
+        Returns the axis labels of the trailing retail calendar periods, None when built on calendar months.
+        """
+        if self.period_table is None:
+            return None
+        first_period_id = self.get_last_full_period_id() - 11
+        return list(self.period_table.loc[first_period_id:first_period_id + len(self.cy_trailing_twelve_months) - 1,
+                                          'Label'])
+
     def get_start_year(self):
         if self.fiscal_month == 'DEC':
             return self.cy_week_ending.year + 1
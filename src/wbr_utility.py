@@ -313,7 +313,7 @@ def create_trailing_twelve_months(df, week_ending, aggf):
     return trailing_twelve_months_monthly
 
 
-def create_axis_label(week_ending, week_number, number_of_months):
+def create_axis_label(week_ending, week_number, number_of_months, period_labels=None):
     """
     Create x-axis labels for a chart that includes week numbers and month abbreviations.
 
@@ -324,6 +324,8 @@ def create_axis_label(week_ending, week_number, number_of_months):
         week_ending (datetime.datetime): The date that marks the end of the week.
         week_number (int): The current week number of the year (1-52).
         number_of_months (int): The number of months to include in the label.
+        period_labels (list): Labels of the retail calendar periods, used instead of the calendar months when
+                              the WBR is built on a retail calendar.
 
     Returns:
         list: A list of labels for the x-axis.
@@ -337,6 +339,11 @@ def create_axis_label(week_ending, week_number, number_of_months):
     # Append an empty space to separate weeks and months on the chart
     axis_label.append(" ")
 
+    # Retail calendar periods come with their own labels
+    if period_labels is not None:
+        axis_label.extend(period_labels[:number_of_months])
+        return axis_label
+
     # Determine the last full month based on the week ending date
     if is_last_day_of_month(week_ending):
         # it's the last day of the month, so the last full month is current month
@@ -356,6 +363,220 @@ def create_axis_label(week_ending, week_number, number_of_months):
     return axis_label
 
 
+retail_calendar_patterns = {'4-4-5': [4, 4, 5], '4-5-4': [4, 5, 4], '5-4-4': [5, 4, 4]}
+
+retail_calendar_year_end_anchors = ['last', 'nearest']
+
+
+def get_retail_fiscal_year_end(year, fiscal_year_end_month, week_end_day, anchor):
+    """
+    Determine the last day of a 52-53 week retail fiscal year.
+
+    The fiscal year always ends on the week end day. With the 'last' anchor it is the last such weekday of the
+    fiscal year end month, with the 'nearest' anchor it is the one closest to the last calendar day of that month
+    (which may fall in the first days of the following month).
+
+    Args:
+        year (int): The calendar year in which the fiscal year ends.
+        fiscal_year_end_month (int): The month in which the fiscal year ends (1 = January, 12 = December).
+        week_end_day (int): The weekday on which every week ends (0 = Monday, 6 = Sunday).
+        anchor (str): Either 'last' or 'nearest'.
+
+    Returns:
+        datetime.date: The last day of the fiscal year.
+    """
+    _, days_in_month = calendar.monthrange(year, fiscal_year_end_month)
+    month_end = datetime.date(year, fiscal_year_end_month, days_in_month)
+
+    if anchor == 'last':
+        return month_end - datetime.timedelta(days=(month_end.weekday() - week_end_day) % 7)
+
+    days_forward = (week_end_day - month_end.weekday()) % 7
+    return month_end + datetime.timedelta(days=days_forward) if days_forward <= 3 \
+        else month_end - datetime.timedelta(days=7 - days_forward)
+
+
+def create_retail_period_table(first_year, last_year, fiscal_year_end_month, week_end_day, pattern, anchor):
+    """
+    Create the period table of a 4-4-5 style retail calendar.
+
+    Every fiscal year is split into four quarters of three periods, the number of weeks of each period in a
+    quarter is given by the pattern. In a 53-week year the extra week is added to the last period of the year.
+    Periods are labelled with the abbreviation of the calendar month they stand in for, so the first period is
+    labelled with the month following the fiscal year end month.
+
+    Args:
+        first_year (int): The first fiscal year (named by the calendar year it ends in) to include.
+        last_year (int): The last fiscal year to include.
+        fiscal_year_end_month (int): The month in which the fiscal year ends (1 = January, 12 = December).
+        week_end_day (int): The weekday on which every week ends (0 = Monday, 6 = Sunday).
+        pattern (list): Number of weeks of each period in a quarter, e.g. [4, 4, 5].
+        anchor (str): Either 'last' or 'nearest', see `get_retail_fiscal_year_end`.
+
+    Returns:
+        pd.DataFrame: One row per period, indexed by a consecutive period id, with the columns
+        Start, End, FiscalYear, Quarter, Period and Label.
+    """
+    rows = []
+    for year in range(first_year, last_year + 1):
+        start = get_retail_fiscal_year_end(year - 1, fiscal_year_end_month, week_end_day, anchor) \
+            + datetime.timedelta(days=1)
+        end = get_retail_fiscal_year_end(year, fiscal_year_end_month, week_end_day, anchor)
+
+        weeks = list(pattern) * 4
+        weeks[-1] += ((end - start).days + 1) // 7 - 52
+
+        period_start = start
+        for period, number_of_weeks in enumerate(weeks, start=1):
+            period_end = period_start + datetime.timedelta(weeks=number_of_weeks) - datetime.timedelta(days=1)
+            rows.append({
+                'Start': pd.Timestamp(period_start),
+                'End': pd.Timestamp(period_end),
+                'FiscalYear': year,
+                'Quarter': (period - 1) // 3 + 1,
+                'Period': period,
+                'Label': calendar.month_abbr[(fiscal_year_end_month + period - 1) % 12 + 1]
+            })
+            period_start = period_end + datetime.timedelta(days=1)
+
+    return pd.DataFrame(rows)
+
+
+def assign_period_ids(dates, period_table):
+    """
+    Map every date to the id of the period it falls in, dates outside the period table are mapped to -1.
+
+    Args:
+        dates (pd.Series): The dates to map.
+        period_table (pd.DataFrame): The period table created by `create_retail_period_table`.
+
+    Returns:
+        np.ndarray: The period id of every date.
+    """
+    starts = period_table['Start'].to_numpy()
+    ends = period_table['End'].to_numpy()
+    date_values = pd.to_datetime(dates).to_numpy()
+
+    period_ids = np.searchsorted(ends, date_values, side='left')
+    within_table = period_ids < len(ends)
+    period_ids = np.minimum(period_ids, len(ends) - 1)
+    within_table &= date_values >= starts[period_ids]
+
+    return np.where(within_table, period_ids, -1)
+
+
+def get_period_id(period_table, day):
+    """
+    Return the id of the period the given day falls in.
+
+    Raises:
+        ValueError: If the day is not covered by the period table.
+    """
+    period_id = int(assign_period_ids(pd.Series([pd.Timestamp(day)]), period_table)[0])
+    if period_id < 0:
+        raise ValueError(f"{day} is not covered by the fiscal calendar")
+    return period_id
+
+
+def aggregate_by_period(df, period_table, aggf):
+    """
+    Aggregate daily data into the periods of the period table.
+
+    The period id of every daily row is looked up with a single vectorized join against the period table,
+    afterward the rows are grouped by that id. Periods without any data are kept as empty (NaN) rows.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing daily metrics data with a 'Date' column.
+        period_table (pd.DataFrame): The period table created by `create_retail_period_table`.
+        aggf (dict): Dictionary of aggregation functions to apply to each column.
+
+    Returns:
+        pd.DataFrame: One row per period indexed by period id, the 'Date' column holds the last day of the period.
+    """
+    period_ids = assign_period_ids(df['Date'], period_table)
+    within_table = period_ids >= 0
+
+    period_data = (
+        df.loc[within_table]
+        .drop(columns='Date')
+        .groupby(period_ids[within_table])
+        .agg(aggf)
+        .reindex(period_table.index)
+    )
+    period_data.insert(0, 'Date', period_table['End'])
+
+    return period_data
+
+
+def create_trailing_twelve_periods(period_data, last_period_id):
+    """
+    Select the twelve periods ending with the given period from the aggregated period data.
+
+    Args:
+        period_data (pd.DataFrame): Aggregated period data created by `aggregate_by_period`.
+        last_period_id (int): The id of the last period to include.
+
+    Returns:
+        pd.DataFrame: DataFrame containing the metrics for the twelve periods.
+    """
+    return period_data.loc[last_period_id - 11:last_period_id].reset_index(drop=True)
+
+
+def get_prior_year_day(period_table, day):
+    """
+    Return the day at the same position within the same period of the prior fiscal year.
+
+    The prior year period is always 12 periods earlier, if it is shorter (53-week years) the result is
+    clipped to its last day.
+    """
+    period_id = get_period_id(period_table, day)
+    prior_year_period = period_table.loc[period_id - 12]
+    prior_year_day = prior_year_period['Start'] + (pd.Timestamp(day) - period_table.loc[period_id, 'Start'])
+    return min(prior_year_day, prior_year_period['End'])
+
+
+def get_period_to_date_starts(period_table, day):
+    """
+    Return the first day of the period, the quarter and the fiscal year the given day falls in.
+
+    Returns:
+        tuple: Start of the period (MTD), start of the quarter (QTD) and start of the fiscal year (YTD).
+    """
+    period = period_table.loc[get_period_id(period_table, day)]
+    fiscal_year = period_table[period_table['FiscalYear'] == period['FiscalYear']]
+    quarter = fiscal_year[fiscal_year['Quarter'] == period['Quarter']]
+    return period['Start'], quarter['Start'].min(), fiscal_year['Start'].min()
+
+
+def get_first_period_end(period_table, day):
+    """
+    Return the last day of the first period of the fiscal year the given day falls in.
+    """
+    period = period_table.loc[get_period_id(period_table, day)]
+    fiscal_year = period_table[period_table['FiscalYear'] == period['FiscalYear']]
+    return fiscal_year['End'].min()
+
+
+def aggregate_date_range(df, end_date, aggf):
+    """
+    Aggregate all rows of the daily DataFrame into a single row dated with the given end date.
+
+    Args:
+        df (pd.DataFrame): The already filtered daily data with a 'Date' column.
+        end_date (datetime.datetime): The date to label the aggregated row with.
+        aggf (dict): Dictionary of aggregation functions to apply to each column.
+
+    Returns:
+        pd.DataFrame: A single row DataFrame, or an empty DataFrame with the same columns if df is empty.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=['Date'] + list(aggf.keys()))
+
+    total = df.drop(columns='Date').groupby(np.zeros(len(df), dtype=int)).agg(aggf).reset_index(drop=True)
+    total.insert(0, 'Date', pd.Timestamp(end_date))
+    return total
+
+
 def handle_function_metrics_for_extra_attribute(metric_name, metric_config, current_trailing_df, previous_trailing_df):
     """
     Perform calculations on specified metrics in the current and previous trailing dataframes.
@@ -1,6 +1,7 @@
 var totalTests;
 var totalPassed;
 var totalFailed;
+var totalSkipped;
 var unit_test_result;
 
 const testInput = document.getElementById('execute-tests');
@@ -19,7 +20,8 @@ async function fetchText() {
         method: 'GET',
         redirect: 'follow'
     };
-    var response = await fetch("/wbr-unit-test", requestOptions);
+    var performance = document.getElementById('check-performance').checked;
+    var response = await fetch("/wbr-unit-test" + (performance ? "?performance=true" : ""), requestOptions);
     if (response.status === 200) {
         document.getElementById("page_loader_div").remove();
         var textArea = document.getElementById("test_result");
@@ -27,6 +29,7 @@ async function fetchText() {
         totalTests = 0;
         totalPassed = 0;
         totalFailed = 0;
+        totalSkipped = 0;
         unit_test_result = "Result of the Test\n\n";
         unit_test_result += "---------------------------------------\n";
         data.scenarios.forEach(function(scenario) {
@@ -35,6 +38,15 @@ async function fetchText() {
         unit_test_result += "\nTotal Test cases: " + totalTests;
         unit_test_result += "\nTotal Failed: " + totalFailed;
         unit_test_result += "\nTotal Passed: " + totalPassed;
+        if (totalSkipped > 0) {
+            unit_test_result += "\nTotal Skipped: " + totalSkipped;
+        }
+        if (data.slowScenarios.length > 0) {
+            unit_test_result += "\n\nSlow scenarios:";
+            data.slowScenarios.forEach(function(slowScenario) {
+                unit_test_result += "\n" + slowScenario.scenario + ": " + slowScenario.seconds + " s";
+            });
+        }
         document.getElementById('test_result').value = unit_test_result;
     }
     else {
@@ -48,6 +60,7 @@ function build_scenario(scenario) {
     unit_test_result += "SCENARIO: " + scenario.scenario + "\n";
     unit_test_result += "Fiscal Month: " + scenario.fiscalMonth + "\n";
     unit_test_result += "Week Ending: " + scenario.weekEnding + "\n";
+    unit_test_result += "Tested in: " + scenario.seconds + " s\n";
     unit_test_result += scenario.scenario + " test result -->\n\n"
     scenario.testCases.forEach(function(test) {
         each_scenario(test);
@@ -58,6 +71,20 @@ function build_scenario(scenario) {
 function each_scenario(test) {
     unit_test_result += "Test: " + test.testNumber + "\n";
     let testFailCount = 0;
+    if (test.blockType == "Performance") {
+        // Checks without a baseline did not run, they are counted apart from the passed ones
+        var performanceResult = performanceTest(test);
+        if (performanceResult == "FAILED") {
+            totalFailed += 1;
+        } else if (performanceResult == "SKIPPED") {
+            totalSkipped += 1;
+        } else {
+            totalPassed += 1;
+        }
+        totalTests += 1;
+        unit_test_result += "\n";
+        return;
+    }
     unit_test_result += "CY Data Frame length test result " + test.cyDataframeLength.result + "\n";
     if (test.cyDataframeLength.result == "FAILED") {
         unit_test_result += "\nExpected: " + test.cyDataframeLength.expected + "\n";
@@ -150,3 +177,20 @@ function trailingTable(test) {
     }
 }
 
+function performanceTest(test) {
+    let performanceResult = "SUCCESS";
+    [["Build time", test.buildTimeResult], ["Peak memory", test.peakMemoryResult]].forEach(function([name, result]) {
+        unit_test_result += name + " test result: " + result.result + " (" + result.calculated + ")\n";
+        if (result.result == "FAILED") {
+            unit_test_result += "\nExpected: " + result.expected + "\n";
+            unit_test_result += "Calculated: " + result.calculated + "\n\n";
+            performanceResult = "FAILED";
+        } else if (result.result == "SKIPPED") {
+            unit_test_result += result.failureMessage + "\n";
+            if (performanceResult != "FAILED") {
+                performanceResult = "SKIPPED";
+            }
+        }
+    });
+    return performanceResult;
+}